@@ -1,8 +1,10 @@
 from django.contrib import admin
-from .models import Recipe, Ingredient, Step, GroceryListItem
+from .models import Recipe, Ingredient, Step, GroceryListItem, GenerationJob, AICall
 
 # Register your models here.
 admin.site.register(Recipe)
 admin.site.register(Ingredient)
 admin.site.register(GroceryListItem)
-admin.site.register(Step)
\ No newline at end of file
+admin.site.register(Step)
+admin.site.register(GenerationJob)
+admin.site.register(AICall)
\ No newline at end of file
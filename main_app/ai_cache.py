@@ -0,0 +1,90 @@
+"""
+Cache of generated recipes, in front of the OpenAI call in generate_recipe.
+
+Requests are keyed by a canonical form of everything that shapes the
+completion: the prompt (casefolded, whitespace collapsed), the sorted tags,
+the sorted checked grocery items, the model, the temperature and the system
+prompt. Entries live in the AI_CACHE_ALIAS cache, which bounds them with its
+TIMEOUT and evicts least recently used entries beyond MAX_ENTRIES.
+
+By default an entry holds one recipe, served to every repeat of the request.
+Setting AI_CACHE_VARIANTS above 1 opts into rotation: until that many
+different recipes have been generated requests miss and add theirs, after
+which one of the stored variants is served at random so repeated prompts
+don't always get the same answer.
+"""
+import hashlib
+import json
+import random
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import normalize_name
+from .response_cache import increment_counter
+
+HITS_KEY = "ai-cache:hits"
+MISSES_KEY = "ai-cache:misses"
+BYPASSES_KEY = "ai-cache:bypasses"
+
+
+def _cache():
+    return caches[settings.AI_CACHE_ALIAS]
+
+
+def generation_cache_key(prompt, tags, grocery_items, model, temperature, instructions):
+    canonical = json.dumps(
+        {
+            "prompt": normalize_name(prompt),
+            "tags": sorted({str(tag) for tag in tags}),
+            "grocery_items": sorted({normalize_name(item) for item in grocery_items}),
+            "model": model,
+            "temperature": temperature,
+            "instructions": hashlib.sha256(instructions.encode()).hexdigest(),
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return "ai-recipe:" + hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def get_cached_recipe(key):
+    """
+    Return a cached recipe for ``key`` once all of its variants exist, or
+    None (counted as a miss) while more variants should be generated.
+    """
+    if not settings.AI_CACHE_ENABLED:
+        return None
+    variants = _cache().get(key) or []
+    if variants and len(variants) >= settings.AI_CACHE_VARIANTS:
+        increment_counter(_cache(), HITS_KEY)
+        return random.choice(variants)
+    increment_counter(_cache(), MISSES_KEY)
+    return None
+
+
+def record_bypass():
+    increment_counter(_cache(), BYPASSES_KEY)
+
+
+def store_recipe(key, recipe):
+    """Add ``recipe`` as a variant for ``key``, replacing the oldest when full."""
+    if not settings.AI_CACHE_ENABLED or settings.AI_CACHE_VARIANTS <= 0:
+        return
+    variants = _cache().get(key) or []
+    variants.append(recipe)
+    _cache().set(key, variants[-settings.AI_CACHE_VARIANTS:])
+
+
+def ai_cache_stats():
+    """Hit/miss/bypass counters for the generated recipe cache."""
+    counts = _cache().get_many([HITS_KEY, MISSES_KEY, BYPASSES_KEY])
+    hits = counts.get(HITS_KEY, 0)
+    misses = counts.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "bypasses": counts.get(BYPASSES_KEY, 0),
+        "hit_rate": hits / total if total else 0.0,
+    }
@@ -0,0 +1,188 @@
+"""
+Token and latency accounting for recipe generation.
+
+Each generation request (a completion, a stream, each prompt of a batch, a
+background job, or a request answered by the AI cache or a saved recipe)
+appends one AICall row. The row holds the token counts the backend reports,
+the wall time split into queueing for an LLM slot, the network call and
+parsing, and the cache outcome. ``system_tokens`` estimates how much of the
+prompt went on the system instructions, by their share of the prompt's
+characters.
+
+The rollups below aggregate the rows in the database for the admin-only
+/ai-usage/ endpoint.
+"""
+from contextlib import contextmanager
+import logging
+import time
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import Avg, Count, F, Max, Q, Sum
+from django.db.models.functions import TruncDate
+
+from .models import AICall
+
+logger = logging.getLogger(__name__)
+
+
+class CallStats:
+    """
+    Accounting for one generation request, filled in as it runs and written
+    with ``save()``. ``usage`` is handed to the LLM backend, which fills in
+    the token counts.
+    """
+
+    def __init__(
+        self,
+        user_id=None,
+        mode=AICall.Mode.COMPLETE,
+        cache_status=AICall.CacheStatus.MISS,
+        prompt="",
+        variants=1,
+    ):
+        self.started = time.perf_counter()
+        self.user_id = user_id
+        self.mode = mode
+        self.cache_status = cache_status
+        self.prompt = str(prompt or "")
+        self.variants = variants
+        self.outcome = AICall.Outcome.OK
+        self.model = ""
+        self.usage = {}
+        self.seconds = {"queue": 0.0, "network": 0.0, "parse": 0.0}
+        self.system_share = 0.0
+
+    @contextmanager
+    def timed(self, part):
+        """Add the time spent in the block to ``part`` (queue, network or parse)."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[part] += time.perf_counter() - started
+
+    def set_messages(self, messages, model):
+        """Note the model and how much of the prompt is system instructions."""
+        self.model = model
+        system = sum(
+            len(message["content"]) for message in messages if message["role"] == "system"
+        )
+        total = sum(len(message["content"]) for message in messages)
+        self.system_share = system / total if total else 0.0
+
+    def save(self):
+        if not settings.AI_USAGE_ENABLED:
+            return
+        prompt_tokens = int(self.usage.get("prompt_tokens") or 0)
+        try:
+            AICall.objects.create(
+                user_id=self.user_id,
+                mode=self.mode,
+                cache_status=self.cache_status,
+                outcome=self.outcome,
+                backend=settings.LLM_BACKEND.rsplit(".", 1)[-1][:30],
+                model=self.model[:50],
+                prompt=self.prompt[:200],
+                variants=self.variants,
+                prompt_tokens=prompt_tokens,
+                completion_tokens=int(self.usage.get("completion_tokens") or 0),
+                cached_tokens=int(self.usage.get("cached_tokens") or 0),
+                system_tokens=round(prompt_tokens * self.system_share),
+                queue_ms=round(self.seconds["queue"] * 1000),
+                network_ms=round(self.seconds["network"] * 1000),
+                parse_ms=round(self.seconds["parse"] * 1000),
+                total_ms=round((time.perf_counter() - self.started) * 1000),
+            )
+        except DatabaseError:
+            # Accounting must never fail the generation it describes
+            logger.exception("Could not record AI call")
+
+
+def record_cached_call(user_id, mode, cache_status, prompt=""):
+    """Record a request answered without calling the LLM."""
+    CallStats(user_id, mode, cache_status, prompt).save()
+
+
+def _totals(queryset):
+    llm = Q(cache_status__in=(AICall.CacheStatus.MISS, AICall.CacheStatus.BYPASS))
+    return queryset.aggregate(
+        calls=Count("id"),
+        llm_calls=Count("id", filter=llm),
+        cache_hits=Count("id", filter=Q(cache_status=AICall.CacheStatus.HIT)),
+        matches=Count("id", filter=Q(cache_status=AICall.CacheStatus.MATCH)),
+        failures=Count("id", filter=~Q(outcome=AICall.Outcome.OK)),
+        prompt_tokens=Sum("prompt_tokens", default=0),
+        completion_tokens=Sum("completion_tokens", default=0),
+        cached_tokens=Sum("cached_tokens", default=0),
+        system_tokens=Sum("system_tokens", default=0),
+        avg_queue_ms=Avg("queue_ms", filter=llm),
+        avg_network_ms=Avg("network_ms", filter=llm),
+        avg_parse_ms=Avg("parse_ms", filter=llm),
+        avg_total_ms=Avg("total_ms"),
+        max_total_ms=Max("total_ms"),
+    )
+
+
+def usage_summary(queryset):
+    """Totals and averages over ``queryset``, including the system prompt's cost."""
+    totals = _totals(queryset)
+    llm_calls = totals["llm_calls"]
+    totals["avg_prompt_tokens"] = totals["prompt_tokens"] / llm_calls if llm_calls else 0.0
+    totals["avg_completion_tokens"] = (
+        totals["completion_tokens"] / llm_calls if llm_calls else 0.0
+    )
+    totals["avg_system_tokens"] = totals["system_tokens"] / llm_calls if llm_calls else 0.0
+    totals["system_token_share"] = (
+        totals["system_tokens"] / totals["prompt_tokens"] if totals["prompt_tokens"] else 0.0
+    )
+    return totals
+
+
+def usage_by_user(queryset, limit=20):
+    """The ``limit`` users who used the most tokens, with their totals."""
+    return list(
+        queryset.values("user_id", username=F("user__username"))
+        .annotate(
+            calls=Count("id"),
+            prompt_tokens=Sum("prompt_tokens", default=0),
+            completion_tokens=Sum("completion_tokens", default=0),
+            avg_total_ms=Avg("total_ms"),
+        )
+        .annotate(total_tokens=F("prompt_tokens") + F("completion_tokens"))
+        .order_by("-total_tokens", "user_id")[:limit]
+    )
+
+
+def usage_by_day(queryset):
+    return list(
+        queryset.annotate(day=TruncDate("created_at"))
+        .values("day")
+        .annotate(
+            calls=Count("id"),
+            prompt_tokens=Sum("prompt_tokens", default=0),
+            completion_tokens=Sum("completion_tokens", default=0),
+            avg_total_ms=Avg("total_ms"),
+        )
+        .order_by("day")
+    )
+
+
+def costliest_calls(queryset, limit=10):
+    """The ``limit`` calls that used the most tokens, to find expensive prompts."""
+    return list(
+        queryset.annotate(total_tokens=F("prompt_tokens") + F("completion_tokens"))
+        .order_by("-total_tokens", "-id")
+        .values(
+            "id",
+            "created_at",
+            "user_id",
+            "mode",
+            "prompt",
+            "variants",
+            "prompt_tokens",
+            "completion_tokens",
+            "total_tokens",
+            "total_ms",
+        )[:limit]
+    )
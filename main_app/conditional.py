@@ -0,0 +1,71 @@
+"""
+Conditional GET support (ETag / Last-Modified) for collection endpoints.
+
+Validators are derived from the per-user CollectionVersion counters, so an
+unchanged collection answers 304 Not Modified after a single-row lookup,
+before the list query or serializer ever runs.
+"""
+import datetime
+import hashlib
+import time
+
+from django.conf import settings
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+
+from .models import CollectionVersion
+
+
+def collection_version(request):
+    # Both validator callables need the row; load it once per request
+    if not hasattr(request, "_collection_version"):
+        request._collection_version = CollectionVersion.for_user(request.user.id)
+    return request._collection_version
+
+
+def _signed_url_window():
+    """
+    Recipe payloads embed presigned image URLs, so validators roll over every
+    SIGNED_URL_CACHE_SAFETY_MARGIN seconds. A client can therefore never keep
+    a URL past its signature by revalidating.
+    """
+    if not getattr(settings, "AWS_QUERYSTRING_AUTH", False):
+        return None
+    margin = settings.SIGNED_URL_CACHE_SAFETY_MARGIN
+    if margin <= 0:
+        return None
+    return int(time.time() // margin) * margin
+
+
+def _collection_condition(collection, expiring_urls=False):
+    def etag_func(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return None
+        version = getattr(collection_version(request), collection)
+        window = _signed_url_window() if expiring_urls else None
+        # The representation also depends on the query string (fieldsets, cursors)
+        raw = f"{request.user.id}:{collection}:{version}:{window}:{request.get_full_path()}"
+        return '"%s"' % hashlib.sha1(raw.encode()).hexdigest()
+
+    def last_modified_func(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return None
+        modified = getattr(collection_version(request), f"{collection}_modified")
+        window = _signed_url_window() if expiring_urls else None
+        if window is not None:
+            window_start = datetime.datetime.fromtimestamp(
+                window, tz=datetime.timezone.utc
+            )
+            modified = max(modified, window_start)
+        return modified
+
+    return method_decorator(
+        condition(etag_func=etag_func, last_modified_func=last_modified_func),
+        name="get",
+    )
+
+
+recipes_condition = _collection_condition(
+    CollectionVersion.RECIPES, expiring_urls=True
+)
+grocery_list_condition = _collection_condition(CollectionVersion.GROCERY_LIST)
@@ -0,0 +1,215 @@
+"""
+Unit conversion for grocery list quantities.
+
+Every conversion factor between two units of the same measurement type is
+computed once at import time from the exact decimal unit definitions below,
+so converting a quantity is a table lookup and a couple of float operations
+instead of building Decimal objects per call.
+
+Quantities are stored in FloatFields, so results are returned as floats that
+are correctly rounded: each factor is kept as a double-double (``hi + lo``)
+and the product is formed with an error-free multiplication, which yields the
+float nearest to ``value * exact_factor``. ``convert_many`` converts whole
+batches for the merge paths.
+"""
+from decimal import Decimal
+from fractions import Fraction
+import math
+
+VOLUME = "volume"
+WEIGHT = "weight"
+COUNT = "count"
+
+VOLUME_TO_ML = {
+    "tsp": Decimal("4.92892"),
+    "tbsp": Decimal("14.7868"),
+    "fl_oz": Decimal("29.5735"),
+    "cup": Decimal("236.588"),
+    "pt": Decimal("473.176"),
+    "qt": Decimal("946.353"),
+    "gal": Decimal("3785.41"),
+    "ml": Decimal("1"),
+    "l": Decimal("1000"),
+}
+
+WEIGHT_TO_GRAMS = {
+    "g": Decimal("1"),
+    "kg": Decimal("1000"),
+    "oz": Decimal("28.3495"),
+    "lb": Decimal("453.592"),
+}
+
+UNIT_TYPES = {
+    **{unit: VOLUME for unit in VOLUME_TO_ML},
+    **{unit: WEIGHT for unit in WEIGHT_TO_GRAMS},
+}
+
+# Other ways to write each unit. Plurals ending in "s" are added below, and
+# spellings are matched after casefolding, dropping periods and "(s)", and
+# treating "-", "_" and runs of spaces alike.
+UNIT_SPELLINGS = {
+    "tsp": ("teaspoon", "tspn", "tsps"),
+    "tbsp": ("tablespoon", "tbs", "tbl", "tbls", "tblsp", "tbsps"),
+    "fl_oz": ("fluid ounce", "fl ounce", "fluid oz", "floz"),
+    "cup": ("c",),
+    "pt": ("pint", "pts"),
+    "qt": ("quart", "qts"),
+    "gal": ("gallon", "gals"),
+    "ml": ("milliliter", "millilitre", "mls"),
+    "l": ("liter", "litre", "ltr", "lt"),
+    # Not "gr": that is also the symbol for grains
+    "g": ("gram", "gramme", "gm", "gms"),
+    "kg": ("kilogram", "kilogramme", "kilo", "kgs"),
+    "oz": ("ounce", "ozs"),
+    "lb": ("pound", "lbs"),
+}
+
+# Abbreviations where case carries the meaning. They only match in this case
+# (after the same cleanup without casefolding): "T." is tbsp, "t." is tsp.
+CASE_SENSITIVE_UNITS = {"t": "tsp", "T": "tbsp", "Tbsp": "tbsp", "Tbs": "tbsp"}
+
+_UNIT_KEY_TRANSLATION = str.maketrans({".": "", "-": " ", "_": " "})
+
+
+def _unit_key(spelling, casefold=True):
+    if casefold:
+        spelling = spelling.casefold()
+    return " ".join(spelling.replace("(s)", "").translate(_UNIT_KEY_TRANSLATION).split())
+
+
+def _build_unit_aliases():
+    """Every case-insensitive spelling, exactly as written and normalised, -> unit."""
+    aliases = {}
+    for unit, spellings in UNIT_SPELLINGS.items():
+        for spelling in (unit, *spellings):
+            key = _unit_key(spelling)
+            for form in (spelling, key, key if key.endswith("s") else key + "s"):
+                aliases.setdefault(form, unit)
+    return aliases
+
+
+# Casefolded lookups must not see the case-sensitive forms, or "T." would
+# fold to "t" and read as tsp
+_FOLDED_UNIT_ALIASES = _build_unit_aliases()
+# Spellings to try exactly as written, case-sensitive forms included
+UNIT_ALIASES = {**_FOLDED_UNIT_ALIASES, **CASE_SENSITIVE_UNITS}
+
+# Veltkamp splitter for 53-bit doubles (2**27 + 1)
+_SPLITTER = 134217729.0
+_SPLIT_LIMIT = 1e300
+
+
+def get_measurement_type(volume_unit, weight_unit):
+    if volume_unit:
+        return VOLUME
+    if weight_unit:
+        return WEIGHT
+    return COUNT
+
+
+def canonical_unit(spelling):
+    """
+    The unit (a VOLUME_TO_ML or WEIGHT_TO_GRAMS key) that ``spelling`` names,
+    e.g. "Tablespoons" -> "tbsp" or "fl. oz" -> "fl_oz", or None.
+    """
+    spelling = str(spelling).strip()
+    unit = UNIT_ALIASES.get(spelling)
+    if unit is None:
+        unit = CASE_SENSITIVE_UNITS.get(_unit_key(spelling, casefold=False))
+    if unit is None:
+        unit = _FOLDED_UNIT_ALIASES.get(_unit_key(spelling))
+    return unit
+
+
+def unit_errors(volume_unit, weight_unit):
+    """
+    Validate a (volume_unit, weight_unit) pair. Returns a dict of field
+    errors in DRF's shape, empty when the units are usable.
+    """
+    if volume_unit and weight_unit:
+        return {"units": ["Provide either a volume unit or a weight unit, not both."]}
+    if volume_unit and volume_unit not in VOLUME_TO_ML:
+        return {"volume_unit": ["Invalid volume unit."]}
+    if weight_unit and weight_unit not in WEIGHT_TO_GRAMS:
+        return {"weight_unit": ["Invalid weight unit."]}
+    return {}
+
+
+def _build_factors():
+    """Pairwise ``(from_unit, to_unit) -> (hi, lo)`` for same-type units."""
+    factors = {}
+    for table in (VOLUME_TO_ML, WEIGHT_TO_GRAMS):
+        for from_unit, from_base in table.items():
+            for to_unit, to_base in table.items():
+                exact = Fraction(from_base) / Fraction(to_base)
+                hi = float(exact)
+                lo = float(exact - Fraction(hi))
+                factors[from_unit, to_unit] = (hi, lo)
+    return factors
+
+
+FACTORS = _build_factors()
+
+
+def can_convert(from_unit, to_unit):
+    """Whether quantities convert between the two units."""
+    return (from_unit, to_unit) in FACTORS
+
+
+def _factor(from_unit, to_unit):
+    try:
+        return FACTORS[from_unit, to_unit]
+    except KeyError:
+        raise ValueError("Unsupported unit conversion.") from None
+
+
+def _two_product(value, hi, lo):
+    """
+    ``value * (hi + lo)`` rounded once, via Dekker's error-free product.
+    Returns the plain product too.
+    """
+    product = value * hi
+    t = _SPLITTER * value
+    value_hi = t - (t - value)
+    value_lo = value - value_hi
+    t = _SPLITTER * hi
+    factor_hi = t - (t - hi)
+    factor_lo = hi - factor_hi
+    error = (
+        ((value_hi * factor_hi - product) + value_hi * factor_lo + value_lo * factor_hi)
+        + value_lo * factor_lo
+    )
+    return product, product + (error + value * lo)
+
+
+def _multiply(value, hi, lo):
+    product, result = _two_product(value, hi, lo)
+    # Values too large to split exactly keep the plain product
+    if not math.isfinite(product) or abs(value) > _SPLIT_LIMIT:
+        return product
+    return result
+
+
+def convert_quantity(value, from_unit, to_unit):
+    """
+    Convert ``value`` between two units of the same measurement type.
+    Raises ValueError for unknown units or units of different types.
+    """
+    hi, lo = _factor(from_unit, to_unit)
+    return _multiply(float(value), hi, lo)
+
+
+def convert_many(values, from_units, to_units):
+    """
+    Convert ``values[i]`` from ``from_units[i]`` to ``to_units[i]``. Returns
+    a list of floats, identical to calling ``convert_quantity`` on each.
+    """
+    values = [float(value) for value in values]
+    from_units = list(from_units)
+    to_units = list(to_units)
+    if not len(values) == len(from_units) == len(to_units):
+        raise ValueError("values, from_units and to_units must be the same length.")
+    return [
+        convert_quantity(value, from_unit, to_unit)
+        for value, from_unit, to_unit in zip(values, from_units, to_units)
+    ]
@@ -0,0 +1,256 @@
+"""
+Per-user grocery list change events for server push (Server-Sent Events).
+
+Writes publish events through a broker chosen by GROCERY_EVENTS_BROKER. The
+in-process broker fans events out to connections served by the same process,
+which is enough when the app runs as a single ASGI process. RedisEventBroker
+uses Redis pub/sub so events published by any worker reach every connection,
+with one pub/sub connection per process whatever the number of streams; it is
+the default, and the only broker allowed, when WEB_CONCURRENCY > 1.
+"""
+import asyncio
+import json
+import logging
+import threading
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+_broker = None
+_broker_lock = threading.Lock()
+_TICKET_SALT = "main_app.events.stream-ticket"
+
+
+class BaseEventBroker:
+    """Interface for grocery list event brokers."""
+
+    # Whether events published in one process reach streams held by another
+    cross_process = False
+
+    def publish(self, user_id, event):
+        """Deliver ``event`` (a JSON-serializable dict) to the user's listeners.
+        Called from sync code on any thread."""
+        raise NotImplementedError
+
+    async def subscribe(self, user_id):
+        """Start listening for ``user_id``'s events and return a subscription
+        with async ``get()`` and ``close()`` methods."""
+        raise NotImplementedError
+
+
+class InProcessSubscription:
+    def __init__(self, broker, user_id, queue_size):
+        self.broker = broker
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(queue_size)
+
+    def offer(self, event):
+        # A listener that stopped reading drops events instead of growing forever
+        if not self.queue.full():
+            self.queue.put_nowait(event)
+
+    async def get(self):
+        return await self.queue.get()
+
+    async def close(self):
+        self.broker._remove(self)
+
+
+class InProcessEventBroker(BaseEventBroker):
+    """Fan-out to subscribers living in this process."""
+
+    def __init__(self, queue_size=None):
+        self.queue_size = queue_size or settings.GROCERY_EVENTS_QUEUE_SIZE
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def publish(self, user_id, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.offer, event)
+            except RuntimeError:
+                # The subscriber's loop has already closed
+                pass
+
+    async def subscribe(self, user_id):
+        subscription = InProcessSubscription(self, user_id, self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def _remove(self, subscription):
+        with self._lock:
+            listeners = self._subscribers.get(subscription.user_id)
+            if listeners is not None:
+                listeners.discard(subscription)
+                if not listeners:
+                    del self._subscribers[subscription.user_id]
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(listeners) for listeners in self._subscribers.values())
+
+
+class RedisSubscription(InProcessSubscription):
+    async def get(self):
+        event = await super().get()
+        if event is None:
+            raise ConnectionError("Lost the Redis pub/sub connection.")
+        return event
+
+    def fail(self):
+        # Unblock the stream even if its queue is full, so the client reconnects
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+    async def close(self):
+        await self.broker._unsubscribe(self)
+
+
+class RedisEventBroker(BaseEventBroker):
+    """
+    Fan-out across processes through Redis pub/sub (needs ``redis``). Each
+    process holds one pub/sub connection, subscribed to the channels of the
+    users it streams to, and hands messages to local queues.
+    """
+
+    cross_process = True
+
+    def __init__(self, url=None, queue_size=None):
+        try:
+            import redis
+            import redis.asyncio
+        except ImportError as exc:
+            raise ImproperlyConfigured(
+                "RedisEventBroker requires the 'redis' package."
+            ) from exc
+        self.url = url or settings.GROCERY_EVENTS_REDIS_URL
+        self.queue_size = queue_size or settings.GROCERY_EVENTS_QUEUE_SIZE
+        self._client = redis.Redis.from_url(self.url)
+        self._async_module = redis.asyncio
+        self._loop = None
+        self._lock = None
+        self._pubsub = None
+        self._reader = None
+        self._subscribers = {}
+
+    @staticmethod
+    def _channel(user_id):
+        return f"grocery-events:{user_id}"
+
+    def publish(self, user_id, event):
+        self._client.publish(self._channel(user_id), json.dumps(event))
+
+    async def subscribe(self, user_id):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # The connection belongs to one event loop: the ASGI server's, or
+            # a fresh one per test
+            self._loop = loop
+            self._lock = asyncio.Lock()
+            self._pubsub = self._async_module.Redis.from_url(self.url).pubsub()
+            self._reader = None
+            self._subscribers = {}
+
+        subscription = RedisSubscription(self, user_id, self.queue_size)
+        async with self._lock:
+            listeners = self._subscribers.setdefault(user_id, set())
+            if not listeners:
+                await self._pubsub.subscribe(self._channel(user_id))
+            listeners.add(subscription)
+            if self._reader is None:
+                self._reader = loop.create_task(self._read(self._pubsub))
+        return subscription
+
+    async def _unsubscribe(self, subscription):
+        if subscription.loop is not self._loop:
+            return
+        async with self._lock:
+            listeners = self._subscribers.get(subscription.user_id)
+            if listeners is None:
+                return
+            listeners.discard(subscription)
+            if not listeners:
+                del self._subscribers[subscription.user_id]
+                await self._pubsub.unsubscribe(self._channel(subscription.user_id))
+
+    async def _read(self, pubsub):
+        try:
+            while True:
+                message = await pubsub.get_message(
+                    ignore_subscribe_messages=True, timeout=None
+                )
+                if message is None or message.get("type") != "message":
+                    continue
+                user_id = int(message["channel"].rsplit(b":", 1)[1])
+                event = json.loads(message["data"])
+                for subscription in list(self._subscribers.get(user_id, ())):
+                    subscription.offer(event)
+        except Exception:
+            logger.exception("Lost the grocery events pub/sub connection")
+            # End every stream on this connection; clients reconnect and
+            # resync, and the next subscription opens a new connection
+            if self._pubsub is pubsub:
+                subscribers, self._subscribers = self._subscribers, {}
+                self._loop = None
+                for listeners in subscribers.values():
+                    for subscription in listeners:
+                        subscription.fail()
+            await pubsub.aclose()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                broker = import_string(settings.GROCERY_EVENTS_BROKER)()
+                if settings.WEB_CONCURRENCY > 1 and not broker.cross_process:
+                    raise ImproperlyConfigured(
+                        f"{settings.GROCERY_EVENTS_BROKER} only reaches streams "
+                        f"served by the same process, but WEB_CONCURRENCY is "
+                        f"{settings.WEB_CONCURRENCY}. Use "
+                        f"main_app.events.RedisEventBroker."
+                    )
+                _broker = broker
+    return _broker
+
+
+def issue_stream_ticket(user_id):
+    """
+    A signed ticket that opens ``user_id``'s event stream for the next
+    GROCERY_EVENTS_TICKET_SECONDS. Browsers' EventSource cannot send headers,
+    so the ticket goes in the URL instead of the access token.
+    """
+    return signing.dumps(user_id, salt=_TICKET_SALT)
+
+
+def read_stream_ticket(ticket):
+    """The user id ``ticket`` was issued for, or None if invalid or expired."""
+    try:
+        return signing.loads(
+            ticket, salt=_TICKET_SALT, max_age=settings.GROCERY_EVENTS_TICKET_SECONDS
+        )
+    except signing.BadSignature:
+        return None
+
+
+def publish_grocery_event(user_id, event_type, payload):
+    """
+    Publish ``{"type": event_type, "item": payload}`` once the current
+    transaction commits, so listeners never see rolled-back writes.
+    """
+    event = {"type": event_type, "item": payload}
+    # robust: a broker outage must not fail a request that already committed
+    transaction.on_commit(
+        lambda: get_broker().publish(user_id, event), robust=True
+    )
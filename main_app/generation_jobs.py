@@ -0,0 +1,204 @@
+"""
+Background AI recipe generation.
+
+POST /recipes/generate/jobs/ stores a GenerationJob and returns at once; the
+LLM call runs outside the request so slow completions don't hold web
+workers. With GENERATION_JOBS_EXECUTOR = "thread" each web process runs jobs
+on a bounded thread pool; with "worker" they wait in the table for
+``manage.py run_generation_jobs`` processes. Either way a job is claimed with
+a conditional UPDATE (queued -> running), so it runs exactly once however
+many pools or workers are polling.
+
+Cancellation only flips the row's status. A running job polls its status
+between streamed fragments, abandons the completion once cancelled, and can
+never overwrite a cancellation with a result.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import datetime
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .ai_cache import store_recipe
+from .ai_usage import CallStats
+from .models import AICall, GenerationJob
+from .recipe_generation import stream_recipe
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+class JobLimitExceeded(Exception):
+    """The user already has GENERATION_JOBS_PER_USER jobs queued or running."""
+
+
+def submit_job(user, prompt, messages, cache_key, result=None):
+    """
+    Create a job for ``messages``, built from the user's ``prompt``. A
+    ``result`` (e.g. from the AI cache) creates an already finished job.
+    Raises JobLimitExceeded when the user is at their concurrency limit.
+    """
+    expire_stale_jobs()
+    now = timezone.now()
+    with transaction.atomic():
+        if result is not None:
+            return GenerationJob.objects.create(
+                user=user,
+                status=GenerationJob.Status.SUCCEEDED,
+                prompt=prompt,
+                messages=messages,
+                cache_key=cache_key,
+                result=result,
+                started_at=now,
+                finished_at=now,
+            )
+
+        # Lock the user row so concurrent submissions can't both pass the limit
+        User.objects.select_for_update().filter(pk=user.pk).exists()
+        active = GenerationJob.objects.filter(
+            user=user, status__in=GenerationJob.ACTIVE_STATUSES
+        ).count()
+        if active >= settings.GENERATION_JOBS_PER_USER:
+            raise JobLimitExceeded()
+
+        job = GenerationJob.objects.create(
+            user=user, prompt=prompt, messages=messages, cache_key=cache_key
+        )
+        transaction.on_commit(lambda: dispatch_job(job.pk))
+    return job
+
+
+def dispatch_job(job_id):
+    if settings.GENERATION_JOBS_EXECUTOR == "thread":
+        _get_executor().submit(run_job_in_thread, job_id)
+
+
+def cancel_job(job):
+    """Cancel ``job`` if it hasn't finished; returns whether it was cancelled."""
+    return bool(
+        GenerationJob.objects.filter(
+            pk=job.pk, status__in=GenerationJob.ACTIVE_STATUSES
+        ).update(status=GenerationJob.Status.CANCELLED, finished_at=timezone.now())
+    )
+
+
+def expire_stale_jobs():
+    """
+    Fail jobs whose process died: running, or still queued, for longer than
+    GENERATION_JOBS_TIMEOUT_SECONDS. Also frees their owners' job slots.
+    """
+    cutoff = timezone.now() - datetime.timedelta(
+        seconds=settings.GENERATION_JOBS_TIMEOUT_SECONDS
+    )
+    GenerationJob.objects.filter(
+        status=GenerationJob.Status.RUNNING, started_at__lt=cutoff
+    ).update(
+        status=GenerationJob.Status.FAILED,
+        error="Generation timed out.",
+        finished_at=timezone.now(),
+    )
+    GenerationJob.objects.filter(
+        status=GenerationJob.Status.QUEUED, created_at__lt=cutoff
+    ).update(
+        status=GenerationJob.Status.FAILED,
+        error="No worker picked up the job in time.",
+        finished_at=timezone.now(),
+    )
+
+
+def _finish(job_id, status, **fields):
+    # Only a running job can finish, so a cancellation in the meantime wins
+    return bool(
+        GenerationJob.objects.filter(
+            pk=job_id, status=GenerationJob.Status.RUNNING
+        ).update(status=status, finished_at=timezone.now(), **fields)
+    )
+
+
+def _cancellation_check(job_id):
+    interval = settings.GENERATION_JOBS_CANCEL_CHECK_SECONDS
+    next_check = time.monotonic() + interval
+
+    def should_stop():
+        nonlocal next_check
+        if time.monotonic() < next_check:
+            return False
+        next_check = time.monotonic() + interval
+        return not GenerationJob.objects.filter(
+            pk=job_id, status=GenerationJob.Status.RUNNING
+        ).exists()
+
+    return should_stop
+
+
+def run_job(job_id):
+    """Claim and run a queued job; returns False if someone else claimed it."""
+    claimed = GenerationJob.objects.filter(
+        pk=job_id, status=GenerationJob.Status.QUEUED
+    ).update(status=GenerationJob.Status.RUNNING, started_at=timezone.now())
+    if not claimed:
+        return False
+
+    job = GenerationJob.objects.get(pk=job_id)
+    recipe = None
+    try:
+        # Jobs are already off the request path, so they queue for an LLM
+        # slot for as long as they are allowed to run
+        for event, data in stream_recipe(
+            job.messages,
+            should_stop=_cancellation_check(job_id),
+            queue_timeout=settings.GENERATION_JOBS_TIMEOUT_SECONDS,
+            stats=CallStats(job.user_id, AICall.Mode.JOB, prompt=job.prompt),
+        ):
+            if event == "done":
+                recipe = data
+    except Exception as e:
+        _finish(job_id, GenerationJob.Status.FAILED, error=str(e))
+        return True
+
+    if recipe is not None and _finish(
+        job_id, GenerationJob.Status.SUCCEEDED, result=recipe
+    ):
+        if job.cache_key:
+            store_recipe(job.cache_key, recipe)
+    return True
+
+
+def run_job_in_thread(job_id):
+    try:
+        run_job(job_id)
+    finally:
+        # Pool threads outlive requests; don't leak their DB connections
+        connection.close()
+
+
+def _get_executor():
+    global _executor, _executor_pid
+    pid = os.getpid()
+    if _executor is None or _executor_pid != pid:
+        with _executor_lock:
+            if _executor is None or _executor_pid != pid:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.GENERATION_JOBS_THREADS,
+                    thread_name_prefix="generation-job",
+                )
+                _executor_pid = pid
+    return _executor
+
+
+def _forget_executor_after_fork():
+    # Pool threads don't survive fork; start a new pool in the child
+    global _executor, _executor_pid, _executor_lock
+    _executor = None
+    _executor_pid = None
+    _executor_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_executor_after_fork)
@@ -0,0 +1,98 @@
+"""
+Cache for presigned S3 image URLs.
+
+With AWS_QUERYSTRING_AUTH enabled every ``storage.url()`` call runs a full
+SigV4 presign in boto3. Signed URLs stay valid for AWS_QUERYSTRING_EXPIRE
+seconds, so we keep them in a per-worker LRU and hand them out again until
+shortly before the signature expires. Setting SIGNED_URL_CACHE_ALIAS to a
+shared Django cache lets every server worker reuse the same signatures.
+"""
+from collections import OrderedDict
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+class SignedUrlCache:
+    """Thread-safe LRU of signed URLs with a fixed time-to-live."""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            url, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return url
+
+    def set(self, key, url, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (url, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def _cache_ttl():
+    """Seconds a signed URL may be reused, leaving a margin before it expires."""
+    expire = getattr(settings, "AWS_QUERYSTRING_EXPIRE", 3600)
+    return max(expire - settings.SIGNED_URL_CACHE_SAFETY_MARGIN, 0)
+
+
+_local_cache = SignedUrlCache(
+    max_entries=settings.SIGNED_URL_CACHE_MAX_ENTRIES,
+    ttl=_cache_ttl(),
+)
+
+
+def _cache_key(storage, name):
+    bucket = getattr(storage, "bucket_name", "") or ""
+    return f"signed-url:{type(storage).__name__}:{bucket}:{name}"
+
+
+def signed_url(storage, name):
+    """Return ``storage.url(name)``, reusing a cached signature when possible."""
+    ttl = _local_cache.ttl
+    if not ttl:
+        return storage.url(name)
+
+    key = _cache_key(storage, name)
+    url = _local_cache.get(key)
+    if url is not None:
+        return url
+
+    shared = (
+        caches[settings.SIGNED_URL_CACHE_ALIAS]
+        if settings.SIGNED_URL_CACHE_ALIAS
+        else None
+    )
+    if shared is not None:
+        entry = shared.get(key)
+        if entry is not None:
+            url, reusable_until = entry
+            remaining = reusable_until - time.time()
+            if remaining > 0:
+                _local_cache.set(key, url, ttl=remaining)
+                return url
+
+    url = storage.url(name)
+    _local_cache.set(key, url)
+    if shared is not None:
+        shared.set(key, (url, time.time() + ttl), timeout=ttl)
+    return url
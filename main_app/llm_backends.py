@@ -0,0 +1,196 @@
+"""
+Backends for the recipe completion call, chosen by the LLM_BACKEND setting
+(a dotted path, like Django's EMAIL_BACKEND).
+
+OpenAIBackend calls the chat completions API through the pooled client.
+FakeLLMBackend replays recorded completions without network access, with a
+simulated time to first token and streaming rate, so generate_recipe can be
+load-tested and benchmarked offline (see ``manage.py bench_generate``).
+
+A backend returns raw completion text, and fills in the token counts
+(``prompt_tokens``, ``completion_tokens``, ``cached_tokens``) in the
+``usage`` dict it is given; prompt construction, parsing, normalisation and
+LLM admission control stay in recipe_generation.py.
+"""
+import functools
+import itertools
+import json
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .openai_client import get_openai_client
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+class BaseLLMBackend:
+    def complete(self, messages, model, temperature, n=1, usage=None):
+        """Return the text of ``n`` completions (choices) for ``messages``."""
+        raise NotImplementedError
+
+    def stream(self, messages, model, temperature, usage=None):
+        """
+        Yield the text of one completion fragment by fragment. Closing the
+        generator early abandons the completion.
+        """
+        raise NotImplementedError
+
+
+def _record_usage(usage, reported):
+    if usage is None or reported is None:
+        return
+    usage["prompt_tokens"] = reported.prompt_tokens or 0
+    usage["completion_tokens"] = reported.completion_tokens or 0
+    details = getattr(reported, "prompt_tokens_details", None)
+    usage["cached_tokens"] = getattr(details, "cached_tokens", None) or 0
+
+
+class OpenAIBackend(BaseLLMBackend):
+    def complete(self, messages, model, temperature, n=1, usage=None):
+        response = get_openai_client().chat.completions.create(
+            model=model,
+            messages=messages,
+            response_format={"type": "json_object"},
+            temperature=temperature,
+            n=n,
+        )
+        _record_usage(usage, getattr(response, "usage", None))
+        return [choice.message.content or "" for choice in response.choices]
+
+    def stream(self, messages, model, temperature, usage=None):
+        completion = get_openai_client().chat.completions.create(
+            model=model,
+            messages=messages,
+            response_format={"type": "json_object"},
+            temperature=temperature,
+            stream=True,
+            # The last chunk then carries the token counts
+            stream_options={"include_usage": True},
+        )
+        try:
+            for chunk in completion:
+                _record_usage(usage, getattr(chunk, "usage", None))
+                if not chunk.choices:
+                    continue
+                fragment = chunk.choices[0].delta.content
+                if fragment:
+                    yield fragment
+        finally:
+            # Closes the HTTP response when abandoned early
+            completion.close()
+
+
+# Replayed when LLM_FAKE_RECORDINGS isn't set
+DEFAULT_RECORDING = {
+    "title": "Overnight Oats",
+    "notes": (
+        "Creamy make-ahead oats. Per serving: about 350 kcal, 12 g protein, "
+        "55 g carbohydrates, 9 g fat."
+    ),
+    "tags": ["vegetarian", "contains_dairy", "contains_gluten"],
+    "ingredients": [
+        {"name": "Rolled oats", "quantity": 0.5, "volume_unit": "cup", "weight_unit": None},
+        {"name": "Milk", "quantity": 0.5, "volume_unit": "cup", "weight_unit": None},
+        {"name": "Greek yogurt", "quantity": 0.25, "volume_unit": "cup", "weight_unit": None},
+        {"name": "Chia seeds", "quantity": 1, "volume_unit": "tbsp", "weight_unit": None},
+        {"name": "Honey", "quantity": 2, "volume_unit": "tsp", "weight_unit": None},
+        {"name": "Blueberries", "quantity": 60, "volume_unit": None, "weight_unit": "g"},
+    ],
+    "steps": [
+        {"step": 1, "description": "Stir the oats, milk, yogurt, chia seeds and honey together in a jar."},
+        {"step": 2, "description": "Cover and refrigerate for at least 6 hours, or overnight."},
+        {"step": 3, "description": "Stir, loosen with a splash of milk if thick, and top with blueberries."},
+    ],
+}
+
+
+@functools.lru_cache(maxsize=None)
+def load_recordings(path):
+    """
+    Completion texts from ``path``: a JSON array whose entries are either
+    raw completion strings or recipe objects. The default recipe without a
+    path.
+    """
+    if not path:
+        return (json.dumps(DEFAULT_RECORDING),)
+    with open(path, encoding="utf-8") as f:
+        entries = json.load(f)
+    if not isinstance(entries, list) or not entries:
+        raise ValueError(f"{path} must hold a non-empty JSON array of completions")
+    return tuple(
+        entry if isinstance(entry, str) else json.dumps(entry) for entry in entries
+    )
+
+
+class FakeLLMBackend(BaseLLMBackend):
+    """
+    Replays LLM_FAKE_RECORDINGS in turn. Each completion waits
+    LLM_FAKE_FIRST_TOKEN_SECONDS, then streams at LLM_FAKE_CHARS_PER_SECOND
+    in LLM_FAKE_CHUNK_CHARS fragments; every delay varies by up to
+    LLM_FAKE_JITTER either way. Non-streamed completions sleep for the same
+    total time. The model and temperature are ignored, and token counts are
+    estimated from the text.
+    """
+
+    def __init__(self):
+        self._turn = itertools.count()
+
+    def _next_recording(self):
+        recordings = load_recordings(settings.LLM_FAKE_RECORDINGS)
+        return recordings[next(self._turn) % len(recordings)]
+
+    @staticmethod
+    def _sleep(seconds):
+        jitter = settings.LLM_FAKE_JITTER
+        if seconds > 0:
+            time.sleep(seconds * random.uniform(1 - jitter, 1 + jitter))
+
+    @staticmethod
+    def _transfer_seconds(chars):
+        rate = settings.LLM_FAKE_CHARS_PER_SECOND
+        return chars / rate if rate > 0 else 0
+
+    @staticmethod
+    def _record_usage(usage, messages, texts):
+        # Roughly four characters per token, like English text
+        if usage is not None:
+            usage["prompt_tokens"] = sum(len(m["content"]) for m in messages) // 4
+            usage["completion_tokens"] = sum(len(text) for text in texts) // 4
+            usage["cached_tokens"] = 0
+
+    def complete(self, messages, model, temperature, n=1, usage=None):
+        texts = [self._next_recording() for _ in range(n)]
+        self._record_usage(usage, messages, texts)
+        # Choices are generated side by side, so the longest sets the pace
+        self._sleep(
+            settings.LLM_FAKE_FIRST_TOKEN_SECONDS
+            + self._transfer_seconds(max(len(text) for text in texts))
+        )
+        return texts
+
+    def stream(self, messages, model, temperature, usage=None):
+        text = self._next_recording()
+        self._record_usage(usage, messages, [text])
+        size = max(settings.LLM_FAKE_CHUNK_CHARS, 1)
+        self._sleep(settings.LLM_FAKE_FIRST_TOKEN_SECONDS)
+        for start in range(0, len(text), size):
+            if start:
+                self._sleep(self._transfer_seconds(size))
+            yield text[start:start + size]
+
+
+def get_llm_backend():
+    """This process's instance of the LLM_BACKEND class."""
+    path = settings.LLM_BACKEND
+    backend = _backends.get(path)
+    if backend is None:
+        with _backends_lock:
+            backend = _backends.get(path)
+            if backend is None:
+                backend = _backends[path] = import_string(path)()
+    return backend
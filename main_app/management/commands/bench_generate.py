@@ -0,0 +1,188 @@
+"""
+Benchmark /recipes/generate/ offline. Requests go through the full Django
+stack in this process, served by a pool of ``--workers`` threads standing in
+for the server's worker threads, with the LLM replaced by FakeLLMBackend
+(override with ``--backend``). ``--concurrency`` clients keep requests in
+flight until ``--requests`` have completed.
+
+Reports client-side latency percentiles (including time queued for a
+worker), throughput, status codes, and worker saturation: the share of
+worker time spent serving requests. 429s mean requests found every LLM slot
+(LLM_MAX_CONCURRENCY) busy.
+
+    python manage.py bench_generate --requests 500 --concurrency 64 --workers 16
+    python manage.py bench_generate --stream --first-token 0.8 --chars-per-second 300
+
+Requests are made as ``--username`` (created if missing) with rate limits
+off and ``fresh=1``, so every request reaches the backend unless
+``--allow-cache`` is given.
+"""
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from rest_framework.test import APIClient
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = round(fraction * len(sorted_values))
+    return sorted_values[min(len(sorted_values) - 1, max(rank - 1, 0))]
+
+
+class Command(BaseCommand):
+    help = "Benchmark recipe generation against a stand-in LLM backend."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument("--concurrency", type=int, default=32)
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=8,
+            help="Server worker threads (e.g. workers x threads)",
+        )
+        parser.add_argument("--stream", action="store_true")
+        parser.add_argument("--prompt", default="a quick weeknight pasta")
+        parser.add_argument("--username", default="bench-generate")
+        parser.add_argument(
+            "--backend", default="main_app.llm_backends.FakeLLMBackend"
+        )
+        parser.add_argument(
+            "--first-token",
+            type=float,
+            default=settings.LLM_FAKE_FIRST_TOKEN_SECONDS,
+            help="Fake backend: seconds to the first fragment",
+        )
+        parser.add_argument(
+            "--chars-per-second",
+            type=float,
+            default=settings.LLM_FAKE_CHARS_PER_SECOND,
+            help="Fake backend: streaming rate (0 for no delay)",
+        )
+        parser.add_argument(
+            "--allow-cache",
+            action="store_true",
+            help="Let the AI cache and saved recipe matches answer requests",
+        )
+
+    def handle(self, *args, **options):
+        user, created = User.objects.get_or_create(username=options["username"])
+        if created:
+            user.set_unusable_password()
+            user.save(update_fields=["password"])
+
+        # Rejections are counted below; don't log one warning per 429
+        request_logger = logging.getLogger("django.request")
+        level = request_logger.level
+        request_logger.setLevel(logging.ERROR)
+        try:
+            with override_settings(
+                LLM_BACKEND=options["backend"],
+                LLM_FAKE_FIRST_TOKEN_SECONDS=options["first_token"],
+                LLM_FAKE_CHARS_PER_SECOND=options["chars_per_second"],
+                THROTTLE_BUCKETS={},
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+            ):
+                self.run(user, **options)
+        finally:
+            request_logger.setLevel(level)
+
+    def run(
+        self, user, requests, concurrency, workers, stream, prompt, allow_cache, **options
+    ):
+        path = "/recipes/generate/" if allow_cache else "/recipes/generate/?fresh=1"
+        body = {"prompt": prompt, "stream": stream}
+        local = threading.local()
+        busy = []
+        lock = threading.Lock()
+
+        def serve():
+            # Runs on a worker thread, like a sync server worker would
+            if not hasattr(local, "client"):
+                local.client = APIClient()
+                local.client.force_authenticate(user)
+            started = time.perf_counter()
+            first_byte = None
+            try:
+                response = local.client.post(path, body, format="json")
+                status = response.status_code
+                if response.streaming:
+                    for chunk in response.streaming_content:
+                        if first_byte is None and chunk.startswith(b"event:"):
+                            first_byte = time.perf_counter()
+                        if chunk.startswith(b"event: error"):
+                            # LLMBusy reaches streams as an error with retry_after
+                            status = 429 if b"retry_after" in chunk else 500
+                    # Sends request_finished, which closes the DB connection
+                    response.close()
+            except Exception as e:  # noqa: BLE001 - report every failure
+                status = type(e).__name__
+            finished = time.perf_counter()
+            with lock:
+                busy.append(finished - started)
+            return started, first_byte, finished, status
+
+        results = []
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bench-worker")
+        remaining = iter(range(requests))
+
+        def client_loop():
+            while next(remaining, None) is not None:
+                submitted = time.perf_counter()
+                started, first_byte, finished, status = pool.submit(serve).result()
+                with lock:
+                    results.append((submitted, started, first_byte, finished, status))
+
+        began = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as clients:
+            for future in [clients.submit(client_loop) for _ in range(concurrency)]:
+                future.result()
+        wall = time.perf_counter() - began
+        pool.shutdown()
+
+        latencies = sorted(finished - submitted for submitted, _, _, finished, _ in results)
+        queued = sorted(started - submitted for submitted, started, _, _, _ in results)
+        statuses = Counter(status for *_, status in results)
+        saturation = sum(busy) / (workers * wall) if wall else 0.0
+
+        self.stdout.write(
+            f"{len(results)} requests in {wall:.2f}s "
+            f"({len(results) / wall:.1f} req/s), concurrency {concurrency}, "
+            f"{workers} workers, backend {settings.LLM_BACKEND}"
+        )
+        self.stdout.write(
+            "Status: "
+            + ", ".join(
+                f"{code} x{count}" for code, count in sorted(statuses.items(), key=str)
+            )
+        )
+        self._report("Latency", latencies)
+        self._report("Queued for a worker", queued)
+        if stream:
+            self._report(
+                "First event",
+                sorted(
+                    first_byte - submitted
+                    for submitted, _, first_byte, _, _ in results
+                    if first_byte is not None
+                ),
+            )
+        style = self.style.WARNING if saturation > 0.9 else self.style.SUCCESS
+        self.stdout.write(style(f"Worker saturation: {saturation:.0%}"))
+
+    def _report(self, label, values):
+        self.stdout.write(
+            f"{label}: p50={percentile(values, 0.50) * 1000:.0f}ms "
+            f"p95={percentile(values, 0.95) * 1000:.0f}ms "
+            f"p99={percentile(values, 0.99) * 1000:.0f}ms "
+            f"max={(values[-1] if values else 0) * 1000:.0f}ms"
+        )
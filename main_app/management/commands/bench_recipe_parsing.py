@@ -0,0 +1,149 @@
+"""
+Benchmark parsing of AI recipe completions: the schema validator and unit
+alias table in ``main_app.recipe_schema`` against the previous
+``json.loads`` + per-ingredient exact-abbreviation pass.
+
+The corpus is a JSON array of recorded completions (the LLM_FAKE_RECORDINGS
+format), or by default completions synthesised from the sample recipe with
+the unit spellings, fences and quantity formats models actually produce.
+
+    python manage.py bench_recipe_parsing --completions 5000
+    python manage.py bench_recipe_parsing --corpus recordings.json
+"""
+import json
+import random
+import timeit
+
+from django.core.management.base import BaseCommand
+
+from main_app.llm_backends import DEFAULT_RECORDING, load_recordings
+from main_app.recipe_schema import parse_recipe, parse_recipes
+
+LEGACY_VOLUME_UNITS = {"tsp", "tbsp", "fl_oz", "cup", "pt", "qt", "gal", "ml", "l"}
+LEGACY_WEIGHT_UNITS = {"g", "kg", "oz", "lb"}
+
+# Spellings seen in completions, by canonical unit
+SPELLINGS = {
+    "cup": ("cup", "cups", "Cups", "c"),
+    "tbsp": ("tbsp", "Tbsp", "tablespoon", "tablespoons", "T"),
+    "tsp": ("tsp", "teaspoon", "teaspoons", "tsp."),
+    "g": ("g", "grams", "gram", "gr"),
+    "ml": ("ml", "mL", "milliliters"),
+    "fl_oz": ("fl_oz", "fl oz", "fl. oz", "fluid ounces"),
+    "oz": ("oz", "ounces"),
+}
+QUANTITIES = (0.5, 1, 2, "1/2", "1 1/2", "½", "2-3")
+
+
+def legacy_parse(text):
+    """The parsing and unit normalisation this module replaced."""
+    recipe = json.loads(text.replace("```json", "").replace("```", ""))
+    for ingredient in recipe.get("ingredients", []):
+        name = str(ingredient.get("name") or "Ingredient").strip() or "Ingredient"
+        notes = []
+        units = {"volume": None, "weight": None}
+        for field in ("volume_unit", "weight_unit"):
+            raw = ingredient.get(field)
+            original = str(raw).strip() if raw is not None else ""
+            if not original:
+                continue
+            cleaned = " ".join(original.lower().replace(".", "").replace("-", " ").split())
+            if cleaned in LEGACY_VOLUME_UNITS:
+                units["volume"] = units["volume"] or cleaned
+            elif cleaned in LEGACY_WEIGHT_UNITS:
+                units["weight"] = units["weight"] or cleaned
+            else:
+                notes.append(original)
+        ingredient["volume_unit"] = units["volume"]
+        ingredient["weight_unit"] = units["weight"]
+        ingredient["name"] = f"{name} ({', '.join(notes)})" if notes else name
+    return recipe
+
+
+def synthesise_corpus(count, rng):
+    completions = []
+    for _ in range(count):
+        recipe = json.loads(json.dumps(DEFAULT_RECORDING))
+        for ingredient in recipe["ingredients"]:
+            unit = rng.choice(list(SPELLINGS))
+            field = "weight_unit" if unit in ("g", "oz") else "volume_unit"
+            ingredient["volume_unit"] = ingredient["weight_unit"] = None
+            ingredient[field] = rng.choice(SPELLINGS[unit])
+            ingredient["quantity"] = rng.choice(QUANTITIES)
+        text = json.dumps(recipe, indent=rng.choice((None, 2)))
+        completions.append(f"```json\n{text}\n```" if rng.random() < 0.3 else text)
+    return completions
+
+
+class Command(BaseCommand):
+    help = "Benchmark AI recipe parsing against the previous json.loads implementation."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--corpus", help="JSON array of recorded completions")
+        parser.add_argument("--completions", type=int, default=2000)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, corpus, completions, repeat, seed, **options):
+        if corpus:
+            texts = list(load_recordings(corpus))
+        else:
+            texts = synthesise_corpus(completions, random.Random(seed))
+        count = len(texts)
+
+        def legacy():
+            results = []
+            for text in texts:
+                try:
+                    results.append(legacy_parse(text))
+                except ValueError as e:
+                    results.append(e)
+            return results
+
+        def scalar():
+            results = []
+            for text in texts:
+                try:
+                    results.append(parse_recipe(text))
+                except ValueError as e:
+                    results.append(e)
+            return results
+
+        def batch():
+            return parse_recipes(texts)
+
+        timings = {}
+        for label, func in (("legacy json", legacy), ("schema", scalar), ("schema batch", batch)):
+            best = min(timeit.repeat(func, number=1, repeat=repeat))
+            timings[label] = best
+            self.stdout.write(
+                f"{label:>13}: {best * 1000:8.1f}ms total, "
+                f"{best / count * 1e6:7.1f}us/completion"
+            )
+        baseline = timings["legacy json"]
+        self.stdout.write(
+            f"speedup: schema {baseline / timings['schema']:.2f}x, "
+            f"batch {baseline / timings['schema batch']:.2f}x"
+        )
+
+        for label, results in (("legacy json", legacy()), ("schema", batch())):
+            recipes = [result for result in results if isinstance(result, dict)]
+            ingredients = [
+                ingredient
+                for recipe in recipes
+                for ingredient in recipe.get("ingredients") or []
+                if isinstance(ingredient, dict)
+            ]
+            resolved = sum(
+                bool(ingredient.get("volume_unit") or ingredient.get("weight_unit"))
+                for ingredient in ingredients
+            )
+            numeric = sum(
+                isinstance(ingredient.get("quantity"), (int, float))
+                for ingredient in ingredients
+            )
+            self.stdout.write(
+                f"{label:>13}: {len(recipes)}/{count} parsed, "
+                f"{resolved}/{len(ingredients)} units resolved, "
+                f"{numeric}/{len(ingredients)} numeric quantities"
+            )
@@ -0,0 +1,102 @@
+"""
+Microbenchmarks for grocery list unit conversion, comparing the precomputed
+factor tables in ``main_app.conversions`` against the previous per-call
+Decimal implementation.
+
+    python manage.py bench_unit_conversion --values 100000
+"""
+from decimal import Decimal
+from fractions import Fraction
+import random
+import timeit
+
+from django.core.management.base import BaseCommand
+
+from main_app.conversions import (
+    VOLUME_TO_ML,
+    WEIGHT_TO_GRAMS,
+    convert_many,
+    convert_quantity,
+)
+
+
+def legacy_convert_quantity(value, from_unit, to_unit, conversion_map):
+    """The Decimal-based conversion this module replaced."""
+    if from_unit not in conversion_map or to_unit not in conversion_map:
+        raise ValueError("Unsupported unit conversion.")
+
+    value_decimal = Decimal(value)
+    base_value = value_decimal * conversion_map[from_unit]
+    return base_value / conversion_map[to_unit]
+
+
+def legacy_convert(quantity, from_unit, to_unit):
+    table = VOLUME_TO_ML if from_unit in VOLUME_TO_ML else WEIGHT_TO_GRAMS
+    return float(legacy_convert_quantity(Decimal(str(quantity)), from_unit, to_unit, table))
+
+
+class Command(BaseCommand):
+    help = "Benchmark unit conversion against the previous Decimal implementation."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--values", type=int, default=100000)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        count = options["values"]
+        repeat = options["repeat"]
+
+        pairs = [
+            (from_unit, to_unit)
+            for table in (VOLUME_TO_ML, WEIGHT_TO_GRAMS)
+            for from_unit in table
+            for to_unit in table
+        ]
+        values = [round(rng.uniform(0, 500), rng.choice((0, 1, 2, 3))) for _ in range(count)]
+        from_units, to_units = zip(*(rng.choice(pairs) for _ in range(count)))
+
+        def legacy():
+            return [
+                legacy_convert(value, from_unit, to_unit)
+                for value, from_unit, to_unit in zip(values, from_units, to_units)
+            ]
+
+        def scalar():
+            return [
+                convert_quantity(value, from_unit, to_unit)
+                for value, from_unit, to_unit in zip(values, from_units, to_units)
+            ]
+
+        def batch():
+            return convert_many(values, from_units, to_units)
+
+        results = {}
+        for label, func in (("legacy Decimal", legacy), ("scalar", scalar), ("batch", batch)):
+            best = min(timeit.repeat(func, number=1, repeat=repeat))
+            results[label] = best
+            self.stdout.write(
+                f"{label:>15}: {best * 1000:8.1f}ms total, "
+                f"{best / count * 1e9:7.0f}ns/value"
+            )
+        baseline = results["legacy Decimal"]
+        self.stdout.write(
+            f"speedup: scalar {baseline / results['scalar']:.1f}x, "
+            f"batch {baseline / results['batch']:.1f}x"
+        )
+
+        # Every result must be the float nearest to value * exact factor
+        exact_factors = {
+            (from_unit, to_unit): Fraction(table[from_unit]) / Fraction(table[to_unit])
+            for table in (VOLUME_TO_ML, WEIGHT_TO_GRAMS)
+            for from_unit in table
+            for to_unit in table
+        }
+        expected = [
+            float(Fraction(value) * exact_factors[from_unit, to_unit])
+            for value, from_unit, to_unit in zip(values, from_units, to_units)
+        ]
+        for label, got in (("scalar", scalar()), ("batch", batch()), ("legacy Decimal", legacy())):
+            mismatches = sum(a != b for a, b in zip(got, expected))
+            self.stdout.write(f"{label:>15}: {mismatches} of {count} not correctly rounded")
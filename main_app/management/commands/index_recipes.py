@@ -0,0 +1,29 @@
+"""
+Build the local recipe search index for recipes saved before it existed, or
+after restoring data with signals off. Saves keep it current afterwards.
+
+    python manage.py index_recipes
+    python manage.py index_recipes --user alice
+"""
+from django.core.management.base import BaseCommand
+
+from main_app.models import Recipe
+from main_app.recipe_search import index_recipe
+
+
+class Command(BaseCommand):
+    help = "Rebuild recipe search documents."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Only index this username's recipes")
+
+    def handle(self, *args, user=None, **options):
+        recipes = Recipe.objects.order_by("pk")
+        if user:
+            recipes = recipes.filter(user__username=user)
+
+        count = 0
+        for recipe_id in recipes.values_list("pk", flat=True).iterator():
+            index_recipe(recipe_id)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} recipes."))
@@ -0,0 +1,102 @@
+"""
+Open many idle grocery list event streams against a running server, then add
+a grocery item and measure how long the event takes to reach every stream.
+
+    python manage.py loadtest_grocery_events --base-url http://localhost:8000 \
+        --token <access token> --connections 3000
+"""
+import asyncio
+import statistics
+import time
+
+import httpx
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Load test /grocery-list/events/ with many idle SSE connections."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--base-url", default="http://localhost:8000")
+        parser.add_argument("--token", required=True, help="JWT access token")
+        parser.add_argument("--connections", type=int, default=3000)
+        parser.add_argument(
+            "--idle-seconds",
+            type=float,
+            default=30,
+            help="How long to hold the connections open before publishing",
+        )
+        parser.add_argument("--timeout", type=float, default=30)
+
+    def handle(self, *args, **options):
+        asyncio.run(self.run(**options))
+
+    async def run(self, base_url, token, connections, idle_seconds, timeout, **kwargs):
+        url = f"{base_url.rstrip('/')}/grocery-list/events/"
+        headers = {"Authorization": f"Bearer {token}"}
+        limits = httpx.Limits(max_connections=connections + 10)
+        client_timeout = httpx.Timeout(timeout, read=None)
+
+        async with httpx.AsyncClient(limits=limits, timeout=client_timeout) as client:
+            connected = asyncio.Event()
+            ready = []
+            received = []
+            errors = []
+            published_at = {}
+
+            async def listen():
+                try:
+                    async with client.stream("GET", url, headers=headers) as response:
+                        response.raise_for_status()
+                        lines = response.aiter_lines()
+                        async for line in lines:
+                            if line.startswith("retry:"):
+                                ready.append(time.perf_counter())
+                                if len(ready) == connections:
+                                    connected.set()
+                            elif line.startswith("event: created"):
+                                received.append(time.perf_counter() - published_at["t"])
+                                return
+                except Exception as exc:  # noqa: BLE001 - report every failure
+                    errors.append(exc)
+                    if len(ready) + len(errors) >= connections:
+                        connected.set()
+
+            started = time.perf_counter()
+            tasks = [asyncio.create_task(listen()) for _ in range(connections)]
+            try:
+                await asyncio.wait_for(connected.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            connect_seconds = time.perf_counter() - started
+            self.stdout.write(
+                f"{len(ready)}/{connections} streams open in {connect_seconds:.2f}s "
+                f"({len(errors)} errors)"
+            )
+
+            await asyncio.sleep(idle_seconds)
+            self.stdout.write(f"Held {len(ready)} idle streams for {idle_seconds:.0f}s")
+
+            published_at["t"] = time.perf_counter()
+            response = await client.post(
+                f"{base_url.rstrip('/')}/grocery-list/add-item/",
+                headers=headers,
+                json={"name": f"loadtest-{int(time.time())}", "quantity": 1},
+            )
+            response.raise_for_status()
+
+            done, pending = await asyncio.wait(tasks, timeout=timeout)
+            for task in pending:
+                task.cancel()
+
+        if not received:
+            self.stdout.write(self.style.ERROR("No stream received the event."))
+            return
+
+        received.sort()
+        self.stdout.write(
+            f"Delivered to {len(received)}/{len(ready)} streams: "
+            f"p50={statistics.median(received) * 1000:.1f}ms "
+            f"p95={received[min(len(received) - 1, int(len(received) * 0.95))] * 1000:.1f}ms "
+            f"max={received[-1] * 1000:.1f}ms"
+        )
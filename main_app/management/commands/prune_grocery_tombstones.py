@@ -0,0 +1,18 @@
+"""
+Delete grocery list tombstones older than GROCERY_TOMBSTONE_RETENTION_DAYS.
+Delta sync cursors from before that window get 410 and resync, so the
+tombstones are no longer needed. Run it daily, e.g. from cron.
+
+    python manage.py prune_grocery_tombstones
+"""
+from django.core.management.base import BaseCommand
+
+from main_app.models import GroceryListTombstone
+
+
+class Command(BaseCommand):
+    help = "Delete grocery list tombstones past the retention window."
+
+    def handle(self, *args, **options):
+        count = GroceryListTombstone.prune()
+        self.stdout.write(self.style.SUCCESS(f"Pruned {count} tombstones."))
@@ -0,0 +1,60 @@
+"""
+Run queued AI recipe generation jobs outside the web processes (use with
+GENERATION_JOBS_EXECUTOR = "worker"). Several workers may run side by side;
+each job is claimed by exactly one of them.
+
+    python manage.py run_generation_jobs --concurrency 8
+"""
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from main_app.generation_jobs import expire_stale_jobs, run_job_in_thread
+from main_app.models import GenerationJob
+
+
+class Command(BaseCommand):
+    help = "Process queued recipe generation jobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency", type=int, default=settings.GENERATION_JOBS_THREADS
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=1.0,
+            help="Seconds to wait when no jobs are queued",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once the queue is empty instead of polling",
+        )
+
+    def handle(self, *args, concurrency, poll_interval, once, **options):
+        running = set()
+        with ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix="generation-job"
+        ) as pool:
+            while True:
+                running = {future for future in running if not future.done()}
+                expire_stale_jobs()
+
+                free = concurrency - len(running)
+                job_ids = []
+                if free > 0:
+                    job_ids = list(
+                        GenerationJob.objects.filter(status=GenerationJob.Status.QUEUED)
+                        .order_by("created_at")
+                        .values_list("pk", flat=True)[:free]
+                    )
+                for job_id in job_ids:
+                    running.add(pool.submit(run_job_in_thread, job_id))
+
+                if not job_ids:
+                    if once and not running:
+                        return
+                    time.sleep(poll_interval)
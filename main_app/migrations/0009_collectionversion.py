@@ -0,0 +1,28 @@
+# Generated by Django 4.2.25 on 2026-10-17 01:39
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('main_app', '0008_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CollectionVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipes', models.PositiveBigIntegerField(default=0)),
+                ('recipes_modified', models.DateTimeField(default=django.utils.timezone.now)),
+                ('grocery_list', models.PositiveBigIntegerField(default=0)),
+                ('grocery_list_modified', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='collection_version', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
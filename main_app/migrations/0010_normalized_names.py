@@ -0,0 +1,49 @@
+# Generated by Django 4.2.25 on 2026-10-17 01:42
+
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def _normalize_name(name):
+    # Frozen copy of models.normalize_name
+    return " ".join(str(name or "").split()).casefold()
+
+
+def backfill_normalized_names(apps, schema_editor):
+    GroceryListItem = apps.get_model("main_app", "GroceryListItem")
+    last_id = 0
+    while True:
+        batch = list(
+            GroceryListItem.objects.filter(id__gt=last_id)
+            .order_by("id")
+            .only("id", "name")[:BATCH_SIZE]
+        )
+        if not batch:
+            break
+        for row in batch:
+            row.normalized_name = _normalize_name(row.name)
+        GroceryListItem.objects.bulk_update(batch, ["normalized_name"])
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0009_collectionversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='grocerylistitem',
+            name='normalized_name',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.RunPython(
+            backfill_normalized_names, migrations.RunPython.noop
+        ),
+        migrations.AddIndex(
+            model_name='grocerylistitem',
+            index=models.Index(fields=['user', 'normalized_name'], name='grocery_user_norm_name_idx'),
+        ),
+    ]
@@ -0,0 +1,147 @@
+# Generated by Django 4.2.25 on 2026-10-17 01:44
+
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+# Frozen copies of the unit tables used for grocery list merging
+VOLUME_TO_ML = {
+    "tsp": 4.92892,
+    "tbsp": 14.7868,
+    "fl_oz": 29.5735,
+    "cup": 236.588,
+    "pt": 473.176,
+    "qt": 946.353,
+    "gal": 3785.41,
+    "ml": 1.0,
+    "l": 1000.0,
+}
+
+WEIGHT_TO_GRAMS = {
+    "g": 1.0,
+    "kg": 1000.0,
+    "oz": 28.3495,
+    "lb": 453.592,
+}
+
+
+def _normalize_name(name):
+    # Frozen copy of models.normalize_name
+    return " ".join(str(name or "").split()).casefold()
+
+
+def _measurement_type(item):
+    if item.volume_unit:
+        return "volume"
+    if item.weight_unit:
+        return "weight"
+    return "count"
+
+
+def _conversion_factor(item, keeper):
+    """Factor turning ``item``'s quantity into ``keeper``'s unit, or None."""
+    if item.measurement_type == "volume":
+        table, source, target = VOLUME_TO_ML, item.volume_unit, keeper.volume_unit
+    elif item.measurement_type == "weight":
+        table, source, target = WEIGHT_TO_GRAMS, item.weight_unit, keeper.weight_unit
+    else:
+        return 1.0
+    if source == target:
+        return 1.0
+    if source not in table or target not in table:
+        return None
+    return table[source] / table[target]
+
+
+def _separate_name(item, taken):
+    """
+    A name for an item whose units can't be merged into its namesake, e.g.
+    "Saffron (pinch)", that no other item of the user already uses. Both
+    name and normalized_name change, so later saves keep them apart.
+    """
+    unit = item.volume_unit or item.weight_unit
+    base = f"{item.name} ({unit})"
+    for suffix in ("", f" #{item.id}"):
+        name = base[: 100 - len(suffix)] + suffix
+        if (_normalize_name(name), item.measurement_type) not in taken:
+            return name
+    return name
+
+
+def merge_duplicate_items(apps, schema_editor):
+    """
+    Fill in measurement_type and fold items sharing (user, normalized_name,
+    measurement_type) into the oldest one so the unique constraint can be
+    added. Items whose units can't be converted keep their own row, renamed
+    after their unit.
+    """
+    GroceryListItem = apps.get_model("main_app", "GroceryListItem")
+
+    pending = {}
+    to_delete = []
+
+    def flush():
+        GroceryListItem.objects.bulk_update(
+            pending.values(),
+            ["name", "quantity", "checked", "normalized_name", "measurement_type"],
+            batch_size=BATCH_SIZE,
+        )
+        pending.clear()
+        GroceryListItem.objects.filter(id__in=to_delete).delete()
+        to_delete.clear()
+
+    keepers = {}
+    current_user_id = None
+    items = GroceryListItem.objects.order_by("user_id", "id")
+    for item in items.iterator(chunk_size=BATCH_SIZE):
+        if item.user_id != current_user_id:
+            if len(pending) >= BATCH_SIZE:
+                flush()
+            keepers = {}
+            current_user_id = item.user_id
+
+        item.measurement_type = _measurement_type(item)
+        key = (item.normalized_name, item.measurement_type)
+        keeper = keepers.get(key)
+        if keeper is None:
+            keepers[key] = item
+            pending[item.id] = item
+            continue
+
+        factor = _conversion_factor(item, keeper)
+        if factor is None:
+            item.name = _separate_name(item, keepers)
+            item.normalized_name = _normalize_name(item.name)
+            keepers[(item.normalized_name, item.measurement_type)] = item
+            pending[item.id] = item
+            continue
+
+        keeper.quantity += item.quantity * factor
+        keeper.checked = keeper.checked and item.checked
+        to_delete.append(item.id)
+
+    flush()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0010_normalized_names'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='grocerylistitem',
+            name='measurement_type',
+            field=models.CharField(choices=[('volume', 'Volume'), ('weight', 'Weight'), ('count', 'Count')], default='count', max_length=10),
+        ),
+        migrations.RunPython(merge_duplicate_items, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='grocerylistitem',
+            constraint=models.UniqueConstraint(fields=('user', 'normalized_name', 'measurement_type'), name='grocery_unique_item'),
+        ),
+        migrations.RemoveIndex(
+            model_name='grocerylistitem',
+            name='grocery_user_norm_name_idx',
+        ),
+    ]
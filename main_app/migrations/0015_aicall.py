@@ -0,0 +1,42 @@
+# Generated by Django 4.2.25 on 2026-10-17 02:13
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('main_app', '0014_recipesearchdocument'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AICall',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('mode', models.CharField(choices=[('complete', 'Complete'), ('stream', 'Stream'), ('batch', 'Batch'), ('job', 'Job')], max_length=8)),
+                ('cache_status', models.CharField(choices=[('hit', 'AI cache hit'), ('miss', 'AI cache miss'), ('bypass', 'AI cache bypassed'), ('match', 'Saved recipe match')], max_length=6)),
+                ('outcome', models.CharField(choices=[('ok', 'OK'), ('parse_error', 'Parse error'), ('error', 'Error'), ('busy', 'LLM busy'), ('cancelled', 'Cancelled')], default='ok', max_length=11)),
+                ('backend', models.CharField(blank=True, max_length=30)),
+                ('model', models.CharField(blank=True, max_length=50)),
+                ('prompt', models.CharField(blank=True, max_length=200)),
+                ('variants', models.PositiveSmallIntegerField(default=1)),
+                ('prompt_tokens', models.PositiveIntegerField(default=0)),
+                ('completion_tokens', models.PositiveIntegerField(default=0)),
+                ('cached_tokens', models.PositiveIntegerField(default=0)),
+                ('system_tokens', models.PositiveIntegerField(default=0)),
+                ('queue_ms', models.PositiveIntegerField(default=0)),
+                ('network_ms', models.PositiveIntegerField(default=0)),
+                ('parse_ms', models.PositiveIntegerField(default=0)),
+                ('total_ms', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['created_at'], name='aicall_created_idx'), models.Index(fields=['user', 'created_at'], name='aicall_user_created_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.25 on 2026-10-17 02:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0015_aicall'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='generationjob',
+            name='prompt',
+            field=models.TextField(blank=True),
+        ),
+    ]
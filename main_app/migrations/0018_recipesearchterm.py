@@ -0,0 +1,55 @@
+# Generated by Django 4.2.25 on 2026-10-17 02:38
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Frozen copy of RecipeSearchTerm.MAX_LENGTH
+MAX_TERM_LENGTH = 100
+
+
+def index_terms(apps, schema_editor):
+    """Fill the term index from the search documents saved so far."""
+    RecipeSearchDocument = apps.get_model("main_app", "RecipeSearchDocument")
+    RecipeSearchTerm = apps.get_model("main_app", "RecipeSearchTerm")
+    postings = []
+    documents = RecipeSearchDocument.objects.only("recipe_id", "user_id", "terms")
+    for document in documents.iterator(chunk_size=500):
+        postings.extend(
+            RecipeSearchTerm(
+                document_id=document.recipe_id, user_id=document.user_id, term=term
+            )
+            for term in {term[:MAX_TERM_LENGTH] for term in document.terms}
+        )
+        if len(postings) >= 5000:
+            RecipeSearchTerm.objects.bulk_create(postings)
+            postings = []
+    RecipeSearchTerm.objects.bulk_create(postings)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('main_app', '0017_generationjob_prompt'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=100)),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='postings', to='main_app.recipesearchdocument')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'term'], name='search_term_user_term_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='recipesearchterm',
+            constraint=models.UniqueConstraint(fields=('document', 'term'), name='search_term_unique'),
+        ),
+        migrations.RunPython(index_terms, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.25 on 2026-10-17 03:29
+
+from django.db import migrations, models
+import main_app.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0018_recipesearchterm'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(blank=True, null=True, upload_to=main_app.models.recipe_image_path),
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='notes',
+            field=models.TextField(blank=True, max_length=400),
+        ),
+    ]
@@ -1,8 +1,14 @@
+from django.conf import settings
 from django.db import models
+from django.db.models import F
 from django.contrib.auth.models import User
+from django.utils import timezone
+import datetime
 import uuid
 import os
 
+from .conversions import get_measurement_type
+
 
 def recipe_image_path(instance, filename):
     """
@@ -14,6 +20,11 @@ def recipe_image_path(instance, filename):
     return os.path.join('recipes', f'user_{instance.user.id}', unique_filename)
 
 
+def normalize_name(name):
+    """Matching key for item names: casefolded with whitespace collapsed."""
+    return " ".join(str(name or "").split()).casefold()
+
+
 class Recipe(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     title = models.CharField(max_length=100)
@@ -22,6 +33,12 @@ class Recipe(models.Model):
     image = models.ImageField(upload_to=recipe_image_path, blank=True, null=True)
     tags = models.JSONField(default=list, blank=True)
 
+    class Meta:
+        indexes = [
+            # Keyset pagination walks a user's recipes by id
+            models.Index(fields=["user", "id"], name="recipe_user_id_idx"),
+        ]
+
     def __str__(self):
         return self.title
 
@@ -62,6 +79,11 @@ class Ingredient(models.Model):
 
 
 class GroceryListItem(models.Model):
+    class MeasurementTypes(models.TextChoices):
+        VOLUME = "volume", "Volume"
+        WEIGHT = "weight", "Weight"
+        COUNT = "count", "Count"
+
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     name = models.CharField(max_length=100)
     quantity = models.FloatField()
@@ -69,12 +91,91 @@ class GroceryListItem(models.Model):
     weight_unit = models.CharField(max_length=10, blank=True, null=True)
     checked = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
-    
+    # Drives delta sync; bulk_update() and QuerySet.update() must set it
+    updated_at = models.DateTimeField(auto_now=True)
+    # Kept in sync with name and units on save; bulk writes must set them
+    normalized_name = models.CharField(max_length=100, blank=True, default="")
+    measurement_type = models.CharField(
+        max_length=10,
+        choices=MeasurementTypes.choices,
+        default=MeasurementTypes.COUNT,
+    )
+
+    class Meta:
+        indexes = [
+            # Keyset pagination walks a user's list newest first
+            models.Index(
+                fields=["user", "-created_at", "id"], name="grocery_user_created_idx"
+            ),
+            # Delta sync reads rows changed since a cursor
+            models.Index(fields=["user", "updated_at"], name="grocery_user_updated_idx"),
+        ]
+        constraints = [
+            # One item per name and measurement type; merges and concurrent
+            # adds upsert into it. Also serves (user, normalized_name) lookups.
+            models.UniqueConstraint(
+                fields=["user", "normalized_name", "measurement_type"],
+                name="grocery_unique_item",
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.normalized_name = normalize_name(self.name)
+        self.measurement_type = get_measurement_type(
+            self.volume_unit, self.weight_unit
+        )
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if "name" in update_fields:
+                update_fields.add("normalized_name")
+            if update_fields & {"volume_unit", "weight_unit"}:
+                update_fields.add("measurement_type")
+            kwargs["update_fields"] = update_fields
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.name} - {self.user.username}"
 
 
+class GroceryListTombstone(models.Model):
+    """Record of a deleted grocery item, so delta sync can report removals."""
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    item_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "deleted_at"], name="tombstone_user_deleted_idx"),
+        ]
+
+    def __str__(self):
+        return f"Deleted item {self.item_id} - user {self.user_id}"
+
+    @classmethod
+    def record(cls, user_id, item_ids):
+        """Tombstones for ``item_ids`` in a single INSERT."""
+        cls.objects.bulk_create(
+            [cls(user_id=user_id, item_id=item_id) for item_id in item_ids]
+        )
+
+    @staticmethod
+    def retention_cutoff():
+        """Tombstones before this are pruned; older sync cursors must resync."""
+        return timezone.now() - datetime.timedelta(
+            days=settings.GROCERY_TOMBSTONE_RETENTION_DAYS
+        )
+
+    @classmethod
+    def prune(cls, user_id=None):
+        """Delete tombstones past the retention window; returns how many."""
+        expired = cls.objects.filter(deleted_at__lt=cls.retention_cutoff())
+        if user_id is not None:
+            expired = expired.filter(user_id=user_id)
+        return expired.delete()[0]
+
+
 class Step(models.Model):
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name="steps")
     step = models.IntegerField()
@@ -82,3 +183,189 @@ class Step(models.Model):
 
     def __str__(self):
         return f"Step {self.step}: {self.description[:30]}"
+
+
+class CollectionVersion(models.Model):
+    """
+    Per-user version counters for the recipe and grocery list collections.
+    Bumped on every write so read endpoints can answer conditional GETs
+    without querying or serializing the collection itself.
+    """
+
+    RECIPES = "recipes"
+    GROCERY_LIST = "grocery_list"
+
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, related_name="collection_version"
+    )
+    recipes = models.PositiveBigIntegerField(default=0)
+    recipes_modified = models.DateTimeField(default=timezone.now)
+    grocery_list = models.PositiveBigIntegerField(default=0)
+    grocery_list_modified = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Versions for user {self.user_id}"
+
+    @classmethod
+    def bump(cls, user_id, collection):
+        """Increment ``collection``'s counter for ``user_id`` in the database."""
+        changes = {
+            collection: F(collection) + 1,
+            f"{collection}_modified": timezone.now(),
+        }
+        if not cls.objects.filter(user_id=user_id).update(**changes):
+            cls.objects.get_or_create(user_id=user_id)
+            cls.objects.filter(user_id=user_id).update(**changes)
+
+    @classmethod
+    def for_user(cls, user_id):
+        version, _ = cls.objects.get_or_create(user_id=user_id)
+        return version
+
+
+class GenerationJob(models.Model):
+    """A queued AI recipe generation, run by a worker outside the request."""
+
+    class Status(models.TextChoices):
+        QUEUED = "queued", "Queued"
+        RUNNING = "running", "Running"
+        SUCCEEDED = "succeeded", "Succeeded"
+        FAILED = "failed", "Failed"
+        CANCELLED = "cancelled", "Cancelled"
+
+    ACTIVE_STATUSES = (Status.QUEUED, Status.RUNNING)
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="generation_jobs"
+    )
+    status = models.CharField(
+        max_length=10, choices=Status.choices, default=Status.QUEUED
+    )
+    # The user's prompt as typed; messages hold it wrapped in the template
+    prompt = models.TextField(blank=True)
+    messages = models.JSONField()
+    cache_key = models.CharField(max_length=100, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "status"], name="job_user_status_idx"),
+            models.Index(fields=["status", "created_at"], name="job_status_created_idx"),
+        ]
+
+    def __str__(self):
+        return f"Generation job {self.id} ({self.status}) - user {self.user_id}"
+
+
+class RecipeSearchDocument(models.Model):
+    """
+    A recipe's entry in the local retrieval index (see recipe_search.py):
+    weighted term frequencies over its title, notes and ingredient names.
+    Rewritten whenever the recipe or its ingredients change.
+    """
+
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="search_document",
+    )
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    tags = models.JSONField(default=list, blank=True)
+    terms = models.JSONField(default=dict)
+    length = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"Search document for recipe {self.recipe_id}"
+
+
+class RecipeSearchTerm(models.Model):
+    """
+    One term of a RecipeSearchDocument. These rows are the inverted index:
+    a prompt loads only the documents sharing one of its terms.
+    """
+
+    # Longer words are cut to this in the index (and when looking them up)
+    MAX_LENGTH = 100
+
+    document = models.ForeignKey(
+        RecipeSearchDocument, on_delete=models.CASCADE, related_name="postings"
+    )
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    term = models.CharField(max_length=MAX_LENGTH)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "term"], name="search_term_user_term_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["document", "term"], name="search_term_unique"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.term!r} in recipe {self.document_id}"
+
+
+class AICall(models.Model):
+    """
+    One recipe generation request's LLM usage: tokens, where the time went
+    and whether a cache answered it. Append-only; see ai_usage.py.
+    """
+
+    class Mode(models.TextChoices):
+        COMPLETE = "complete", "Complete"
+        STREAM = "stream", "Stream"
+        BATCH = "batch", "Batch"
+        JOB = "job", "Job"
+
+    class CacheStatus(models.TextChoices):
+        HIT = "hit", "AI cache hit"
+        MISS = "miss", "AI cache miss"
+        BYPASS = "bypass", "AI cache bypassed"
+        MATCH = "match", "Saved recipe match"
+
+    class Outcome(models.TextChoices):
+        OK = "ok", "OK"
+        PARSE_ERROR = "parse_error", "Parse error"
+        ERROR = "error", "Error"
+        BUSY = "busy", "LLM busy"
+        CANCELLED = "cancelled", "Cancelled"
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    user = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
+    mode = models.CharField(max_length=8, choices=Mode.choices)
+    cache_status = models.CharField(max_length=6, choices=CacheStatus.choices)
+    outcome = models.CharField(
+        max_length=11, choices=Outcome.choices, default=Outcome.OK
+    )
+    backend = models.CharField(max_length=30, blank=True)
+    model = models.CharField(max_length=50, blank=True)
+    prompt = models.CharField(max_length=200, blank=True)
+    variants = models.PositiveSmallIntegerField(default=1)
+    prompt_tokens = models.PositiveIntegerField(default=0)
+    completion_tokens = models.PositiveIntegerField(default=0)
+    cached_tokens = models.PositiveIntegerField(default=0)
+    # Share of prompt_tokens spent on the system instructions (estimated)
+    system_tokens = models.PositiveIntegerField(default=0)
+    queue_ms = models.PositiveIntegerField(default=0)
+    network_ms = models.PositiveIntegerField(default=0)
+    parse_ms = models.PositiveIntegerField(default=0)
+    total_ms = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["created_at"], name="aicall_created_idx"),
+            models.Index(fields=["user", "created_at"], name="aicall_user_created_idx"),
+        ]
+
+    def __str__(self):
+        return f"AI call {self.id} ({self.mode}, {self.cache_status}) - user {self.user_id}"
@@ -0,0 +1,164 @@
+"""
+Process-wide OpenAI client.
+
+Building ``OpenAI()`` per request throws away its httpx connection pool, so
+every generation paid a fresh TCP + TLS handshake. The client here is built
+lazily on first use and shared by every thread of the process, keeping warm
+keep-alive connections to the API. Pool limits, timeouts and the retry policy
+come from the OPENAI_* settings.
+
+uvicorn (see start.sh) spawns its workers as fresh processes, so each builds
+its own client. A forked child, however, must not use a client created by
+its parent, since it would share the parent's sockets and locks. The client
+is dropped in every forked child (without closing the parent's connections)
+and rebuilt on first use.
+"""
+import datetime
+from email.utils import parsedate_to_datetime
+import itertools
+import os
+import random
+import threading
+import time
+
+import httpx
+from django.conf import settings
+from openai import OpenAI
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+# Responses worth retrying, as the OpenAI SDK's own retries do
+RETRY_STATUSES = frozenset({408, 409, 429, 500, 502, 503, 504})
+
+
+def _retry_after(headers):
+    """Seconds the API asked us to wait before retrying, or None."""
+    try:
+        return float(headers["retry-after-ms"]) / 1000
+    except (KeyError, ValueError):
+        pass
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return (retry_at - datetime.datetime.now(datetime.timezone.utc)).total_seconds()
+
+
+class RetryTransport(httpx.BaseTransport):
+    """
+    Retries failed connections, timeouts and retryable responses with capped
+    exponential backoff from the OPENAI_RETRY_* settings. It replaces the
+    SDK's own retries, which can only be tuned through private methods.
+    """
+
+    def __init__(self, transport, max_retries, initial_delay, max_delay):
+        self.transport = transport
+        self.max_retries = max_retries
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt, retry_after=None):
+        # Honour a reasonable Retry-After from the API, as the SDK does
+        if retry_after is not None and 0 < retry_after <= 60:
+            return retry_after
+        delay = min(self.initial_delay * 2.0 ** min(attempt, 1000), self.max_delay)
+        # Up to 25% jitter so retrying workers don't stampede together
+        return max(delay * (1 - 0.25 * random.random()), 0)
+
+    def handle_request(self, request):
+        for attempt in itertools.count():
+            try:
+                response = self.transport.handle_request(request)
+            except httpx.TransportError:
+                if attempt >= self.max_retries:
+                    raise
+                retry_after = None
+            else:
+                should_retry = response.headers.get("x-should-retry")
+                if attempt >= self.max_retries or should_retry == "false" or (
+                    should_retry != "true" and response.status_code not in RETRY_STATUSES
+                ):
+                    return response
+                retry_after = _retry_after(response.headers)
+                response.close()
+            time.sleep(self.delay(attempt, retry_after))
+
+    def close(self):
+        self.transport.close()
+
+
+def _build_client():
+    transport = RetryTransport(
+        httpx.HTTPTransport(
+            limits=httpx.Limits(
+                max_connections=settings.OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.OPENAI_KEEPALIVE_EXPIRY,
+            ),
+        ),
+        max_retries=settings.OPENAI_MAX_RETRIES,
+        initial_delay=settings.OPENAI_RETRY_INITIAL_DELAY,
+        max_delay=settings.OPENAI_RETRY_MAX_DELAY,
+    )
+    http_client = httpx.Client(
+        transport=transport,
+        timeout=httpx.Timeout(
+            connect=settings.OPENAI_CONNECT_TIMEOUT,
+            read=settings.OPENAI_READ_TIMEOUT,
+            write=settings.OPENAI_WRITE_TIMEOUT,
+            pool=settings.OPENAI_POOL_TIMEOUT,
+        ),
+        follow_redirects=True,
+    )
+    return OpenAI(
+        api_key=settings.OPENAI_API_KEY,
+        http_client=http_client,
+        timeout=http_client.timeout,
+        # Retries happen in the transport
+        max_retries=0,
+    )
+
+
+def get_openai_client():
+    """Return this process's shared OpenAI client, creating it on first use."""
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                _client = _build_client()
+                _client_pid = pid
+    return _client
+
+
+def close_openai_client():
+    """Close this process's client and its pooled connections (e.g. on shutdown)."""
+    global _client, _client_pid
+    with _client_lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = None
+        _client_pid = None
+
+
+def _forget_client_after_fork():
+    # The child shares the parent's sockets; drop the references without
+    # closing them so the parent's connections stay intact
+    global _client, _client_pid, _client_lock
+    _client = None
+    _client_pid = None
+    _client_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_client_after_fork)
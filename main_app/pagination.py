@@ -0,0 +1,38 @@
+"""
+Keyset (cursor) pagination for the list endpoints.
+
+Pagination is opt-in so existing clients keep receiving a plain list: a page is
+only returned when the request carries ``?cursor=`` or ``?page_size=``.
+
+DRF cursors record only the first ordering field. Rows that share its value
+are skipped with an offset, so a keyset lookup is exact only when that field
+is unique.
+"""
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class OptInCursorPagination(CursorPagination):
+    """Cursor pagination that only kicks in when the client asks for it."""
+
+    page_size_query_param = "page_size"
+
+    def __init__(self):
+        self.page_size = settings.API_PAGE_SIZE
+        self.max_page_size = settings.API_MAX_PAGE_SIZE
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if self.cursor_query_param not in params and self.page_size_query_param not in params:
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
+
+class RecipeCursorPagination(OptInCursorPagination):
+    ordering = ("id",)
+
+
+class GroceryListCursorPagination(OptInCursorPagination):
+    # The cursor keys on created_at. Items added in the same instant (e.g. by
+    # one recipe merge) are paged by an offset within that instant, in id order.
+    ordering = ("-created_at", "id")
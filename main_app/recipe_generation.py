@@ -0,0 +1,322 @@
+"""
+Recipe generation: prompt construction and the completion call (whole or
+streamed, through the LLM_BACKEND); completions are validated and normalised
+by recipe_schema.py. Shared by the synchronous generate_recipe view and
+background generation jobs.
+
+Given a CallStats, each entry point records the call's tokens and its time
+queued for an LLM slot, on the network and parsing (see ai_usage.py).
+"""
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+import json
+
+from django.conf import settings
+
+from .ai_cache import generation_cache_key
+from .ai_usage import CallStats
+from .llm_backends import get_llm_backend
+from .models import AICall
+from .recipe_schema import parse_recipes
+from .recipe_stream import RecipeStreamParser
+from .throttling import LLMBusy, llm_slot
+
+RECIPE_MODEL = "gpt-4o-mini"
+RECIPE_TEMPERATURE = 0.7
+
+TAG_LABEL_MAP = {
+    "contains_dairy": "No Dairy",
+    "contains_eggs": "No Eggs",
+    "contains_gluten": "Gluten Free",
+    "contains_nuts": "No Nuts",
+    "contains_shellfish": "No Shellfish",
+    "spicy": "Spicy",
+    "vegan": "Vegan",
+    "vegetarian": "Vegetarian",
+}
+
+
+TAG_INSTRUCTION_MAP = {
+    "contains_dairy": "Recipe must be dairy free; avoid milk, cheese, butter, yogurt, and any dairy-derived ingredients.",
+    "contains_eggs": "Recipe must be egg free; do not include eggs or products made with eggs.",
+    "contains_gluten": "Recipe must be gluten free; avoid wheat, barley, rye, and any gluten-containing ingredient.",
+    "contains_nuts": "Recipe must be nut free; exclude tree nuts, peanuts, and nut oils or flours.",
+    "contains_shellfish": "Recipe must exclude shellfish including shrimp, crab, lobster, and mollusks.",
+    "spicy": "Recipe should include notable heat or spice in at least one component.",
+    "vegan": "Recipe must be fully plant based and contain no animal products.",
+    "vegetarian": "Recipe must be vegetarian; no meat, poultry, or seafood.",
+}
+
+
+RECIPE_SYSTEM_INSTRUCTIONS = """
+    You are a professional chef and nutrition-focused recipe generator AI.
+    Your goal is to generate **delicious, realistic, step-by-step recipes** for a cooking app.
+    All responses must be **valid JSON only** — no text outside the JSON block.
+
+    Each recipe must include:
+    - title (string)
+    - notes (short description, 1–3 sentences about flavor and nutrition, total cook/prep time, macros for the recipe). Append this sentence to the end of the notes field: "DISCLAIMER: AI may mislabel dietary tags or ingredients. Always double-check ingredients and allergens before cooking."
+    - tags (list of lowercase strings, e.g. ["contains_dairy", "spicy"])
+    - ingredients (list of objects: {name, quantity, volume_unit, weight_unit})
+    - steps (list of objects: {step (int), description (string)})
+
+    Ingredient Rules:
+    - When it comes to volume/weight measurements, only use these allowed values:
+        AI_ALLOWED_VOLUME_UNITS = {"tsp", "tbsp", "fl_oz", "cup", "pt", "qt", "gal", "ml", "l"}
+        AI_ALLOWED_WEIGHT_UNITS = {"g", "kg", "oz", "lb"}
+    - It's okay to also use not volume/weight measurements, but if you don't then add it to the ingredient name with the syntax of "INGREDIENT-NAME (INGREDIENT-MEASUREMENT)"
+    - Each ingredient must include **either/none** volume_unit or weight_unit (never both).
+    - If a real-world ingredient doesn't use a measurable unit like "clove" or "slice", convert it into a measurable one (e.g., 1 garlic clove → 1 tsp minced garlic), or if that’s not possible, set both units to null and specify the non-measurable form directly in the ingredient name (e.g., "Garlic Clove", quantity: 1).
+
+    Tag Rules (VERY IMPORTANT):
+    - You must analyze the final ingredient list (and any allergens implied) against every tag in this allowed list and include ALL that apply, even if the user did not select them:
+        "no_dairy": recipe contains no dairy ingredients (milk, cheese, butter, yogurt, cream, ghee)
+        "no_eggs": recipe contains no egg-based ingredients
+        "no_gluten": recipe contains no wheat, barley, rye, or gluten-containing grains
+        "no_nuts": recipe contains no tree nuts or peanuts (including nut butters)
+        "no_shellfish": recipe contains no shellfish (shrimp, crab, lobster, mussels, clams, scallops, oysters, etc.)
+        "spicy": recipe has noticeable heat/spice from peppers, chili, hot sauce, etc.
+        "vegan": recipe contains zero animal products (no meat, poultry, seafood, dairy, eggs, honey, gelatin)
+        "vegetarian": recipe contains no meat, poultry, or seafood (dairy and eggs are acceptable)
+    - After building the recipe, double-check the ingredients and make sure the tags array reflects every applicable tag (add any missing ones, remove any that shouldn’t apply). Only use the exact tag values above (all lowercase, underscores). Do not invent new tag names.
+
+    **Cooking & Flavor Style:**
+    - Always include realistic cooking details:
+        - Mention time ranges, heat levels, and visual/tactile cues (“until golden”, “until thickened”).
+        - For meats: specify doneness cues, internal temperature, and flipping instructions.
+        - For grains or oats: specify exact cooking times and methods (e.g., “microwave on high for 90 seconds, stir, and rest 30 seconds”).
+        - For sauces/dressings: include whisking, blending, or reduction steps as appropriate.
+    - Recipes must taste balanced and delicious — combine herbs, spices, and sauces creatively but realistically.
+
+    **Output format:**  
+    Return only valid JSON following this structure.
+    
+    Example JSON (detailed):
+
+    {
+    "title": "Creamy Spicy Chicken Rice Bowl",
+    "notes": "A flavorful, high-protein rice bowl with tender chicken, sautéed spinach, and a creamy yogurt-sriracha sauce. Cook time: 20 minutes, prep time: 15 minutes. DISCLAIMER: AI may mislabel tags or ingredients; always double-check ingredients before cooking.",
+    "tags": ["contains_dairy", "spicy"],
+    "ingredients": [
+        {"name": "Chicken Breast", "quantity": 200, "weight_unit": "g", "volume_unit": null},
+        {"name": "Olive Oil", "quantity": 1, "weight_unit": null, "volume_unit": "tbsp"},
+        {"name": "Garlic Powder", "quantity": 0.5, "weight_unit": null, "volume_unit": "tsp"},
+        {"name": "Paprika", "quantity": 0.5, "weight_unit": null, "volume_unit": "tsp"},
+        {"name": "Cooked Rice", "quantity": 150, "weight_unit": "g", "volume_unit": null},
+        {"name": "Fresh Spinach", "quantity": 80, "weight_unit": "g", "volume_unit": null},
+        {"name": "Greek Yogurt", "quantity": 60, "weight_unit": "g", "volume_unit": null},
+        {"name": "Sriracha", "quantity": 1, "weight_unit": null, "volume_unit": "tbsp"},
+        {"name": "Salt", "quantity": 1, "weight_unit": null, "volume_unit": "tsp"},
+        {"name": "Black Pepper", "quantity": 0.5, "weight_unit": null, "volume_unit": "tsp"}
+    ],
+    "steps": [
+        {"step": 1, "description": "Pat the chicken dry and season both sides with salt, pepper, garlic powder, and paprika."},
+        {"step": 2, "description": "Heat olive oil in a skillet over medium-high heat. Add the chicken and sear for 5–6 minutes per side until golden and cooked through (internal temp 74°C / 165°F)."},
+        {"step": 3, "description": "Remove chicken and rest for 2–3 minutes before slicing thinly."},
+        {"step": 4, "description": "In the same pan, add spinach and sauté for 1–2 minutes until wilted."},
+        {"step": 5, "description": "In a bowl, mix Greek yogurt and sriracha until creamy and orange in color."},
+        {"step": 6, "description": "Assemble the bowl: layer rice, spinach, and sliced chicken. Drizzle the yogurt-sriracha sauce on top and serve warm."}
+    ]
+    """
+
+
+class RecipeParseError(ValueError):
+    """The completion was not a valid JSON recipe; ``raw`` holds its text."""
+
+    def __init__(self, raw):
+        super().__init__("Failed to parse AI response as JSON")
+        self.raw = raw
+
+
+def build_recipe_messages(user_prompt, tags, grocery_items):
+    """Chat messages asking for a recipe for ``user_prompt``."""
+    grocery_list_text = ", ".join(grocery_items) if grocery_items else None
+
+    tag_labels = [TAG_LABEL_MAP.get(tag, tag.replace("_", " ")) for tag in tags]
+    tag_instructions = [
+        TAG_INSTRUCTION_MAP.get(tag) for tag in tags if TAG_INSTRUCTION_MAP.get(tag)
+    ]
+
+    tags_text = ", ".join(tag_labels) if tag_labels else "no dietary tags"
+    instruction_text = " ".join(tag_instructions) if tag_instructions else ""
+
+    return [
+        {"role": "system", "content": RECIPE_SYSTEM_INSTRUCTIONS},
+        {
+            "role": "user",
+            "content": (
+                f"Generate a recipe based on this request: '{user_prompt}'. "
+                f"The recipe should align with these tags: '{tags_text}'. "
+                f"Dietary requirements: {instruction_text}"
+                + (
+                    f"\n\nHere's what the user currently has available in their grocery list: {grocery_list_text}."
+                    if grocery_list_text
+                    else ""
+                )
+                + "\n\nOnly use ingredients from the grocery list if provided, "
+                "and stay consistent with the format and tag rules above"
+            ),
+        },
+    ]
+
+
+def _outcome(error):
+    if isinstance(error, RecipeParseError):
+        return AICall.Outcome.PARSE_ERROR
+    if isinstance(error, LLMBusy):
+        return AICall.Outcome.BUSY
+    return AICall.Outcome.ERROR
+
+
+def _complete(messages, variants=1, stats=None):
+    """
+    One completion asking for ``variants`` choices (the API's ``n``), so the
+    prompt is sent and billed once. Returns the validated recipes; choices
+    that aren't valid recipes are dropped, and RecipeParseError is raised if
+    none are.
+    """
+    stats = stats or CallStats()
+    stats.set_messages(messages, RECIPE_MODEL)
+    with ExitStack() as slot:
+        with stats.timed("queue"):
+            slot.enter_context(llm_slot())
+        with stats.timed("network"):
+            texts = get_llm_backend().complete(
+                messages, RECIPE_MODEL, RECIPE_TEMPERATURE, n=variants, usage=stats.usage
+            )
+
+    with stats.timed("parse"):
+        results = parse_recipes(texts)
+    recipes = []
+    raw = ""
+    for text, result in zip(texts, results):
+        if isinstance(result, ValueError):
+            raw = text.strip()
+        else:
+            recipes.append(result)
+    if not recipes:
+        raise RecipeParseError(raw)
+    return recipes
+
+
+def complete_recipe(messages, stats=None):
+    """Generate a recipe in one call; raises RecipeParseError on bad JSON."""
+    try:
+        return _complete(messages, stats=stats)[0]
+    except Exception as e:
+        if stats is not None:
+            stats.outcome = _outcome(e)
+        raise
+    finally:
+        if stats is not None:
+            stats.save()
+
+
+def complete_recipe_batch(message_sets, variants=1, stats=None):
+    """
+    Generate ``variants`` recipes for each of ``message_sets``. Each set is one
+    completion with ``n=variants``; the sets run concurrently on up to
+    GENERATION_BATCH_CONCURRENCY threads sharing the pooled client. Returns,
+    in order, a list of recipes or the exception raised for each set.
+
+    ``stats``, if given, holds one CallStats per set.
+    """
+    record = stats is not None
+    stats = stats or [CallStats(mode=AICall.Mode.BATCH) for _ in message_sets]
+
+    def run(messages, call_stats):
+        try:
+            return _complete(messages, variants, call_stats)
+        except Exception as e:
+            call_stats.outcome = _outcome(e)
+            return e
+
+    if len(message_sets) == 1:
+        results = [run(message_sets[0], stats[0])]
+    else:
+        workers = min(settings.GENERATION_BATCH_CONCURRENCY, len(message_sets))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(run, message_sets, stats))
+    if record:
+        # Saved here rather than on the pool's threads, which would each open
+        # a database connection that is never closed
+        for call_stats in stats:
+            call_stats.save()
+    return results
+
+
+def stream_recipe(messages, should_stop=None, queue_timeout=0, stats=None):
+    """
+    Generate a recipe with a streamed completion, yielding ``(event, data)``
+    pairs as parts complete (see RecipeStreamParser) and finally
+    ``("done", recipe)``. Raises RecipeParseError on bad JSON, and LLMBusy
+    if no LLM slot frees up within ``queue_timeout`` seconds.
+
+    ``should_stop`` is polled between fragments; when it returns True the
+    completion is abandoned and the generator ends without ``done``.
+    """
+    record = stats is not None
+    stats = stats or CallStats(mode=AICall.Mode.STREAM)
+    stats.set_messages(messages, RECIPE_MODEL)
+    parser = RecipeStreamParser()
+    try:
+        with ExitStack() as slot:
+            with stats.timed("queue"):
+                slot.enter_context(llm_slot(queue_timeout))
+            fragments = get_llm_backend().stream(
+                messages, RECIPE_MODEL, RECIPE_TEMPERATURE, usage=stats.usage
+            )
+            try:
+                while True:
+                    # Time spent by the consumer between fragments isn't counted
+                    with stats.timed("network"):
+                        fragment = next(fragments, None)
+                    if fragment is None:
+                        break
+                    if should_stop is not None and should_stop():
+                        stats.outcome = AICall.Outcome.CANCELLED
+                        return
+                    with stats.timed("parse"):
+                        events = parser.feed(fragment)
+                    yield from events
+            finally:
+                fragments.close()
+
+        try:
+            with stats.timed("parse"):
+                events, recipe_json = parser.finish()
+        except ValueError:
+            raise RecipeParseError(parser.text.strip()) from None
+        yield from events
+        yield "done", recipe_json
+    except GeneratorExit:
+        stats.outcome = AICall.Outcome.CANCELLED
+        raise
+    except Exception as e:
+        stats.outcome = _outcome(e)
+        raise
+    finally:
+        if record:
+            stats.save()
+
+
+def replay_recipe(recipe_json):
+    """The ``(event, data)`` pairs stream_recipe would yield for a finished recipe."""
+    parser = RecipeStreamParser()
+    parser.feed(json.dumps(recipe_json))
+    events, recipe_json = parser.finish()
+    yield from events
+    yield "done", recipe_json
+
+
+def recipe_cache_key(user_prompt, tags, grocery_items):
+    """AI cache key for a request built by build_recipe_messages()."""
+    return generation_cache_key(
+        user_prompt,
+        tags,
+        grocery_items,
+        # Recipes from another backend (e.g. the fake) are never served
+        f"{settings.LLM_BACKEND}:{RECIPE_MODEL}",
+        RECIPE_TEMPERATURE,
+        RECIPE_SYSTEM_INSTRUCTIONS,
+    )
@@ -0,0 +1,194 @@
+"""
+Schema for AI-generated recipes.
+
+A completion is validated in a single pass by pydantic's compiled validator,
+which parses the JSON itself (with jiter) straight into plain dicts, rather
+than building Python objects with ``json.loads`` and walking them again. Only
+each ingredient goes through Python afterwards, to normalise it: quantities
+written as "1 1/2" or "½" become floats and units are mapped to canonical
+units through the alias table in conversions.py. Units that don't name a
+known unit move into the ingredient's name, e.g. "Garlic (cloves)", and so
+do quantities without a number, which become 1 as the prompt asks for
+non-measurable ingredients ("Salt (a pinch)"). Steps given as bare strings
+are numbered.
+"""
+from functools import lru_cache
+from typing import Annotated, Any, Optional, Union
+import math
+import unicodedata
+
+from pydantic import AfterValidator, ConfigDict, TypeAdapter
+from typing_extensions import NotRequired, TypedDict
+
+from .conversions import UNIT_ALIASES, VOLUME_TO_ML, canonical_unit
+
+DEFAULT_INGREDIENT_NAME = "Ingredient"
+# Ingredient.quantity can't be null
+DEFAULT_QUANTITY = 1.0
+
+
+def parse_quantity(value):
+    """
+    A float from numbers and strings like "2", "1/2", "1 1/2", "1½" or
+    "2-3" (the first number of a range); None when there is no number.
+    """
+    if value is None or isinstance(value, (int, float)):
+        return value
+    return _parse_quantity_text(str(value).strip())
+
+
+# Models reuse a handful of spellings ("1/2", "1 1/2", ...), so parse each once
+@lru_cache(maxsize=1024)
+def _parse_quantity_text(text):
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    for separator in ("-", "–", " to "):
+        text = text.split(separator, 1)[0]
+
+    total = None
+    for part in text.replace("⁄", "/").split():
+        amount = 0.0
+        digits = ""
+        for char in part:
+            if not char.isascii() and unicodedata.numeric(char, None) is not None:
+                amount += unicodedata.numeric(char)
+            else:
+                digits += char
+        if digits:
+            numerator, _, denominator = digits.partition("/")
+            try:
+                amount += float(numerator) / (float(denominator) if denominator else 1.0)
+            except (ValueError, ZeroDivisionError):
+                break
+        total = (total or 0.0) + amount
+    return total
+
+
+def normalize_ai_ingredient(ingredient):
+    """
+    A normalised copy of one AI ingredient dict (also used for streamed
+    list elements): a non-empty name, a float quantity (DEFAULT_QUANTITY
+    when none can be read) and canonical units, with units in the wrong
+    field moved across. Unknown units and quantity text without a number
+    are appended to the name.
+    """
+    if not isinstance(ingredient, dict):
+        return ingredient
+    name = ingredient.get("name")
+    name = (str(name).strip() if name is not None else "") or DEFAULT_INGREDIENT_NAME
+
+    notes = []
+    quantity = ingredient.get("quantity")
+    if not isinstance(quantity, (int, float)):
+        text = str(quantity).strip() if quantity is not None else ""
+        quantity = parse_quantity(text) if text else None
+        if quantity is None and text:
+            notes.append(text)
+    if quantity is None or not math.isfinite(quantity):
+        quantity = DEFAULT_QUANTITY
+
+    volume_unit = weight_unit = None
+    for raw_value in (ingredient.get("volume_unit"), ingredient.get("weight_unit")):
+        if raw_value is None:
+            continue
+        if not isinstance(raw_value, str):
+            raw_value = str(raw_value)
+        # Exact spellings ("cup", "tbsp") skip canonical_unit's cleanup
+        unit = UNIT_ALIASES.get(raw_value) or canonical_unit(raw_value)
+        if unit is None:
+            if raw_value.strip():
+                notes.append(raw_value.strip())
+        elif unit in VOLUME_TO_ML:
+            volume_unit = volume_unit or unit
+        else:
+            weight_unit = weight_unit or unit
+
+    return {
+        "name": f"{name} ({', '.join(notes)})" if notes else name,
+        "quantity": quantity,
+        "volume_unit": volume_unit,
+        "weight_unit": weight_unit,
+    }
+
+
+class AIIngredient(TypedDict):
+    __pydantic_config__ = ConfigDict(extra="ignore")
+
+    # Loosely typed: normalize_ai_ingredient coerces these
+    name: NotRequired[Any]
+    quantity: NotRequired[Union[float, str, None]]
+    volume_unit: NotRequired[Any]
+    weight_unit: NotRequired[Any]
+
+
+class AIStep(TypedDict):
+    __pydantic_config__ = ConfigDict(extra="ignore")
+
+    step: NotRequired[Optional[int]]
+    description: str
+
+
+class AIRecipe(TypedDict):
+    __pydantic_config__ = ConfigDict(extra="ignore")
+
+    title: str
+    notes: NotRequired[Optional[str]]
+    tags: NotRequired[Optional[list[str]]]
+    ingredients: NotRequired[
+        Optional[list[Annotated[AIIngredient, AfterValidator(normalize_ai_ingredient)]]]
+    ]
+    steps: NotRequired[Optional[list[Union[AIStep, str]]]]
+
+
+def _finish_recipe(recipe):
+    # Fill in what the model left out, number the steps, fix the key order
+    steps = []
+    for number, step in enumerate(recipe.get("steps") or [], start=1):
+        if isinstance(step, str):
+            step = {"step": number, "description": step}
+        elif step.get("step") is None:
+            step = {"step": number, "description": step["description"]}
+        steps.append(step)
+    return {
+        "title": recipe["title"],
+        "notes": recipe.get("notes") or "",
+        "tags": recipe.get("tags") or [],
+        "ingredients": recipe.get("ingredients") or [],
+        "steps": steps,
+    }
+
+
+_recipe_adapter = TypeAdapter(Annotated[AIRecipe, AfterValidator(_finish_recipe)])
+
+
+def _json_object(text):
+    # Drops code fences and any chatter around the object with one slice
+    start = text.find("{")
+    end = text.rfind("}")
+    return text[start:end + 1] if start != -1 and end > start else text
+
+
+def parse_recipe(text):
+    """
+    Parse and validate a completion into a recipe dict with its ingredients
+    normalised. Raises ValueError (a pydantic ValidationError) when it isn't
+    a valid recipe.
+    """
+    return _recipe_adapter.validate_json(_json_object(text))
+
+
+def parse_recipes(texts):
+    """
+    Batch form of parse_recipe: for each text, in order, the recipe dict or
+    the ValueError that rejected it.
+    """
+    validate = _recipe_adapter.validate_json
+    results = []
+    for text in texts:
+        try:
+            results.append(validate(_json_object(text)))
+        except ValueError as e:
+            results.append(e)
+    return results
@@ -0,0 +1,262 @@
+"""
+Local retrieval over saved recipes, checked by generate_recipe before it
+spends an OpenAI call.
+
+Each recipe has a RecipeSearchDocument holding weighted term frequencies for
+its title, ingredient names and notes. Documents are rewritten after any
+transaction that saves the recipe or one of its ingredients commits (see
+signals.py), so the index stays current one recipe at a time without
+rebuilds. ``manage.py index_recipes`` fills it for recipes saved before it
+existed.
+
+A prompt is scored against the user's recipes, plus those of the accounts in
+RECIPE_MATCH_SHARED_USERNAMES, with BM25. Scores are normalised to 0..1: the
+IDF-weighted share of the prompt's terms a recipe contains, each term's
+saturated frequency capped at what one mention in a document of average
+length earns. Recipes must carry every selected tag to match.
+
+Each document's terms are also rows of RecipeSearchTerm, an inverted index.
+A lookup reads only the postings for the prompt's terms. Those postings
+give the corpus statistics and each recipe's best possible score. Only
+recipes whose bound reaches the threshold are loaded and scored, at most
+RECIPE_MATCH_MAX_CANDIDATES of them.
+"""
+from collections import Counter, defaultdict
+import math
+import re
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from .models import Ingredient, Recipe, RecipeSearchDocument, RecipeSearchTerm
+
+# BM25 term frequency saturation and document length normalisation
+K1 = 1.2
+B = 0.75
+
+# A title word says more about a recipe than a word in its notes
+FIELD_WEIGHTS = {"title": 3, "ingredients": 2, "notes": 1}
+
+# Words that say how a prompt is asked rather than what is asked for
+STOPWORDS = frozenset(
+    """
+    a an and any are as at be but by can could do for from give have how i
+    idea ideas in into is it just like make me my of on or our please quick
+    recipe recipes some something that the this to usual want we what with
+    without would you your
+    """.split()
+)
+
+_WORD_RE = re.compile(r"[^\W\d_]+")
+
+
+def _stem(word):
+    """Fold simple English plurals so "oats" finds "oat" and "berries" "berry"."""
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and word.endswith("oes"):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def tokenize(text):
+    return [
+        _stem(word)
+        for word in _WORD_RE.findall(str(text or "").casefold())
+        if len(word) > 1 and word not in STOPWORDS
+    ]
+
+
+def index_recipe(recipe_id):
+    """Rewrite the search document for ``recipe_id`` from its current rows."""
+    recipe = (
+        Recipe.objects.filter(pk=recipe_id)
+        .only("id", "user_id", "title", "notes", "tags")
+        .first()
+    )
+    if recipe is None:
+        # Deleting the recipe deleted its document too
+        return
+    ingredient_names = Ingredient.objects.filter(recipe_id=recipe_id).values_list(
+        "name", flat=True
+    )
+
+    terms = Counter()
+    fields = {
+        "title": recipe.title,
+        "ingredients": " ".join(ingredient_names),
+        "notes": recipe.notes,
+    }
+    for field, text in fields.items():
+        for term in tokenize(text):
+            terms[term] += FIELD_WEIGHTS[field]
+
+    indexed = {term[: RecipeSearchTerm.MAX_LENGTH] for term in terms}
+    with transaction.atomic():
+        document, _ = RecipeSearchDocument.objects.update_or_create(
+            recipe_id=recipe.pk,
+            defaults={
+                "user_id": recipe.user_id,
+                "tags": recipe.tags if isinstance(recipe.tags, list) else [],
+                "terms": dict(terms),
+                "length": sum(terms.values()),
+            },
+        )
+        existing = set(document.postings.values_list("term", flat=True))
+        document.postings.filter(term__in=existing - indexed).delete()
+        # A concurrent reindex of the same recipe may add the same rows
+        RecipeSearchTerm.objects.bulk_create(
+            [
+                RecipeSearchTerm(document=document, user_id=recipe.user_id, term=term)
+                for term in indexed - existing
+            ],
+            ignore_conflicts=True,
+        )
+
+
+def _corpus_owner_ids(user):
+    owner_ids = {user.pk}
+    if settings.RECIPE_MATCH_SHARED_USERNAMES:
+        owner_ids.update(
+            User.objects.filter(
+                username__in=settings.RECIPE_MATCH_SHARED_USERNAMES
+            ).values_list("pk", flat=True)
+        )
+    return owner_ids
+
+
+def _inverse_document_frequencies(query_terms, frequencies, total):
+    return {
+        term: math.log(1 + (total - frequencies[term] + 0.5) / (frequencies[term] + 0.5))
+        for term in query_terms
+    }
+
+
+def score_documents(query_terms, documents, corpus=None):
+    """
+    Normalised BM25 score for each of ``documents`` (``(key, terms,
+    length)`` tuples). Returns ``{key: score}`` for documents sharing at
+    least one term with the query. The documents make up the corpus unless
+    ``corpus`` gives its ``(total, average_length, frequencies)``, with
+    ``frequencies`` counting the documents holding each query term.
+    """
+    query_terms = set(query_terms)
+    if not query_terms or not documents:
+        return {}
+
+    if corpus is None:
+        total = len(documents)
+        average_length = sum(length for _, _, length in documents) / total or 1.0
+        frequencies = Counter()
+        for _, terms, _ in documents:
+            frequencies.update(query_terms.intersection(terms))
+    else:
+        total, average_length, frequencies = corpus
+
+    idf = _inverse_document_frequencies(query_terms, frequencies, total)
+    # One mention in an average length document; more doesn't count extra
+    mention = FIELD_WEIGHTS["notes"]
+    ceiling = mention * (K1 + 1) / (mention + K1)
+    best_possible = sum(idf.values())
+
+    scores = {}
+    for key, terms, length in documents:
+        norm = K1 * (1 - B + B * length / average_length)
+        score = 0.0
+        for term in query_terms.intersection(terms):
+            frequency = terms[term]
+            saturation = frequency * (K1 + 1) / (frequency + norm)
+            score += idf[term] * min(saturation / ceiling, 1.0)
+        if score:
+            scores[key] = score / best_possible
+    return scores
+
+
+def _candidates(owner_ids, query_terms, threshold):
+    """
+    The corpus statistics for ``query_terms`` and the ids of the documents
+    that could score ``threshold``, best bound first, read from the term
+    index alone.
+    """
+    lookup = {term[: RecipeSearchTerm.MAX_LENGTH]: term for term in query_terms}
+    matched = defaultdict(set)
+    for recipe_id, term in RecipeSearchTerm.objects.filter(
+        user_id__in=owner_ids, term__in=lookup
+    ).values_list("document_id", "term"):
+        matched[recipe_id].add(lookup[term])
+    if not matched:
+        return None, []
+
+    corpus = RecipeSearchDocument.objects.filter(user_id__in=owner_ids).aggregate(
+        total=Count("pk"), length=Sum("length")
+    )
+    total = corpus["total"]
+    frequencies = Counter(term for terms in matched.values() for term in terms)
+    idf = _inverse_document_frequencies(query_terms, frequencies, total)
+    best_possible = sum(idf.values())
+
+    # Each term adds at most its IDF share, so this bounds the score. The
+    # slack keeps rounding from dropping a recipe that scores the threshold.
+    bounds = {
+        recipe_id: sum(idf[term] for term in terms) / best_possible
+        for recipe_id, terms in matched.items()
+    }
+    candidates = sorted(
+        (recipe_id for recipe_id, bound in bounds.items() if bound >= threshold - 1e-9),
+        key=lambda recipe_id: (-bounds[recipe_id], recipe_id),
+    )[: settings.RECIPE_MATCH_MAX_CANDIDATES]
+    return (total, (corpus["length"] or 0) / total or 1.0, frequencies), candidates
+
+
+def find_matching_recipes(user, prompt, tags=(), threshold=None, limit=None):
+    """
+    Saved recipes that match ``prompt`` well enough to stand in for a
+    generated one, best first, as ``[(recipe, score), ...]``. Recipes come
+    with their owner, ingredients and steps loaded.
+    """
+    if threshold is None:
+        threshold = settings.RECIPE_MATCH_THRESHOLD
+    if limit is None:
+        limit = settings.RECIPE_MATCH_LIMIT
+    query_terms = set(tokenize(prompt))
+    if not query_terms or limit <= 0:
+        return []
+
+    corpus, candidates = _candidates(_corpus_owner_ids(user), query_terms, threshold)
+    if not candidates:
+        return []
+    rows = RecipeSearchDocument.objects.filter(pk__in=candidates).values_list(
+        "recipe_id", "tags", "terms", "length"
+    )
+    required_tags = {str(tag) for tag in tags}
+    documents = [
+        (recipe_id, terms, length)
+        for recipe_id, recipe_tags, terms, length in rows
+        if required_tags.issubset(map(str, recipe_tags or []))
+    ]
+
+    # IDF comes from the whole corpus; the tag filter only narrows results
+    scores = score_documents(query_terms, documents, corpus)
+    best = sorted(
+        (
+            (score, recipe_id)
+            for recipe_id, score in scores.items()
+            if score >= threshold
+        ),
+        key=lambda match: (-match[0], match[1]),
+    )[:limit]
+    if not best:
+        return []
+
+    recipes = Recipe.objects.select_related("user").prefetch_related(
+        "ingredients", "steps"
+    ).in_bulk([recipe_id for _, recipe_id in best])
+    return [
+        (recipes[recipe_id], round(score, 3))
+        for score, recipe_id in best
+        if recipe_id in recipes
+    ]
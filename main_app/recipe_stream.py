@@ -0,0 +1,75 @@
+"""
+Incremental parsing of a streamed AI recipe.
+
+The completion arrives as fragments of one JSON object. After every fragment
+the text so far is re-parsed with jiter's partial mode, and each part of the
+recipe is reported as soon as it can no longer change: strings once their
+closing quote arrives, list elements once the next element (or the end of
+the list) has started, and other values once the next key has started.
+Ingredients are normalised (see recipe_schema.py) before they are reported,
+and the finished recipe is validated against the schema.
+"""
+import jiter
+
+from .recipe_schema import normalize_ai_ingredient, parse_recipe
+
+# Top-level lists whose elements are reported one at a time
+LIST_EVENTS = {"ingredients": "ingredient", "steps": "step"}
+
+
+class RecipeStreamParser:
+    """
+    Feed completion fragments to ``feed()`` and the end of the stream to
+    ``finish()``; both return ``(event, data)`` pairs for the newly
+    completed parts.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._sent_fields = set()
+        self._sent_items = {key: 0 for key in LIST_EVENTS}
+
+    def feed(self, fragment):
+        self.text += fragment
+        start = self.text.find("{")
+        if start == -1:
+            return []
+        try:
+            partial = jiter.from_json(self.text[start:].encode(), partial_mode=True)
+        except ValueError:
+            return []
+        if not isinstance(partial, dict):
+            return []
+        return self._events(partial, complete=False)
+
+    def finish(self):
+        """
+        Validate the whole completion and return ``(events, recipe)``;
+        raises ValueError if it isn't a valid recipe.
+        """
+        recipe = parse_recipe(self.text)
+        return self._events(recipe, complete=True), recipe
+
+    def _events(self, recipe, complete):
+        events = []
+        keys = list(recipe)
+        for position, key in enumerate(keys):
+            value = recipe[key]
+            # Anything before the last key is closed; so is everything at the end
+            closed = complete or position < len(keys) - 1
+
+            if key in LIST_EVENTS:
+                items = value if isinstance(value, list) else []
+                ready = len(items) if closed else len(items) - 1
+                for index in range(self._sent_items[key], max(ready, 0)):
+                    item = items[index]
+                    # The finished recipe was normalised as it was validated
+                    if key == "ingredients" and not complete and isinstance(item, dict):
+                        item = normalize_ai_ingredient(item)
+                    events.append((LIST_EVENTS[key], {"index": index, key[:-1]: item}))
+                self._sent_items[key] = max(self._sent_items[key], ready)
+            elif key not in self._sent_fields and (closed or isinstance(value, str)):
+                # Partial mode drops unterminated strings, so a string is final
+                self._sent_fields.add(key)
+                events.append((key, {key: value}))
+        return events
@@ -0,0 +1,94 @@
+"""
+Per-user server-side cache of rendered recipe payloads.
+
+Cache keys embed the user's CollectionVersion counter, which the signal
+receivers in ``signals.py`` bump on every save or delete of a Recipe,
+Ingredient or Step. A write therefore invalidates every cached payload for
+that user at once, in every worker; superseded entries are never read again
+and fall out through the cache backend's own bounded eviction (MAX_ENTRIES).
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.response import Response
+
+from .conditional import collection_version
+
+HITS_KEY = "response-cache:hits"
+MISSES_KEY = "response-cache:misses"
+
+
+def _cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def _timeout():
+    """
+    Cached payloads embed presigned image URLs, which may be handed out with
+    as little as SIGNED_URL_CACHE_SAFETY_MARGIN seconds left. Keep entries for
+    at most half of that so served URLs always have time to load.
+    """
+    timeout = settings.RESPONSE_CACHE_TIMEOUT
+    if getattr(settings, "AWS_QUERYSTRING_AUTH", False):
+        timeout = min(timeout, settings.SIGNED_URL_CACHE_SAFETY_MARGIN // 2)
+    return timeout
+
+
+def increment_counter(cache, key):
+    """Atomically bump a never-expiring counter in ``cache``."""
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Counter missing or evicted; start it again
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def response_cache_stats():
+    """Hit/miss counters for the response cache."""
+    counts = _cache().get_many([HITS_KEY, MISSES_KEY])
+    hits = counts.get(HITS_KEY, 0)
+    misses = counts.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": hits / total if total else 0.0,
+    }
+
+
+def response_cache_key(request, collection):
+    version = getattr(collection_version(request), collection)
+    path = hashlib.sha1(request.get_full_path().encode()).hexdigest()
+    return f"response:{collection}:{request.user.id}:{version}:{path}"
+
+
+class CachedResponseMixin:
+    """
+    Serve GET payloads from the response cache, keyed by user, collection
+    version and request path. Adds an ``X-Cache: HIT|MISS`` header.
+    """
+
+    cache_collection = None
+
+    def get(self, request, *args, **kwargs):
+        timeout = _timeout()
+        if not settings.RESPONSE_CACHE_ENABLED or timeout <= 0:
+            return super().get(request, *args, **kwargs)
+
+        key = response_cache_key(request, self.cache_collection)
+        data = _cache().get(key)
+        if data is not None:
+            increment_counter(_cache(), HITS_KEY)
+            response = Response(data)
+            response["X-Cache"] = "HIT"
+            return response
+
+        increment_counter(_cache(), MISSES_KEY)
+        response = super().get(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            _cache().set(key, response.data, timeout=timeout)
+        response["X-Cache"] = "MISS"
+        return response
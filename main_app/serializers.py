@@ -1,10 +1,19 @@
 import json
+import math
 
 from django.contrib.auth.models import User
 from django.contrib.auth.password_validation import validate_password
+from django.db import transaction
 from rest_framework import serializers
 
-from .models import Recipe, Ingredient, Step, GroceryListItem
+from .image_urls import signed_url
+from .models import (
+    Recipe,
+    Ingredient,
+    Step,
+    GroceryListItem,
+    GenerationJob,
+)
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -57,8 +66,60 @@ class GroceryListItemSerializer(serializers.ModelSerializer):
             "weight_unit",
             "checked",
             "created_at",
+            "updated_at",
         ]
-        read_only_fields = ["id", "user", "created_at"]
+        read_only_fields = ["id", "user", "created_at", "updated_at"]
+
+
+class GroceryListItemPatchSerializer(serializers.Serializer):
+    """One entry of a bulk grocery list PATCH."""
+
+    id = serializers.IntegerField()
+    checked = serializers.BooleanField(required=False)
+    quantity = serializers.FloatField(required=False, min_value=0)
+    volume_unit = serializers.ChoiceField(
+        choices=Ingredient.VolumeUnits.choices,
+        required=False,
+        allow_blank=True,
+        allow_null=True,
+    )
+    weight_unit = serializers.ChoiceField(
+        choices=Ingredient.WeightUnits.choices,
+        required=False,
+        allow_blank=True,
+        allow_null=True,
+    )
+
+    def validate_quantity(self, value):
+        # Like adding an item: inf or NaN would make the list unrenderable
+        if not math.isfinite(value):
+            raise serializers.ValidationError("Quantity must be a valid number.")
+        return value
+
+
+class GroceryListBulkPatchSerializer(serializers.ListSerializer):
+    child = GroceryListItemPatchSerializer()
+
+    def validate(self, attrs):
+        ids = [patch["id"] for patch in attrs]
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError("Each item may only appear once.")
+        return attrs
+
+
+class GenerationJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = GenerationJob
+        fields = [
+            "id",
+            "status",
+            "result",
+            "error",
+            "created_at",
+            "started_at",
+            "finished_at",
+        ]
+        read_only_fields = fields
 
 
 class StepSerializer(serializers.ModelSerializer):
@@ -67,12 +128,48 @@ class StepSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
+class NestedIngredientSerializer(IngredientSerializer):
+    """Ingredient written through its recipe; ``id`` identifies rows to update."""
+
+    id = serializers.IntegerField(required=False)
+
+    class Meta(IngredientSerializer.Meta):
+        read_only_fields = ["recipe"]
+
+
+class NestedStepSerializer(StepSerializer):
+    """Step written through its recipe; ``id`` identifies rows to update."""
+
+    id = serializers.IntegerField(required=False)
+
+    class Meta(StepSerializer.Meta):
+        read_only_fields = ["recipe"]
+
+
+# Fields needed to render a recipe card in the recipe grid
+RECIPE_SUMMARY_FIELDS = ("id", "title", "favorite", "tags", "image")
+
+# Nested relations writable through RecipeSerializer: related name -> model
+NESTED_RECIPE_RELATIONS = {"ingredients": Ingredient, "steps": Step}
+
+
 class RecipeSerializer(serializers.ModelSerializer):
-    ingredients = IngredientSerializer(many=True, read_only=True)
-    steps = StepSerializer(many=True, read_only=True)
+    ingredients = NestedIngredientSerializer(many=True, required=False)
+    steps = NestedStepSerializer(many=True, required=False)
     user = serializers.ReadOnlyField(source="user.username")
     image = serializers.ImageField(required=False, allow_null=True)
 
+    def __init__(self, *args, **kwargs):
+        """
+        Accept an optional ``fields`` iterable to render a sparse fieldset.
+        Nested serializers that are left out are never evaluated.
+        """
+        fields = kwargs.pop("fields", None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+
     class Meta:
         model = Recipe
         fields = [
@@ -92,6 +189,122 @@ class RecipeSerializer(serializers.ModelSerializer):
             "tags": {"required": False},
         }
 
+    def to_internal_value(self, data):
+        """
+        Multipart submissions (used for image uploads) carry nested
+        ingredients and steps as JSON strings, like tags.
+        """
+        for field_name in NESTED_RECIPE_RELATIONS:
+            value = data.get(field_name) if hasattr(data, "get") else None
+            if not isinstance(value, str):
+                continue
+            try:
+                parsed = json.loads(value) if value else []
+            except json.JSONDecodeError as exc:
+                raise serializers.ValidationError(
+                    {field_name: [f"Invalid JSON for {field_name}."]}
+                ) from exc
+            data = data.dict() if hasattr(data, "dict") else dict(data)
+            data[field_name] = parsed
+        return super().to_internal_value(data)
+
+    def validate(self, attrs):
+        """
+        A partial update skips required checks on nested rows too, but rows it
+        creates still need every required field.
+        """
+        if not self.partial or self.instance is None:
+            return attrs
+        errors = {}
+        for name, model in NESTED_RECIPE_RELATIONS.items():
+            if name not in attrs:
+                continue
+            existing_ids = set(
+                model.objects.filter(recipe=self.instance).values_list("id", flat=True)
+            )
+            required = [
+                field_name
+                for field_name, field in self.fields[name].child.fields.items()
+                if field.required and not field.read_only
+            ]
+            row_errors = [
+                {
+                    field_name: [serializers.Field.default_error_messages["required"]]
+                    for field_name in required
+                    if item.get("id") not in existing_ids and field_name not in item
+                }
+                for item in attrs[name]
+            ]
+            if any(row_errors):
+                errors[name] = row_errors
+        if errors:
+            raise serializers.ValidationError(errors)
+        return attrs
+
+    def create(self, validated_data):
+        nested = {
+            name: validated_data.pop(name)
+            for name in NESTED_RECIPE_RELATIONS
+            if name in validated_data
+        }
+        with transaction.atomic():
+            recipe = super().create(validated_data)
+            for name, items in nested.items():
+                model = NESTED_RECIPE_RELATIONS[name]
+                model.objects.bulk_create(
+                    model(recipe=recipe, **self._row_values(item)) for item in items
+                )
+        return recipe
+
+    def update(self, instance, validated_data):
+        nested = {
+            name: validated_data.pop(name)
+            for name in NESTED_RECIPE_RELATIONS
+            if name in validated_data
+        }
+        with transaction.atomic():
+            # Saving the recipe bumps its collection version for the whole batch
+            recipe = super().update(instance, validated_data)
+            for name, items in nested.items():
+                self._replace_related(recipe, name, items)
+        return recipe
+
+    @staticmethod
+    def _row_values(item):
+        return {key: value for key, value in item.items() if key != "id"}
+
+    def _replace_related(self, recipe, name, items):
+        """
+        Make ``recipe.<name>`` match ``items``: rows with a known ``id`` are
+        updated, the rest are created, and rows left out are deleted.
+        """
+        model = NESTED_RECIPE_RELATIONS[name]
+        existing = {row.id: row for row in model.objects.filter(recipe=recipe)}
+
+        to_update = []
+        to_create = []
+        update_fields = set()
+        for item in items:
+            values = self._row_values(item)
+            row = existing.pop(item.get("id"), None)
+            if row is None:
+                to_create.append(model(recipe=recipe, **values))
+                continue
+            for field, value in values.items():
+                setattr(row, field, value)
+            update_fields.update(values)
+            to_update.append(row)
+
+        if existing:
+            model.objects.filter(id__in=existing).delete()
+        if to_update and update_fields:
+            model.objects.bulk_update(to_update, sorted(update_fields))
+        if to_create:
+            model.objects.bulk_create(to_create)
+
+        # Drop rows prefetched by the view so the response shows the new state
+        getattr(recipe, "_prefetched_objects_cache", {}).pop(name, None)
+
     def validate_tags(self, value):
         """
         Accept JSON strings from multipart form submissions and convert to lists.
@@ -122,10 +335,12 @@ class RecipeSerializer(serializers.ModelSerializer):
 
     def to_representation(self, instance):
         data = super().to_representation(instance)
+        if "image" not in data:
+            return data
         if instance.image:
             storage = getattr(instance.image, "storage", None)
             if storage:
-                data["image"] = storage.url(instance.image.name)
+                data["image"] = signed_url(storage, instance.image.name)
             else:
                 data["image"] = instance.image.url
         else:
@@ -0,0 +1,128 @@
+"""
+Signal receivers that keep CollectionVersion counters and the recipe search
+index in step with writes.
+
+Bulk writes (``bulk_create``, ``bulk_update``, ``QuerySet.update``) do not
+send model signals; code paths that use them call ``CollectionVersion.bump``
+and ``publish_grocery_event`` directly. Grocery item ``QuerySet.delete()``
+callers record the tombstones themselves with one
+``GroceryListTombstone.record``. RecipeSerializer always saves the
+recipe itself, which reindexes it once its nested rows are committed.
+"""
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .events import publish_grocery_event
+from .models import (
+    CollectionVersion,
+    GroceryListItem,
+    GroceryListTombstone,
+    Ingredient,
+    Recipe,
+    Step,
+)
+from .recipe_search import index_recipe
+from .serializers import GroceryListItemSerializer
+
+
+def _cascaded_from(origin, *models):
+    """True when a row is removed by a cascade delete of one of ``models``."""
+    if isinstance(origin, QuerySet):
+        return origin.model in models
+    return isinstance(origin, models)
+
+
+def _first_from(origin, key):
+    """
+    A ``QuerySet.delete()`` sends post_delete once per row with the same
+    origin. Only the first row per ``key`` needs to bump a counter.
+    """
+    if not isinstance(origin, QuerySet):
+        return True
+    seen = origin.__dict__.setdefault("_bumped_versions", set())
+    if key in seen:
+        return False
+    seen.add(key)
+    return True
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, **kwargs):
+    CollectionVersion.bump(instance.user_id, CollectionVersion.RECIPES)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, origin=None, **kwargs):
+    # Deleting the account removes the counters along with the recipes
+    if _cascaded_from(origin, User) or not _first_from(origin, instance.user_id):
+        return
+    CollectionVersion.bump(instance.user_id, CollectionVersion.RECIPES)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_save, sender=Step)
+def recipe_child_saved(sender, instance, **kwargs):
+    CollectionVersion.bump(instance.recipe.user_id, CollectionVersion.RECIPES)
+
+
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_delete, sender=Step)
+def recipe_child_deleted(sender, instance, origin=None, **kwargs):
+    # The recipe's own post_delete already covers cascaded children
+    if _cascaded_from(origin, Recipe, User):
+        return
+    if not _first_from(origin, instance.recipe_id):
+        return
+    CollectionVersion.bump(instance.recipe.user_id, CollectionVersion.RECIPES)
+
+
+def _reindex_on_commit(recipe_id):
+    # After commit, so nested rows written in the same transaction are seen
+    transaction.on_commit(lambda: index_recipe(recipe_id))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved_reindex(sender, instance, raw=False, **kwargs):
+    if not raw:
+        _reindex_on_commit(instance.pk)
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_saved_reindex(sender, instance, raw=False, **kwargs):
+    if not raw:
+        _reindex_on_commit(instance.recipe_id)
+
+
+@receiver(post_delete, sender=Ingredient)
+def ingredient_deleted_reindex(sender, instance, origin=None, **kwargs):
+    # A deleted recipe takes its search document with it
+    if _cascaded_from(origin, Recipe, User):
+        return
+    if _first_from(origin, ("search", instance.recipe_id)):
+        _reindex_on_commit(instance.recipe_id)
+
+
+@receiver(post_save, sender=GroceryListItem)
+def grocery_item_saved(sender, instance, created=False, **kwargs):
+    CollectionVersion.bump(instance.user_id, CollectionVersion.GROCERY_LIST)
+    publish_grocery_event(
+        instance.user_id,
+        "created" if created else "updated",
+        GroceryListItemSerializer(instance).data,
+    )
+
+
+@receiver(post_delete, sender=GroceryListItem)
+def grocery_item_deleted(sender, instance, origin=None, **kwargs):
+    if _cascaded_from(origin, User):
+        return
+    # Delta sync clients learn about removals from tombstones; bulk deletes
+    # record theirs in one INSERT instead of one per row
+    if not isinstance(origin, QuerySet):
+        GroceryListTombstone.record(instance.user_id, [instance.id])
+    publish_grocery_event(instance.user_id, "deleted", {"id": instance.id})
+    if _first_from(origin, instance.user_id):
+        CollectionVersion.bump(instance.user_id, CollectionVersion.GROCERY_LIST)
@@ -1,3 +1,1528 @@
-from django.test import TestCase
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import datetime
+from fractions import Fraction
+import importlib
+import itertools
+import json
+import tempfile
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError, OperationalError, connection
+from django.test import (
+    AsyncClient,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+import httpx
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import conversions, events, image_urls, openai_client
+from .generation_jobs import run_job
+from .llm_backends import FakeLLMBackend, OpenAIBackend, get_llm_backend
+from .models import (
+    AICall,
+    GenerationJob,
+    GroceryListItem,
+    GroceryListTombstone,
+    Ingredient,
+    Recipe,
+    RecipeSearchDocument,
+    RecipeSearchTerm,
+    Step,
+)
+from .recipe_schema import parse_recipe, parse_recipes
+from .recipe_search import find_matching_recipes, index_recipe, score_documents, tokenize
+from .response_cache import response_cache_stats
+from .throttling import LLMBusy, check_shared_throttle_cache, llm_slot
+from .views import _encode_sync_cursor, merge_into_grocery_list, upsert_grocery_item
+
+
+class AuthenticatedTestCase(TestCase):
+    """A user and an API client signed in as them."""
+
+    def setUp(self):
+        self.user = User.objects.create_user("cook", "cook@example.com", "Secret123!")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def make_recipe(self, title="Pancakes", user=None, ingredients=2, steps=2):
+        recipe = Recipe.objects.create(user=user or self.user, title=title)
+        for number in range(ingredients):
+            Ingredient.objects.create(
+                recipe=recipe, name=f"Ingredient {number}", quantity=1, volume_unit="cup"
+            )
+        for number in range(steps):
+            Step.objects.create(recipe=recipe, step=number + 1, description="Stir.")
+        return recipe
+
+
+@override_settings(
+    LLM_BACKEND="main_app.llm_backends.FakeLLMBackend",
+    LLM_FAKE_FIRST_TOKEN_SECONDS=0,
+    LLM_FAKE_CHARS_PER_SECOND=0,
+    RECIPE_MATCH_MODE="off",
+)
+class GenerationTestCase(AuthenticatedTestCase):
+    """Recipe generation against the fake LLM backend, counting its calls."""
+
+    def setUp(self):
+        super().setUp()
+        # Throttle buckets and cached recipes outlive a test in LocMemCache
+        caches["throttle"].clear()
+        caches["ai"].clear()
+        patcher = mock.patch.object(
+            FakeLLMBackend, "complete", autospec=True, side_effect=FakeLLMBackend.complete
+        )
+        self.llm_complete = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def generate(self, path="/recipes/generate/", **body):
+        return self.client.post(path, {"prompt": "overnight oats", **body}, format="json")
+
+
+# The response cache would answer repeat reads without touching the database
+@override_settings(RESPONSE_CACHE_ENABLED=False)
+class RecipeQueryCountTests(AuthenticatedTestCase):
+    # Collection version, recipes with their owner, ingredients, steps
+    LIST_QUERIES = 4
+    DETAIL_QUERIES = 4
+
+    def assertListQueries(self, recipe_count):
+        for index in range(recipe_count - Recipe.objects.count()):
+            self.make_recipe(f"Recipe {index}")
+        with self.assertNumQueries(self.LIST_QUERIES):
+            response = self.client.get("/recipes/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), recipe_count)
+
+    def test_list_queries_do_not_grow_with_recipes(self):
+        self.assertListQueries(1)
+        self.assertListQueries(50)
+
+    def test_detail_queries_do_not_grow_with_ingredients(self):
+        for count in (1, 50):
+            recipe = self.make_recipe(ingredients=count, steps=count)
+            with self.assertNumQueries(self.DETAIL_QUERIES):
+                response = self.client.get(f"/recipes/{recipe.id}/")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json()["ingredients"]), count)
+
+
+class SparseFieldsetTests(AuthenticatedTestCase):
+    def test_summary_view_renders_cards_without_nested_queries(self):
+        self.make_recipe(ingredients=3, steps=3)
+        # Collection version, recipes
+        with self.assertNumQueries(2):
+            response = self.client.get("/recipes/", {"view": "summary"})
+        self.assertEqual(
+            set(response.json()[0]), {"id", "title", "favorite", "tags", "image"}
+        )
+
+    def test_fields_selects_the_requested_fields_and_always_the_id(self):
+        recipe = self.make_recipe(steps=2)
+        response = self.client.get("/recipes/", {"fields": "title,steps"})
+        (rendered,) = response.json()
+        self.assertEqual(set(rendered), {"id", "title", "steps"})
+        self.assertEqual(rendered["id"], recipe.id)
+        self.assertEqual(len(rendered["steps"]), 2)
+
+    def test_unknown_fields_are_rejected(self):
+        response = self.client.get("/recipes/", {"fields": "title,calories"})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("calories", response.json()["fields"][0])
+
+    def test_writes_still_return_the_full_recipe(self):
+        response = self.client.post(
+            "/recipes/?view=summary", {"title": "Toast"}, format="json"
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertIn("ingredients", response.json())
+
+
+class ConditionalGetTests(AuthenticatedTestCase):
+    def test_unchanged_recipes_answer_not_modified_from_the_version_row(self):
+        self.make_recipe()
+        response = self.client.get("/recipes/")
+        with self.assertNumQueries(1):
+            revalidated = self.client.get("/recipes/", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(revalidated.status_code, 304)
+        revalidated = self.client.get(
+            "/recipes/", HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]
+        )
+        self.assertEqual(revalidated.status_code, 304)
+
+    def test_nested_changes_replace_the_recipe_etag(self):
+        recipe = self.make_recipe(ingredients=1)
+        etag = self.client.get(f"/recipes/{recipe.id}/")["ETag"]
+        Ingredient.objects.create(recipe=recipe, name="Salt", quantity=1)
+        response = self.client.get(f"/recipes/{recipe.id}/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["ingredients"]), 2)
+
+    def test_each_fieldset_gets_its_own_etag(self):
+        self.make_recipe()
+        full = self.client.get("/recipes/")["ETag"]
+        summary = self.client.get("/recipes/", {"view": "summary"}, HTTP_IF_NONE_MATCH=full)
+        self.assertEqual(summary.status_code, 200)
+
+    def test_grocery_list_changes_replace_its_etag(self):
+        etag = self.client.get("/grocery-list/")["ETag"]
+        self.assertEqual(
+            self.client.get("/grocery-list/", HTTP_IF_NONE_MATCH=etag).status_code, 304
+        )
+        GroceryListItem.objects.create(user=self.user, name="Milk", quantity=1)
+        self.assertEqual(
+            self.client.get("/grocery-list/", HTTP_IF_NONE_MATCH=etag).status_code, 200
+        )
+
+
+class ResponseCacheTests(AuthenticatedTestCase):
+    def setUp(self):
+        super().setUp()
+        caches["responses"].clear()
+
+    def test_repeat_reads_are_served_from_the_cache(self):
+        recipe = self.make_recipe()
+        for path in ("/recipes/", f"/recipes/{recipe.id}/"):
+            self.assertEqual(self.client.get(path)["X-Cache"], "MISS")
+            # Only the collection version is read on a hit
+            with self.assertNumQueries(1):
+                response = self.client.get(path)
+            self.assertEqual(response["X-Cache"], "HIT")
+
+    def test_nested_writes_invalidate_cached_recipes(self):
+        recipe = self.make_recipe(ingredients=1)
+        self.client.get("/recipes/")
+        self.client.post(
+            f"/recipes/{recipe.id}/ingredients/",
+            {"name": "Salt", "quantity": 1, "recipe": recipe.id},
+            format="json",
+        )
+        response = self.client.get("/recipes/")
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(len(response.json()[0]["ingredients"]), 2)
+
+    def test_entries_are_per_user(self):
+        self.make_recipe()
+        self.client.get("/recipes/")
+        other = User.objects.create_user("baker", "baker@example.com", "Secret123!")
+        self.client.force_authenticate(other)
+        response = self.client.get("/recipes/")
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.json(), [])
+
+    def test_missing_recipes_are_not_cached(self):
+        for _ in range(2):
+            self.assertEqual(self.client.get("/recipes/999/").status_code, 404)
+        self.assertEqual(response_cache_stats()["hits"], 0)
+
+
+class NestedRecipeWriteTests(AuthenticatedTestCase):
+    def payload(self, ingredients, steps):
+        return {
+            "title": "Soup",
+            "ingredients": [
+                {"name": f"  Ingredient   {number} ", "quantity": 1, "volume_unit": "cup"}
+                for number in range(ingredients)
+            ],
+            "steps": [
+                {"step": number + 1, "description": "Stir."} for number in range(steps)
+            ],
+        }
+
+    def test_create_writes_children_in_constant_queries(self):
+        # The first write also creates the user's collection version row
+        self.client.post("/recipes/", self.payload(1, 1), format="json")
+        counts = []
+        for size in (1, 20):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post("/recipes/", self.payload(size, size), format="json")
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(len(response.json()["ingredients"]), size)
+            self.assertEqual(len(response.json()["steps"]), size)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_invalid_children_create_nothing(self):
+        payload = self.payload(2, 1)
+        payload["ingredients"][1]["volume_unit"] = "bucket"
+        response = self.client.post("/recipes/", payload, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("ingredients", response.json())
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_failed_child_write_rolls_back_the_recipe(self):
+        with mock.patch.object(Step.objects, "bulk_create", side_effect=IntegrityError):
+            with self.assertRaises(IntegrityError):
+                self.client.post("/recipes/", self.payload(2, 2), format="json")
+        self.assertFalse(Recipe.objects.exists())
+        self.assertFalse(Ingredient.objects.exists())
+
+    def test_update_keeps_changes_adds_and_drops_children(self):
+        recipe = self.client.post("/recipes/", self.payload(3, 2), format="json").json()
+        kept = dict(recipe["ingredients"][0], quantity=5)
+        response = self.client.patch(
+            f"/recipes/{recipe['id']}/",
+            {"ingredients": [kept, {"name": "Salt", "quantity": 1}]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        quantities = {row["id"]: row["quantity"] for row in response.json()["ingredients"]}
+        self.assertEqual(quantities[kept["id"]], 5)
+        self.assertEqual(
+            sorted(Ingredient.objects.values_list("name", flat=True)),
+            sorted([kept["name"], "Salt"]),
+        )
+        # Relations left out of the payload are untouched
+        self.assertEqual(len(response.json()["steps"]), 2)
+
+    def test_partial_update_rejects_incomplete_new_children(self):
+        recipe = self.client.post("/recipes/", self.payload(1, 1), format="json").json()
+        kept = dict(recipe["ingredients"][0])
+        del kept["quantity"]
+        for name, rows, errors in (
+            ("ingredients", [kept, {"name": "Salt"}], [{}, {"quantity": mock.ANY}]),
+            ("steps", [{"description": "x"}], [{"step": mock.ANY}]),
+        ):
+            response = self.client.patch(
+                f"/recipes/{recipe['id']}/", {name: rows}, format="json"
+            )
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {name: errors})
+        self.assertEqual(Ingredient.objects.count(), 1)
+        self.assertEqual(Step.objects.count(), 1)
+
+    def test_multipart_accepts_children_as_json(self):
+        response = self.client.post(
+            "/recipes/",
+            {
+                "title": "Soup",
+                "ingredients": '[{"name": "Leek", "quantity": 2}]',
+                "steps": "[]",
+            },
+            format="multipart",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["ingredients"][0]["name"], "Leek")
+
+
+class PaginationTests(AuthenticatedTestCase):
+    def walk(self, url):
+        page = self.client.get(url).json()
+        pages = [page]
+        while page["next"]:
+            page = self.client.get(page["next"]).json()
+            pages.append(page)
+        return pages
+
+    def test_lists_stay_plain_unless_a_page_is_asked_for(self):
+        self.make_recipe()
+        GroceryListItem.objects.create(user=self.user, name="Milk", quantity=1)
+        self.assertIsInstance(self.client.get("/recipes/").json(), list)
+        self.assertIsInstance(self.client.get("/grocery-list/").json(), list)
+
+    def test_recipe_pages_cover_every_recipe_once_despite_inserts(self):
+        recipes = [self.make_recipe(f"Recipe {number}") for number in range(5)]
+        first = self.client.get("/recipes/", {"page_size": 2}).json()
+        # Offset pagination would repeat a recipe after this insert
+        self.make_recipe("Added while paging")
+        pages = [first] + self.walk(first["next"])
+        ids = [recipe["id"] for page in pages for recipe in page["results"]]
+        self.assertEqual(ids[:5], [recipe.id for recipe in recipes])
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual([len(page["results"]) for page in pages], [2, 2, 2])
+
+    @override_settings(API_MAX_PAGE_SIZE=3)
+    def test_grocery_pages_are_newest_first_and_capped(self):
+        now = timezone.now()
+        for number in range(5):
+            item = GroceryListItem.objects.create(user=self.user, name=f"Item {number}", quantity=1)
+            # Items added together share a timestamp; id breaks the tie
+            GroceryListItem.objects.filter(pk=item.pk).update(
+                created_at=now - datetime.timedelta(minutes=number // 2)
+            )
+        pages = self.walk("/grocery-list/?page_size=100")
+        self.assertEqual([len(page["results"]) for page in pages], [3, 2])
+        self.assertEqual(
+            [item["name"] for page in pages for item in page["results"]],
+            [f"Item {number}" for number in range(5)],
+        )
+
+
+class CountingStorage:
+    bucket_name = "recipes"
+
+    def __init__(self):
+        self.signatures = 0
+
+    def url(self, name):
+        self.signatures += 1
+        return f"https://recipes.s3.amazonaws.com/{name}?Signature={self.signatures}"
+
+
+class SignedUrlCacheTests(SimpleTestCase):
+    def setUp(self):
+        image_urls._local_cache.clear()
+        self.addCleanup(image_urls._local_cache.clear)
+        self.storage = CountingStorage()
+
+    def test_reuses_a_signature_until_it_is_about_to_expire(self):
+        url = image_urls.signed_url(self.storage, "oats.jpg")
+        self.assertEqual(image_urls.signed_url(self.storage, "oats.jpg"), url)
+        self.assertEqual(self.storage.signatures, 1)
+
+        expired = time.monotonic() + image_urls._local_cache.ttl + 1
+        with mock.patch("main_app.image_urls.time.monotonic", return_value=expired):
+            self.assertNotEqual(image_urls.signed_url(self.storage, "oats.jpg"), url)
+        self.assertEqual(self.storage.signatures, 2)
+
+    def test_evicts_the_least_recently_used_signature(self):
+        cache = image_urls.SignedUrlCache(max_entries=2, ttl=60)
+        cache.set("a", "url-a")
+        cache.set("b", "url-b")
+        cache.get("a")
+        cache.set("c", "url-c")
+        self.assertEqual([cache.get(key) for key in "abc"], ["url-a", None, "url-c"])
+
+    @override_settings(SIGNED_URL_CACHE_ALIAS="default")
+    def test_shared_cache_hands_signatures_to_other_workers(self):
+        caches["default"].clear()
+        self.addCleanup(caches["default"].clear)
+        url = image_urls.signed_url(self.storage, "oats.jpg")
+        # Another worker starts with an empty local cache
+        image_urls._local_cache.clear()
+        self.assertEqual(image_urls.signed_url(self.storage, "oats.jpg"), url)
+        self.assertEqual(self.storage.signatures, 1)
+
+
+class GroceryUpsertConcurrencyTests(TransactionTestCase):
+    THREADS = 8
+    ADDS_PER_THREAD = 10
+
+    def test_concurrent_adds_make_one_item_with_the_summed_quantity(self):
+        user = User.objects.create_user("cook", "cook@example.com", "Secret123!")
+        start = threading.Barrier(self.THREADS)
+
+        def retry_locked(func, *args):
+            # SQLite's shared in-memory test database reports contention as
+            # "table is locked" instead of waiting. Both helpers write in one
+            # transaction, which rolled back, so trying again is safe.
+            while True:
+                try:
+                    return func(*args)
+                except OperationalError as e:
+                    if "locked" not in str(e):
+                        raise
+
+        def add(thread):
+            try:
+                start.wait()
+                for number in range(self.ADDS_PER_THREAD):
+                    if (thread + number) % 2:
+                        retry_locked(upsert_grocery_item, user, "Eggs", 1, "", "")
+                    else:
+                        retry_locked(merge_into_grocery_list, user, [(" eggs ", 1, None, None)])
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(self.THREADS) as pool:
+            list(pool.map(add, range(self.THREADS)))
+
+        items = GroceryListItem.objects.filter(user=user)
+        self.assertEqual(items.count(), 1)
+        self.assertEqual(items.get().quantity, self.THREADS * self.ADDS_PER_THREAD)
+
+
+class GroceryMergeTests(AuthenticatedTestCase):
+    def add_unmergeable_saffron(self):
+        # Units written before they were validated can't be converted from
+        item = GroceryListItem.objects.create(user=self.user, name="Saffron", quantity=1)
+        GroceryListItem.objects.filter(pk=item.pk).update(
+            volume_unit="pinch", measurement_type="volume"
+        )
+        recipe = Recipe.objects.create(user=self.user, title="Paella")
+        Ingredient.objects.create(recipe=recipe, name="Saffron", quantity=1, volume_unit="tsp")
+        return recipe
+
+    def test_compatible_units_merge_into_one_item(self):
+        recipe = Recipe.objects.create(user=self.user, title="Pancakes")
+        Ingredient.objects.create(recipe=recipe, name="Milk", quantity=1, volume_unit="cup")
+        Ingredient.objects.create(recipe=recipe, name="milk", quantity=2, volume_unit="tbsp")
+        Ingredient.objects.create(recipe=recipe, name="Flour", quantity=1, weight_unit="kg")
+        GroceryListItem.objects.create(
+            user=self.user, name="FLOUR", quantity=100, weight_unit="g", checked=True
+        )
+
+        response = self.client.post(f"/grocery-list/add-recipe/{recipe.id}/")
+
+        self.assertEqual(response.status_code, 201)
+        items = {
+            item.normalized_name: item for item in GroceryListItem.objects.filter(user=self.user)
+        }
+        self.assertEqual(set(items), {"milk", "flour"})
+        self.assertAlmostEqual(items["milk"].quantity, 1.125, places=4)
+        self.assertEqual(items["milk"].volume_unit, "cup")
+        self.assertAlmostEqual(items["flour"].quantity, 1100)
+        self.assertEqual(items["flour"].weight_unit, "g")
+        # Buying more of a checked-off item puts it back on the list
+        self.assertFalse(items["flour"].checked)
+
+    def test_merge_queries_do_not_grow_with_ingredients(self):
+        counts = []
+        for size in (2, 20):
+            recipe = self.make_recipe(f"Recipe {size}", ingredients=size)
+            self.client.post(f"/grocery-list/add-recipe/{recipe.id}/")
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(f"/grocery-list/add-recipe/{recipe.id}/")
+            self.assertEqual(response.status_code, 201)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_unmergeable_units_get_a_separate_item(self):
+        recipe = self.add_unmergeable_saffron()
+        for _ in range(2):
+            response = self.client.post(f"/grocery-list/add-recipe/{recipe.id}/")
+            self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            sorted(
+                GroceryListItem.objects.filter(user=self.user).values_list(
+                    "name", "quantity", "volume_unit"
+                )
+            ),
+            [("Saffron", 1.0, "pinch"), ("Saffron (tsp)", 2.0, "tsp")],
+        )
+
+    def test_exhausted_retries_return_409(self):
+        recipe = self.make_recipe()
+        with mock.patch(
+            "main_app.views._merge_into_grocery_list_once", side_effect=IntegrityError
+        ):
+            response = self.client.post(f"/grocery-list/add-recipe/{recipe.id}/")
+        self.assertEqual(response.status_code, 409)
+
+    def test_unique_migration_renames_unmergeable_duplicates(self):
+        keeper = GroceryListItem.objects.create(
+            user=self.user, name="Saffron", quantity=1, volume_unit="tsp"
+        )
+        # A duplicate from before measurement types, in a unit that can't be converted
+        duplicate = GroceryListItem.objects.create(user=self.user, name="Saffron", quantity=2)
+        GroceryListItem.objects.filter(pk=duplicate.pk).update(volume_unit="pinch")
+        migration = importlib.import_module("main_app.migrations.0011_grocery_unique_item")
+        migration.merge_duplicate_items(apps, None)
+
+        duplicate.refresh_from_db()
+        self.assertEqual(duplicate.name, "Saffron (pinch)")
+        self.assertEqual(duplicate.measurement_type, "volume")
+        duplicate.checked = True
+        duplicate.save()  # Must not collide with the keeper
+        keeper.refresh_from_db()
+        self.assertEqual((keeper.name, keeper.quantity), ("Saffron", 1))
+
+
+class NormalizedNameTests(AuthenticatedTestCase):
+    def test_saves_keep_the_normalized_name_in_sync(self):
+        item = GroceryListItem.objects.create(user=self.user, name="  Olive   OIL ", quantity=1)
+        self.assertEqual(item.normalized_name, "olive oil")
+        item.name = "Extra Virgin Olive Oil"
+        item.save(update_fields=["name"])
+        item.refresh_from_db()
+        self.assertEqual(item.normalized_name, "extra virgin olive oil")
+
+    def test_added_items_merge_by_normalized_name(self):
+        GroceryListItem.objects.create(user=self.user, name="Olive oil", quantity=1)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                "/grocery-list/add-item/", {"name": "OLIVE  oil", "quantity": 2}, format="json"
+            )
+        self.assertEqual(response.status_code, 200)
+        (item,) = GroceryListItem.objects.filter(user=self.user)
+        self.assertEqual((item.name, item.quantity), ("Olive oil", 3))
+        # Matching is an equality lookup the index can serve
+        self.assertFalse(any("UPPER(" in query["sql"] for query in queries))
+
+    def test_backfill_migration_normalizes_existing_rows(self):
+        for name in ("Flour", "Salt"):
+            GroceryListItem.objects.create(user=self.user, name=name, quantity=1)
+        GroceryListItem.objects.filter(name="Flour").update(
+            name=" Brown  Sugar", normalized_name=""
+        )
+        migration = importlib.import_module("main_app.migrations.0010_normalized_names")
+        with mock.patch.object(migration, "BATCH_SIZE", 1):
+            migration.backfill_normalized_names(apps, None)
+        self.assertEqual(
+            sorted(GroceryListItem.objects.values_list("normalized_name", flat=True)),
+            ["brown sugar", "salt"],
+        )
+
+
+class MealPlanImportTests(AuthenticatedTestCase):
+    def import_plan(self, recipes):
+        return self.client.post("/grocery-list/add-recipes/", {"recipes": recipes}, format="json")
+
+    def test_aggregates_scaled_ingredients_across_recipes(self):
+        soup = self.make_recipe("Soup", ingredients=1)
+        stew = self.make_recipe("Stew", ingredients=1)
+        Ingredient.objects.create(recipe=stew, name="Ingredient 0", quantity=3, volume_unit="tbsp")
+
+        response = self.import_plan([{"id": soup.id, "multiplier": 2}, stew.id])
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["added"], 1)
+        (item,) = GroceryListItem.objects.filter(user=self.user)
+        # 2 x 1 cup + 1 cup + 3 tbsp
+        self.assertAlmostEqual(item.quantity, 3.1875, places=4)
+        self.assertEqual(item.volume_unit, "cup")
+
+    def test_queries_do_not_grow_with_recipes(self):
+        counts = []
+        for size in (1, 10):
+            recipes = [self.make_recipe(f"Recipe {number}") for number in range(size)]
+            with CaptureQueriesContext(connection) as queries:
+                response = self.import_plan([recipe.id for recipe in recipes])
+            self.assertEqual(response.status_code, 201)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_unknown_or_foreign_recipes_add_nothing(self):
+        mine = self.make_recipe()
+        other = User.objects.create_user("baker", "baker@example.com", "Secret123!")
+        theirs = self.make_recipe(user=other)
+
+        response = self.import_plan([mine.id, theirs.id, 999])
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(sorted(response.json()["missing"]), [theirs.id, 999])
+        self.assertFalse(GroceryListItem.objects.exists())
+
+    def test_rejects_malformed_multipliers(self):
+        recipe = self.make_recipe()
+        response = self.import_plan([{"id": recipe.id, "multiplier": "double"}])
+        self.assertEqual(response.status_code, 400)
+
+    def test_rejects_multipliers_that_overflow_quantities(self):
+        recipe = self.make_recipe()
+        for multiplier in ("1e400", 101):
+            response = self.import_plan([{"id": recipe.id, "multiplier": multiplier}])
+            self.assertEqual(response.status_code, 400)
+        Ingredient.objects.filter(recipe=recipe).update(quantity=1e308)
+        response = self.import_plan([{"id": recipe.id, "multiplier": 2}])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(GroceryListItem.objects.filter(user=self.user).exists())
+        self.assertEqual(self.client.get("/grocery-list/").status_code, 200)
+
+
+class GroceryBulkUpdateTests(AuthenticatedTestCase):
+    def add_items(self, count, prefix="Item"):
+        return [
+            GroceryListItem.objects.create(user=self.user, name=f"{prefix} {number}", quantity=1).id
+            for number in range(count)
+        ]
+
+    def patch(self, body):
+        return self.client.patch("/grocery-list/items/", body, format="json")
+
+    def test_checks_off_many_items_in_constant_queries(self):
+        counts = []
+        for size in (2, 20):
+            ids = self.add_items(size, prefix=f"Batch {size}")
+            with CaptureQueriesContext(connection) as queries:
+                response = self.patch([{"id": item_id, "checked": True} for item_id in ids])
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.json()), size)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+        self.assertFalse(GroceryListItem.objects.filter(checked=False).exists())
+
+    def test_unit_changes_update_the_measurement_type(self):
+        (item_id,) = self.add_items(1)
+        response = self.patch({"items": [{"id": item_id, "quantity": 3, "volume_unit": "cup"}]})
+        self.assertEqual(response.status_code, 200)
+        item = GroceryListItem.objects.get(id=item_id)
+        self.assertEqual((item.quantity, item.measurement_type), (3, "volume"))
+
+    def test_any_bad_item_rejects_the_whole_batch(self):
+        first, second = self.add_items(2)
+        cases = [
+            ([{"id": first, "checked": True}, {"id": 999, "checked": True}], 404),
+            ([{"id": first, "checked": True}, {"id": first, "checked": False}], 400),
+            ([{"id": first, "checked": True}, {"id": second, "volume_unit": "bucket"}], 400),
+        ]
+        for body, status_code in cases:
+            with self.subTest(body=body):
+                self.assertEqual(self.patch(body).status_code, status_code)
+        self.assertFalse(GroceryListItem.objects.filter(checked=True).exists())
+
+    def test_rejects_negative_or_non_finite_quantities(self):
+        (item,) = self.add_items(1)
+        for quantity in (-5, "inf", "nan"):
+            with self.subTest(quantity=quantity):
+                response = self.patch([{"id": item, "quantity": quantity}])
+                self.assertEqual(response.status_code, 400)
+        self.assertEqual(GroceryListItem.objects.get(id=item).quantity, 1)
+
+    def test_cannot_touch_another_users_items(self):
+        other = User.objects.create_user("baker", "baker@example.com", "Secret123!")
+        theirs = GroceryListItem.objects.create(user=other, name="Milk", quantity=1)
+        response = self.patch([{"id": theirs.id, "checked": True}])
+        self.assertEqual(response.status_code, 404)
+        theirs.refresh_from_db()
+        self.assertFalse(theirs.checked)
+
+
+class GroceryDeltaSyncTests(AuthenticatedTestCase):
+    def sync(self, cursor=""):
+        response = self.client.get("/grocery-list/", {"since": cursor})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_sync_returns_changes_and_deletions_since_the_cursor(self):
+        milk = GroceryListItem.objects.create(user=self.user, name="Milk", quantity=1)
+        bread = GroceryListItem.objects.create(user=self.user, name="Bread", quantity=1)
+        snapshot = self.sync()
+        self.assertTrue(snapshot["full"])
+        self.assertEqual(len(snapshot["items"]), 2)
+
+        self.client.patch(f"/grocery-list/item/{milk.id}/", {"checked": True}, format="json")
+        self.client.delete("/grocery-list/clear-checked/")
+        bread.quantity = 2
+        bread.save()
+
+        delta = self.sync(snapshot["cursor"])
+        self.assertFalse(delta["full"])
+        self.assertEqual([item["name"] for item in delta["items"]], ["Bread"])
+        self.assertEqual(delta["deleted"], [milk.id])
+
+    def test_clearing_checked_items_records_tombstones_in_one_insert(self):
+        for number in range(20):
+            GroceryListItem.objects.create(
+                user=self.user, name=f"Item {number}", quantity=1, checked=True
+            )
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.delete("/grocery-list/clear-checked/")
+        self.assertEqual(response.status_code, 200)
+        inserts = [
+            query["sql"]
+            for query in queries
+            if query["sql"].startswith('INSERT INTO "main_app_grocerylisttombstone"')
+        ]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(GroceryListTombstone.objects.filter(user=self.user).count(), 20)
+
+    @override_settings(GROCERY_TOMBSTONE_RETENTION_DAYS=30)
+    def test_cursors_older_than_retention_must_resync(self):
+        expired = timezone.now() - datetime.timedelta(days=31)
+        response = self.client.get("/grocery-list/", {"since": _encode_sync_cursor(expired)})
+        self.assertEqual(response.status_code, 410)
+        self.assertIn("resync", response.json()["detail"].lower())
+
+    @override_settings(GROCERY_TOMBSTONE_RETENTION_DAYS=30)
+    def test_prune_deletes_expired_tombstones(self):
+        GroceryListTombstone.record(self.user.id, [1, 2])
+        GroceryListTombstone.objects.filter(item_id=1).update(
+            deleted_at=timezone.now() - datetime.timedelta(days=31)
+        )
+        self.assertEqual(GroceryListTombstone.prune(), 1)
+        self.assertEqual(
+            list(GroceryListTombstone.objects.values_list("item_id", flat=True)), [2]
+        )
+
+
+class GroceryEventStreamTests(AuthenticatedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(setattr, events, "_broker", None)
+        events._broker = None
+
+    def ticket(self):
+        response = self.client.post("/grocery-list/events/ticket/")
+        self.assertEqual(response.status_code, 201)
+        return response.json()["ticket"]
+
+    def add_item(self, name):
+        with self.captureOnCommitCallbacks(execute=True):
+            GroceryListItem.objects.create(user=self.user, name=name, quantity=1)
+
+    async def open_stream(self, **params):
+        response = await AsyncClient().get("/grocery-list/events/", params)
+        self.assertEqual(response.status_code, 200)
+        stream = response.streaming_content
+        self.assertEqual(await anext(stream), b"retry: 3000\n\n")
+        return stream
+
+    async def test_stream_delivers_the_users_changes(self):
+        stream = await self.open_stream(ticket=await sync_to_async(self.ticket)())
+        try:
+            await sync_to_async(self.add_item)("Milk")
+            chunk = await asyncio.wait_for(anext(stream), 5)
+        finally:
+            await stream.aclose()
+        self.assertTrue(chunk.startswith(b"event: created\n"))
+        self.assertIn(b'"name": "Milk"', chunk)
+
+    @override_settings(GROCERY_EVENTS_HEARTBEAT_SECONDS=0)
+    async def test_idle_streams_get_heartbeats(self):
+        stream = await self.open_stream(ticket=await sync_to_async(self.ticket)())
+        try:
+            chunk = await asyncio.wait_for(anext(stream), 5)
+        finally:
+            await stream.aclose()
+        self.assertEqual(chunk, b": keep-alive\n\n")
+
+    async def test_stream_rejects_access_tokens_and_expired_tickets(self):
+        access_token = str(await sync_to_async(AccessToken.for_user)(self.user))
+        response = await AsyncClient().get("/grocery-list/events/", {"token": access_token})
+        self.assertEqual(response.status_code, 401)
+
+        ticket = await sync_to_async(self.ticket)()
+        with override_settings(GROCERY_EVENTS_TICKET_SECONDS=-1):
+            response = await AsyncClient().get("/grocery-list/events/", {"ticket": ticket})
+        self.assertEqual(response.status_code, 401)
+
+    @override_settings(
+        WEB_CONCURRENCY=2, GROCERY_EVENTS_BROKER="main_app.events.InProcessEventBroker"
+    )
+    def test_in_process_broker_is_refused_with_several_workers(self):
+        with self.assertRaises(ImproperlyConfigured):
+            events.get_broker()
+
+
+class FakePubSub:
+    """Async Redis pub/sub stand-in fed through ``messages``."""
+
+    def __init__(self):
+        self.commands = []
+        self.messages = asyncio.Queue()
+
+    async def subscribe(self, channel):
+        self.commands.append(("subscribe", channel))
+
+    async def unsubscribe(self, channel):
+        self.commands.append(("unsubscribe", channel))
+
+    async def get_message(self, ignore_subscribe_messages, timeout):
+        message = await self.messages.get()
+        if isinstance(message, Exception):
+            raise message
+        return message
+
+    async def aclose(self):
+        self.commands.append(("close",))
+
+
+class RedisEventBrokerTests(SimpleTestCase):
+    def setUp(self):
+        self.pubsub = FakePubSub()
+        patcher = mock.patch("redis.asyncio.Redis.from_url")
+        self.connect = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.connect.return_value.pubsub.return_value = self.pubsub
+        self.broker = events.RedisEventBroker("redis://localhost:6379/0")
+
+    async def test_streams_share_one_connection_per_process(self):
+        first, second, other = [
+            await self.broker.subscribe(user_id) for user_id in (1, 1, 2)
+        ]
+        await self.pubsub.messages.put(
+            {"type": "message", "channel": b"grocery-events:1", "data": b'{"type": "deleted"}'}
+        )
+        self.assertEqual(await first.get(), {"type": "deleted"})
+        self.assertEqual(await second.get(), {"type": "deleted"})
+        self.assertTrue(other.queue.empty())
+        for subscription in (first, second, other):
+            await subscription.close()
+        self.broker._reader.cancel()
+
+        self.assertEqual(self.connect.call_count, 1)
+        self.assertEqual(
+            self.pubsub.commands,
+            [
+                ("subscribe", "grocery-events:1"),
+                ("subscribe", "grocery-events:2"),
+                ("unsubscribe", "grocery-events:1"),
+                ("unsubscribe", "grocery-events:2"),
+            ],
+        )
+
+    async def test_a_lost_connection_ends_every_stream(self):
+        subscription = await self.broker.subscribe(1)
+        subscription.offer({"type": "deleted"})
+        with self.assertLogs("main_app.events", "ERROR"):
+            await self.pubsub.messages.put(ConnectionError())
+            with self.assertRaises(ConnectionError):
+                await asyncio.wait_for(subscription.get(), 5)
+        await subscription.close()
+        # The next stream opens a new connection
+        await self.broker.subscribe(1)
+        self.broker._reader.cancel()
+        self.assertEqual(self.connect.call_count, 2)
+
+
+class ConversionTests(SimpleTestCase):
+    QUANTITIES = (0.125, 1, 1.5, 3, 1 / 3, 250, 1e-6, 12345.678)
+
+    def unit_pairs(self):
+        for table in (conversions.VOLUME_TO_ML, conversions.WEIGHT_TO_GRAMS):
+            for from_unit, to_unit in itertools.product(table, repeat=2):
+                yield table, from_unit, to_unit
+
+    def test_results_are_the_float_nearest_the_exact_product(self):
+        for table, from_unit, to_unit in self.unit_pairs():
+            factor = Fraction(table[from_unit]) / Fraction(table[to_unit])
+            for quantity in self.QUANTITIES:
+                self.assertEqual(
+                    conversions.convert_quantity(quantity, from_unit, to_unit),
+                    float(Fraction(quantity) * factor),
+                    (quantity, from_unit, to_unit),
+                )
+
+    def test_round_trips_return_the_original_quantity(self):
+        for _, from_unit, to_unit in self.unit_pairs():
+            for quantity in self.QUANTITIES:
+                there = conversions.convert_quantity(quantity, from_unit, to_unit)
+                self.assertAlmostEqual(
+                    conversions.convert_quantity(there, to_unit, from_unit),
+                    quantity,
+                    delta=abs(quantity) * 1e-15,
+                )
+
+    def test_incompatible_or_unknown_units_raise(self):
+        for from_unit, to_unit in (("cup", "g"), ("lb", "ml"), ("pinch", "tsp"), ("", "")):
+            self.assertFalse(conversions.can_convert(from_unit, to_unit))
+            with self.assertRaises(ValueError):
+                conversions.convert_quantity(1, from_unit, to_unit)
+            with self.assertRaises(ValueError):
+                conversions.convert_many([1], [from_unit], [to_unit])
+
+    def test_batches_match_single_conversions(self):
+        pairs = [(from_unit, to_unit) for _, from_unit, to_unit in self.unit_pairs()]
+        batch = [
+            (quantity, *pair)
+            for quantity, pair in zip(itertools.cycle(self.QUANTITIES), pairs * 2)
+        ]
+        self.assertEqual(
+            conversions.convert_many(*zip(*batch)),
+            [conversions.convert_quantity(*row) for row in batch],
+        )
+        with self.assertRaises(ValueError):
+            conversions.convert_many([1, 2], ["cup"], ["ml"])
+
+    def test_aliases_resolve_to_canonical_units(self):
+        for spelling, unit in {
+            "Tablespoons": "tbsp",
+            "tbsp.": "tbsp",
+            "T": "tbsp",
+            "t": "tsp",
+            "fl. oz": "fl_oz",
+            "Fluid-Ounces": "fl_oz",
+            " grams ": "g",
+            "cup(s)": "cup",
+            "LBS": "lb",
+            "pinch": None,
+            # Grains, not grams
+            "gr": None,
+        }.items():
+            self.assertEqual(conversions.canonical_unit(spelling), unit, spelling)
+
+
+@override_settings(OPENAI_API_KEY="sk-test")
+class OpenAIClientTests(SimpleTestCase):
+    def setUp(self):
+        openai_client.close_openai_client()
+        self.addCleanup(openai_client.close_openai_client)
+
+    def test_every_thread_shares_one_pooled_client(self):
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            clients = set(map(id, pool.map(lambda _: openai_client.get_openai_client(), range(32))))
+        self.assertEqual(clients, {id(openai_client.get_openai_client())})
+
+    @override_settings(OPENAI_MAX_CONNECTIONS=7, OPENAI_READ_TIMEOUT=12)
+    def test_pool_and_timeouts_come_from_settings(self):
+        client = openai_client.get_openai_client()
+        pool = client._client._transport.transport._pool
+        self.assertEqual(pool._max_connections, 7)
+        self.assertEqual(client.timeout.read, 12)
+
+    def test_a_forked_worker_builds_its_own_client(self):
+        parent = openai_client.get_openai_client()
+        with mock.patch("main_app.openai_client.os.getpid", return_value=-1):
+            self.assertIsNot(openai_client.get_openai_client(), parent)
+
+    def test_retry_backoff_is_capped_and_honours_retry_after(self):
+        replies = iter([503, 502, 500, 200, 429, 200])
+
+        def reply(request):
+            status_code = next(replies)
+            headers = {"retry-after": "7"} if status_code == 429 else {}
+            return httpx.Response(status_code, headers=headers, json={})
+
+        transport = openai_client.RetryTransport(
+            httpx.MockTransport(reply), max_retries=3, initial_delay=1, max_delay=3
+        )
+        with httpx.Client(transport=transport) as client, mock.patch("time.sleep") as sleep:
+            for _ in range(2):
+                response = client.get("https://api.openai.com/v1/models")
+                self.assertEqual(response.status_code, 200)
+        delays = [call.args[0] for call in sleep.call_args_list]
+        self.assertEqual(len(delays), 4)
+        self.assertTrue(0.75 <= delays[0] <= 1)
+        self.assertTrue(1.5 <= delays[1] <= 2)
+        self.assertTrue(2.25 <= delays[2] <= 3)
+        self.assertEqual(delays[3], 7)
+
+
+@override_settings(
+    LLM_FAKE_FIRST_TOKEN_SECONDS=0.5,
+    LLM_FAKE_CHARS_PER_SECOND=10,
+    LLM_FAKE_CHUNK_CHARS=4,
+    LLM_FAKE_JITTER=0,
+)
+class LLMBackendTests(SimpleTestCase):
+    def write_recordings(self, entries):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = f"{directory.name}/recordings.json"
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(entries, f)
+        return path
+
+    def test_backend_follows_the_setting_and_is_reused(self):
+        with self.settings(LLM_BACKEND="main_app.llm_backends.FakeLLMBackend"):
+            backend = get_llm_backend()
+            self.assertIsInstance(backend, FakeLLMBackend)
+            self.assertIs(get_llm_backend(), backend)
+        with self.settings(LLM_BACKEND="main_app.llm_backends.OpenAIBackend"):
+            self.assertIsInstance(get_llm_backend(), OpenAIBackend)
+
+    def test_fake_backend_replays_recordings_in_turn(self):
+        path = self.write_recordings(['{"title": "Toast"}', {"title": "Soup"}])
+        backend = FakeLLMBackend()
+        usage = {}
+        with self.settings(LLM_FAKE_RECORDINGS=path), mock.patch("time.sleep"):
+            texts = backend.complete(
+                [{"role": "user", "content": "x" * 40}], "model", 0, n=3, usage=usage
+            )
+            streamed = "".join(backend.stream([], "model", 0))
+        self.assertEqual(
+            [json.loads(text)["title"] for text in [*texts, streamed]],
+            ["Toast", "Soup", "Toast", "Soup"],
+        )
+        self.assertEqual(usage["prompt_tokens"], 10)
+
+    def test_fake_backend_rejects_malformed_recordings(self):
+        path = self.write_recordings({"title": "Toast"})
+        with self.settings(LLM_FAKE_RECORDINGS=path), self.assertRaises(ValueError):
+            FakeLLMBackend().complete([], "model", 0)
+
+    def test_fake_stream_paces_its_fragments(self):
+        path = self.write_recordings(["abcdefghij"])
+        with self.settings(LLM_FAKE_RECORDINGS=path), mock.patch("time.sleep") as sleep:
+            fragments = list(FakeLLMBackend().stream([], "model", 0))
+        self.assertEqual(fragments, ["abcd", "efgh", "ij"])
+        # Time to first token, then four characters at ten a second
+        self.assertEqual([call.args[0] for call in sleep.call_args_list], [0.5, 0.4, 0.4])
+
+    def test_openai_stream_reports_usage_and_closes_abandoned_responses(self):
+        def chunk(content=None, usage=None):
+            delta = mock.Mock(content=content)
+            choices = [mock.Mock(delta=delta)] if content is not None else []
+            return mock.Mock(choices=choices, usage=usage)
+
+        completion = mock.MagicMock()
+        completion.__iter__.return_value = [
+            chunk("{"),
+            chunk("}"),
+            chunk(usage=mock.Mock(prompt_tokens=9, completion_tokens=2, prompt_tokens_details=None)),
+        ]
+        client = mock.Mock()
+        client.chat.completions.create.return_value = completion
+        usage = {}
+        with mock.patch("main_app.llm_backends.get_openai_client", return_value=client):
+            fragments = list(OpenAIBackend().stream([], "model", 0, usage=usage))
+            abandoned = OpenAIBackend().stream([], "model", 0)
+            next(abandoned)
+            abandoned.close()
+        self.assertEqual(fragments, ["{", "}"])
+        self.assertEqual(usage, {"prompt_tokens": 9, "completion_tokens": 2, "cached_tokens": 0})
+        self.assertEqual(completion.close.call_count, 2)
+
+
+class AICacheTests(GenerationTestCase):
+    def test_repeat_requests_are_served_from_the_cache(self):
+        first = self.generate()
+        second = self.generate(prompt="  Overnight  OATS ")
+        self.assertEqual((first.status_code, second.status_code), (200, 200))
+        self.assertEqual((first["X-Cache"], second["X-Cache"]), ("MISS", "HIT"))
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(self.llm_complete.call_count, 1)
+
+    def test_fresh_requests_bypass_the_cache(self):
+        self.generate()
+        self.assertEqual(self.generate("/recipes/generate/?fresh=1")["X-Cache"], "MISS")
+        self.assertEqual(self.llm_complete.call_count, 2)
+
+    @override_settings(AI_CACHE_VARIANTS=2)
+    def test_rotation_collects_variants_before_hitting(self):
+        statuses = [self.generate()["X-Cache"] for _ in range(3)]
+        self.assertEqual(statuses, ["MISS", "MISS", "HIT"])
+        self.assertEqual(self.llm_complete.call_count, 2)
+
+
+class BatchGenerationTests(GenerationTestCase):
+    def test_variants_come_from_one_completion_and_are_cached(self):
+        response = self.generate(variants=2)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()), {"variants"})
+        self.assertEqual(len(response.json()["variants"]), 2)
+        self.assertEqual(self.llm_complete.call_count, 1)
+        self.assertEqual(self.llm_complete.call_args.kwargs["n"], 2)
+        self.assertEqual(self.generate()["X-Cache"], "HIT")
+
+    def test_prompts_get_a_result_each_in_order(self):
+        fake_complete = self.llm_complete.side_effect
+
+        def complete(backend, messages, *args, n=1, **kwargs):
+            if "soup" in messages[-1]["content"]:
+                return ["Sorry, no."] * n
+            return fake_complete(backend, messages, *args, n=n, **kwargs)
+
+        self.llm_complete.side_effect = complete
+        response = self.generate(prompts=["oats", " soup "])
+        self.assertEqual(response.status_code, 200)
+        oats, soup = response.json()["results"]
+        self.assertEqual(set(oats), {"prompt", "variants"})
+        self.assertEqual((oats["prompt"], len(oats["variants"])), ("oats", 1))
+        self.assertEqual(
+            soup,
+            {"prompt": "soup", "error": "Failed to parse AI response as JSON", "raw": "Sorry, no."},
+        )
+
+    def test_batches_that_fail_entirely_are_server_errors(self):
+        self.llm_complete.side_effect = lambda backend, *args, n=1, **kwargs: ["Sorry, no."] * n
+        response = self.generate(variants=2)
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(set(response.json()), {"error", "raw"})
+        response = self.generate(prompts=["oats"])
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.json()["results"][0]["prompt"], "oats")
+
+
+class GenerationStreamTests(GenerationTestCase):
+    def read_events(self, response):
+        async def read():
+            return b"".join([chunk async for chunk in response.streaming_content])
+
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        retry, *blocks = async_to_sync(read)().decode().strip().split("\n\n")
+        self.assertEqual(retry, "retry: 3000")
+        events = []
+        for block in blocks:
+            name, data = block.split("\n")
+            events.append((name.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+        return events
+
+    def test_streams_each_part_then_the_finished_recipe(self):
+        events = self.read_events(self.generate(stream=True))
+        names = [name for name, _ in events]
+        self.assertEqual(names[0], "title")
+        self.assertEqual(names[-1], "done")
+        recipe = events[-1][1]
+        self.assertEqual(
+            [data["ingredient"] for name, data in events if name == "ingredient"],
+            recipe["ingredients"],
+        )
+        self.assertEqual(
+            [data["step"] for name, data in events if name == "step"], recipe["steps"]
+        )
+        # The finished recipe is what a plain request gets back
+        self.assertEqual(self.generate().json(), recipe)
+
+    def test_unparseable_completions_end_with_an_error_event(self):
+        reply = (fragment for fragment in ["Sorry, ", "no."])
+        with mock.patch.object(FakeLLMBackend, "stream", return_value=reply):
+            events = self.read_events(self.generate(stream=True))
+        self.assertEqual(events[-1][0], "error")
+        self.assertEqual(events[-1][1]["raw"], "Sorry, no.")
+
+
+class GenerationJobTests(GenerationTestCase):
+    def submit(self, **body):
+        response = self.generate("/recipes/generate/jobs/", **body)
+        self.assertEqual(response.status_code, 202)
+        return response.json()
+
+    def poll(self, job_id):
+        response = self.client.get(f"/recipes/generate/jobs/{job_id}/")
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_polling_follows_the_job_and_it_runs_once(self):
+        job = self.submit()
+        self.assertEqual((job["status"], job["result"]), ("queued", None))
+
+        self.assertTrue(run_job(job["id"]))
+        # A second pool or worker can't claim it again
+        self.assertFalse(run_job(job["id"]))
+
+        job = self.poll(job["id"])
+        self.assertEqual(job["status"], "succeeded")
+        self.assertIn("title", job["result"])
+        self.assertIsNotNone(job["finished_at"])
+        self.assertEqual(AICall.objects.filter(mode=AICall.Mode.JOB).count(), 1)
+
+    @override_settings(GENERATION_JOBS_PER_USER=2)
+    def test_users_are_limited_to_their_active_jobs(self):
+        first = self.submit()
+        self.submit()
+        response = self.generate("/recipes/generate/jobs/")
+        self.assertEqual(response.status_code, 429)
+
+        # Finished jobs free their slot
+        run_job(first["id"])
+        self.submit()
+
+    def test_cancelling_stops_a_job_but_not_a_finished_one(self):
+        job = self.submit()
+        response = self.client.delete(f"/recipes/generate/jobs/{job['id']}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["status"], "cancelled")
+        self.assertFalse(run_job(job["id"]))
+        self.assertEqual(self.poll(job["id"])["status"], "cancelled")
+
+        finished = self.submit()
+        run_job(finished["id"])
+        for job_id in (job["id"], finished["id"]):
+            response = self.client.delete(f"/recipes/generate/jobs/{job_id}/")
+            self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.poll(finished["id"])["status"], "succeeded")
+
+    def test_cached_recipes_finish_at_once_and_are_accounted(self):
+        self.generate()
+        job = self.submit()
+        self.assertEqual(job["status"], "succeeded")
+        call = AICall.objects.get(mode=AICall.Mode.JOB)
+        self.assertEqual(call.cache_status, AICall.CacheStatus.HIT)
+
+    def test_job_accounting_records_the_users_prompt(self):
+        response = self.generate("/recipes/generate/jobs/", prompt="Overnight oats, no nuts")
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json()["id"]
+
+        self.assertTrue(run_job(job_id))
+
+        job = GenerationJob.objects.get(pk=job_id)
+        self.assertEqual(job.status, GenerationJob.Status.SUCCEEDED)
+        call = AICall.objects.get(mode=AICall.Mode.JOB)
+        self.assertEqual(call.prompt, "Overnight oats, no nuts")
+        self.assertGreater(call.prompt_tokens, 0)
+
+
+@override_settings(THROTTLE_BUCKETS={"sign_in_username": (2, 1), "sign_in_account": (4, 1)})
+class SignInThrottleTests(AuthenticatedTestCase):
+    def setUp(self):
+        super().setUp()
+        caches["throttle"].clear()
+
+    def sign_in(self, password, address):
+        return APIClient().post(
+            "/users/sign-in/",
+            {"username": "cook", "password": password},
+            format="json",
+            REMOTE_ADDR=address,
+        ).status_code
+
+    def test_spamming_a_username_does_not_lock_its_owner_out(self):
+        statuses = [self.sign_in("guess", "203.0.113.7") for _ in range(3)]
+        self.assertEqual(statuses, [401, 401, 429])
+        self.assertEqual(self.sign_in("Secret123!", "198.51.100.2"), 200)
+
+    def test_guesses_spread_over_clients_are_limited_per_account(self):
+        statuses = [self.sign_in("guess", f"203.0.113.{number}") for number in range(5)]
+        self.assertEqual(statuses, [401] * 4 + [429])
+
+
+# Five tokens, refilled at one a minute: nothing refills during a test
+@override_settings(THROTTLE_BUCKETS={"generate_user": (5, 1)})
+class GenerateThrottleTests(GenerationTestCase):
+    def test_single_generations_spend_one_token_each(self):
+        statuses = [self.generate(fresh=True).status_code for _ in range(6)]
+        self.assertEqual(statuses, [200] * 5 + [429])
+
+    def test_batches_spend_one_token_per_recipe(self):
+        response = self.generate(prompts=["oats", "soup"], variants=2)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.generate(fresh=True).status_code, 200)
+        response = self.generate(fresh=True)
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response["Retry-After"]), 0)
+
+    def test_rejected_counts_are_charged_within_the_limits(self):
+        # Unparseable counts cost one token, oversized ones the most a batch can
+        self.assertEqual(self.generate(variants="many").status_code, 400)
+        self.assertEqual(self.generate(prompts="oats", variants=3).status_code, 400)
+        self.assertEqual(self.generate(fresh=True).status_code, 200)
+        self.assertEqual(self.generate(fresh=True).status_code, 429)
+        caches["throttle"].clear()
+        with override_settings(GENERATION_MAX_VARIANTS=4):
+            self.assertEqual(self.generate(variants=50).status_code, 400)
+        self.assertEqual(self.generate(fresh=True).status_code, 200)
+        self.assertEqual(self.generate(fresh=True).status_code, 429)
+
+    def test_batches_larger_than_the_bucket_need_it_full(self):
+        self.assertEqual(self.generate(fresh=True).status_code, 200)
+        response = self.generate(prompts=["oats", "soup", "stew"], variants=2)
+        self.assertEqual(response.status_code, 429)
+        # Waiting for the spent token to come back refills the bucket
+        self.assertLessEqual(int(response["Retry-After"]), 60)
+
+        caches["throttle"].clear()
+        response = self.generate(prompts=["oats", "soup", "stew"], variants=2)
+        self.assertEqual(response.status_code, 200)
+        response = self.generate(fresh=True)
+        self.assertEqual(response.status_code, 429)
+        # The sixth recipe went beyond the bucket, so the debt is two minutes
+        self.assertGreater(int(response["Retry-After"]), 60)
+
+
+@override_settings(LLM_MAX_CONCURRENCY=1)
+class LLMAdmissionTests(GenerationTestCase):
+    def test_generations_get_429_at_once_while_every_slot_is_taken(self):
+        with llm_slot(), mock.patch("main_app.throttling.time.sleep") as sleep:
+            response = self.generate()
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Retry-After", response)
+        sleep.assert_not_called()
+        self.assertEqual(self.generate().status_code, 200)
+
+    def test_background_callers_can_wait_for_a_slot(self):
+        held = llm_slot()
+        held.__enter__()
+        threading.Timer(0.1, held.__exit__, (None, None, None)).start()
+        with llm_slot(queue_timeout=5):
+            self.assertIsNotNone(caches["throttle"].get("llm-slot:0"))
+
+    def test_slots_held_by_other_workers_count(self):
+        # What another worker holding the only slot leaves in the shared cache
+        caches["throttle"].add("llm-slot:0", "other-worker")
+        with self.assertRaises(LLMBusy):
+            with llm_slot():
+                pass
+
+    def test_expired_leases_free_their_slot(self):
+        # A worker that died holding the slot never releases it
+        caches["throttle"].add("llm-slot:0", "dead-worker", timeout=0.01)
+        time.sleep(0.05)
+        with llm_slot():
+            self.assertIsNotNone(caches["throttle"].get("llm-slot:0"))
+        self.assertIsNone(caches["throttle"].get("llm-slot:0"))
+
+    @override_settings(WEB_CONCURRENCY=2)
+    def test_several_workers_need_a_shared_throttle_cache(self):
+        with self.assertRaises(ImproperlyConfigured):
+            check_shared_throttle_cache()
+        redis = {"BACKEND": "django.core.cache.backends.redis.RedisCache"}
+        with override_settings(CACHES={"throttle": redis}):
+            check_shared_throttle_cache()
+
+
+class RecipeMatchTests(GenerationTestCase):
+    def save_recipe(self, title, notes="", ingredients=()):
+        recipe = Recipe.objects.create(user=self.user, title=title, notes=notes)
+        for name in ingredients:
+            Ingredient.objects.create(recipe=recipe, name=name, quantity=1)
+        index_recipe(recipe.id)
+        return recipe
+
+    def setUp(self):
+        super().setUp()
+        self.oats = self.save_recipe("Overnight oats", ingredients=["Rolled oats", "Milk"])
+        self.save_recipe("Baked oats", notes="Like porridge, but baked.")
+        for number in range(20):
+            self.save_recipe(f"Lentil soup {number}", ingredients=["Lentils", "Carrot"])
+
+    @override_settings(RECIPE_MATCH_MODE="alongside")
+    def test_matches_come_alongside_the_generated_recipe(self):
+        response = self.generate()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("title", response.json())
+        self.assertEqual(
+            [match["id"] for match in response.json()["matches"]], [self.oats.id]
+        )
+        self.assertEqual(self.llm_complete.call_count, 1)
+
+    def test_instead_returns_matches_without_calling_the_model(self):
+        response = self.generate(match="instead")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.json()), ["matches"])
+        self.assertEqual(response["X-Recipe-Match"], "HIT")
+        self.assertEqual(self.llm_complete.call_count, 0)
+
+    def test_index_follows_recipe_edits(self):
+        self.oats.title = "Chia pudding"
+        self.oats.save()
+        index_recipe(self.oats.id)
+        self.assertEqual(
+            set(RecipeSearchTerm.objects.filter(document_id=self.oats.id).values_list("term", flat=True)),
+            {"chia", "pudding", "rolled", "oat", "milk"},
+        )
+        self.assertEqual(find_matching_recipes(self.user, "overnight oats"), [])
+
+    def test_only_recipes_sharing_a_term_are_scored(self):
+        with CaptureQueriesContext(connection) as queries:
+            matches = find_matching_recipes(self.user, "overnight oats", threshold=0)
+        loaded = [
+            query["sql"]
+            for query in queries
+            if '"main_app_recipesearchdocument"."terms"' in query["sql"]
+        ]
+        self.assertEqual(len(loaded), 1)
+        self.assertNotIn("Lentil", str(matches))
+
+        # Scores are the same as BM25 over the whole corpus
+        documents = [
+            (document.recipe_id, document.terms, document.length)
+            for document in RecipeSearchDocument.objects.all()
+        ]
+        expected = score_documents(tokenize("overnight oats"), documents)
+        self.assertEqual(
+            {recipe.id: score for recipe, score in matches},
+            {recipe_id: round(score, 3) for recipe_id, score in expected.items()},
+        )
+
+    @override_settings(RECIPE_MATCH_MAX_CANDIDATES=1)
+    def test_candidates_are_capped_best_bound_first(self):
+        matches = find_matching_recipes(self.user, "overnight oats", threshold=0)
+        self.assertEqual([recipe.id for recipe, _ in matches], [self.oats.id])
+
+
+class RecipeSchemaTests(AuthenticatedTestCase):
+    COMPLETION = """Here you go:
+```json
+{
+  "title": "Paella",
+  "tags": ["dinner"],
+  "ingredients": [
+    {"name": "Rice", "quantity": "1 1/2", "volume_unit": "Cups", "weight_unit": null},
+    {"name": "Olive oil", "quantity": "2-3", "volume_unit": "T.", "weight_unit": null},
+    {"name": "Paprika", "quantity": "½", "volume_unit": "t.", "weight_unit": null},
+    {"name": "Chicken", "quantity": 400, "volume_unit": "grams", "weight_unit": null},
+    {"name": "Garlic", "quantity": 3, "volume_unit": "cloves", "weight_unit": null},
+    {"name": "Saffron", "quantity": "a pinch", "volume_unit": null, "weight_unit": null},
+    {"name": "Lemon", "volume_unit": null, "weight_unit": null}
+  ],
+  "steps": ["Fry.", {"description": "Simmer."}]
+}
+```"""
+
+    def test_completions_are_validated_and_normalised(self):
+        recipe = parse_recipe(self.COMPLETION)
+        self.assertEqual(
+            [
+                (item["name"], item["quantity"], item["volume_unit"], item["weight_unit"])
+                for item in recipe["ingredients"]
+            ],
+            [
+                ("Rice", 1.5, "cup", None),
+                ("Olive oil", 2.0, "tbsp", None),
+                ("Paprika", 0.5, "tsp", None),
+                ("Chicken", 400, None, "g"),
+                ("Garlic (cloves)", 3, None, None),
+                ("Saffron (a pinch)", 1.0, None, None),
+                ("Lemon", 1.0, None, None),
+            ],
+        )
+        self.assertEqual(
+            recipe["steps"],
+            [{"step": 1, "description": "Fry."}, {"step": 2, "description": "Simmer."}],
+        )
+        self.assertEqual((recipe["notes"], recipe["tags"]), ("", ["dinner"]))
+
+    def test_case_sensitive_abbreviations_only_match_their_case(self):
+        spellings = {"T": "tbsp", "T.": "tbsp", "t": "tsp", "t.": "tsp", "TSP": "tsp"}
+        for spelling, unit in spellings.items():
+            self.assertEqual(conversions.canonical_unit(spelling), unit, spelling)
+
+    def test_invalid_recipes_are_rejected(self):
+        results = parse_recipes(
+            [self.COMPLETION, '{"ingredients": []}', '{"title": "Soup", "steps": [{}]}', "Sorry"]
+        )
+        self.assertIsInstance(results[0], dict)
+        for result in results[1:]:
+            self.assertIsInstance(result, ValueError)
+
+    def test_parsed_recipes_can_be_saved(self):
+        response = self.client.post("/recipes/", parse_recipe(self.COMPLETION), format="json")
+        self.assertEqual(response.status_code, 201, response.content)
+        saved = Ingredient.objects.get(recipe_id=response.json()["id"], name="Saffron (a pinch)")
+        self.assertEqual(saved.quantity, 1.0)
+
+
+class AIUsageTests(GenerationTestCase):
+    def stream(self, **body):
+        async def drain(response):
+            return [chunk async for chunk in response.streaming_content]
+
+        async_to_sync(drain)(self.generate(stream=True, **body))
+
+    def test_every_request_records_one_call(self):
+        self.generate()
+        self.generate()
+        self.stream(fresh=True)
+        self.generate(prompt="stew", variants=2)
+
+        calls = list(AICall.objects.order_by("id"))
+        self.assertEqual(
+            [(call.mode, call.cache_status, call.outcome) for call in calls],
+            [
+                ("complete", "miss", "ok"),
+                ("complete", "hit", "ok"),
+                ("stream", "bypass", "ok"),
+                ("batch", "bypass", "ok"),
+            ],
+        )
+        self.assertEqual(calls[1].prompt_tokens, 0)
+        for call in (calls[0], calls[2], calls[3]):
+            self.assertGreater(call.prompt_tokens, call.system_tokens)
+            self.assertGreater(call.system_tokens, 0)
+            self.assertGreaterEqual(call.total_ms, call.network_ms)
+        self.assertEqual(calls[3].variants, 2)
+
+    def test_accounting_failures_do_not_fail_generation(self):
+        with mock.patch.object(AICall.objects, "create", side_effect=OperationalError):
+            with self.assertLogs("main_app.ai_usage", "ERROR"):
+                response = self.generate()
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(AI_USAGE_ENABLED=False)
+    def test_accounting_can_be_switched_off(self):
+        self.generate()
+        self.assertFalse(AICall.objects.exists())
+
+    def test_usage_report_is_for_staff_only(self):
+        self.generate()
+        self.assertEqual(self.client.get("/ai-usage/").status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+
+        report = self.client.get("/ai-usage/", {"days": 1}).json()
+        call = AICall.objects.get()
+        self.assertEqual((report["global"]["calls"], report["global"]["llm_calls"]), (1, 1))
+        self.assertEqual(report["global"]["prompt_tokens"], call.prompt_tokens)
+        self.assertEqual(report["by_user"][0]["username"], "cook")
+        self.assertEqual(report["costliest_calls"][0]["prompt"], "overnight oats")
+
+        others = self.client.get("/ai-usage/", {"user": self.user.pk + 1}).json()
+        self.assertEqual(others["global"]["calls"], 0)
+        self.assertEqual(self.client.get("/ai-usage/", {"days": "week"}).status_code, 400)
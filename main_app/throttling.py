@@ -0,0 +1,250 @@
+"""
+Admission control for expensive endpoints.
+
+Token-bucket throttles: each scope in THROTTLE_BUCKETS is a bucket of
+``burst`` tokens refilled at ``per_minute`` tokens a minute, kept per user
+or per client IP in the THROTTLE_CACHE_ALIAS cache. The bucket is stored in
+GCRA form (one "theoretical arrival time" per key), so a check is one cache
+read and one write. Like DRF's own rate throttles the read-modify-write is
+not atomic; concurrent requests can occasionally slip one extra token.
+A request normally costs one token; generation requests cost one per recipe
+they ask for. A request costing more than ``burst`` is let through only when
+the bucket is full, and leaves it in debt until the cost is refilled.
+Rejected requests get 429 with a Retry-After header from DRF.
+
+LLM admission: at most LLM_MAX_CONCURRENCY completions run at once across
+every process sharing the THROTTLE_CACHE_ALIAS cache. Each slot is a cache
+key taken with an atomic ``add`` and leased for LLM_SLOT_LEASE_SECONDS, so
+a process that dies holding one doesn't keep it forever. A request that
+finds every slot taken is rejected at once with 429 and Retry-After rather
+than tying up its worker thread; only background jobs, which run on their
+own pool, wait for a slot.
+
+Both only hold across workers when that cache is shared (e.g. Redis);
+``check_shared_throttle_cache`` refuses a per-process cache when
+WEB_CONCURRENCY > 1.
+"""
+from contextlib import contextmanager
+import hashlib
+import math
+import random
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.throttling import BaseThrottle
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Base token-bucket throttle; subclasses set ``scope`` and ``get_ident_key``."""
+
+    scope = None
+
+    def __init__(self):
+        self.retry_after = None
+
+    def get_ident_key(self, request, view):
+        """Who the bucket belongs to, or None to skip throttling."""
+        raise NotImplementedError
+
+    def get_cost(self, request, view):
+        """Tokens the request takes from the bucket."""
+        return 1
+
+    def allow_request(self, request, view):
+        ident = self.get_ident_key(request, view)
+        if ident is None or self.scope not in settings.THROTTLE_BUCKETS:
+            return True
+
+        burst, per_minute = settings.THROTTLE_BUCKETS[self.scope]
+        if per_minute <= 0:
+            return True
+        interval = 60.0 / per_minute
+        cache = caches[settings.THROTTLE_CACHE_ALIAS]
+        key = f"throttle:{self.scope}:{ident}"
+
+        now = time.time()
+        start = max(cache.get(key, now), now)
+        arrival = start + self.get_cost(request, view) * interval
+        allowed_from = min(arrival - burst * interval, start)
+        if now < allowed_from:
+            self.retry_after = allowed_from - now
+            return False
+        cache.set(key, arrival, timeout=math.ceil(arrival - now) + 1)
+        return True
+
+    def wait(self):
+        return self.retry_after
+
+
+class UserTokenBucketThrottle(TokenBucketThrottle):
+    """One bucket per authenticated user, falling back to the client IP."""
+
+    def get_ident_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return f"user:{request.user.pk}"
+        return f"ip:{self.get_ident(request)}"
+
+
+class IPTokenBucketThrottle(TokenBucketThrottle):
+    """One bucket per client IP."""
+
+    def get_ident_key(self, request, view):
+        return self.get_ident(request)
+
+
+class RequestFieldTokenBucketThrottle(TokenBucketThrottle):
+    """
+    One bucket per value of a request field (e.g. the username being signed
+    into), so a distributed attack on one account is limited as well. With
+    ``per_client`` the bucket is per value and client IP instead.
+    """
+
+    field = None
+    per_client = False
+
+    def get_ident_key(self, request, view):
+        value = request.data.get(self.field) if hasattr(request.data, "get") else None
+        if not value:
+            return None
+        ident = str(value).strip().casefold()
+        if self.per_client:
+            ident = f"{ident}\n{self.get_ident(request)}"
+        # Hashed so arbitrary input makes a safe, bounded cache key
+        return hashlib.sha256(ident.encode()).hexdigest()
+
+
+class GenerationCostMixin:
+    """
+    Charge a generation request one token per recipe: ``variants`` for each
+    of its ``prompts``, within the GENERATION_MAX_* limits. Malformed counts
+    cost one token and are rejected by the view.
+    """
+
+    def get_cost(self, request, view):
+        data = request.data if hasattr(request.data, "get") else {}
+        prompts = data.get("prompts")
+        try:
+            variants = int(data.get("variants", 1))
+        except (TypeError, ValueError):
+            variants = 1
+        prompt_count = len(prompts) if isinstance(prompts, list) else 1
+        return max(1, min(variants, settings.GENERATION_MAX_VARIANTS)) * max(
+            1, min(prompt_count, settings.GENERATION_MAX_PROMPTS)
+        )
+
+
+class GenerateUserThrottle(GenerationCostMixin, UserTokenBucketThrottle):
+    scope = "generate_user"
+
+
+class GenerateIPThrottle(GenerationCostMixin, IPTokenBucketThrottle):
+    scope = "generate_ip"
+
+
+class SignInIPThrottle(IPTokenBucketThrottle):
+    scope = "sign_in_ip"
+
+
+class SignInUsernameThrottle(RequestFieldTokenBucketThrottle):
+    # Per client too, so spamming a username doesn't lock its owner out
+    scope = "sign_in_username"
+    field = "username"
+    per_client = True
+
+
+class SignInAccountThrottle(RequestFieldTokenBucketThrottle):
+    # Looser, across all clients, for guessing spread over many IPs
+    scope = "sign_in_account"
+    field = "username"
+
+
+class SignUpIPThrottle(IPTokenBucketThrottle):
+    scope = "sign_up_ip"
+
+
+class PasswordResetIPThrottle(IPTokenBucketThrottle):
+    scope = "password_reset_ip"
+
+
+class PasswordResetEmailThrottle(RequestFieldTokenBucketThrottle):
+    scope = "password_reset_email"
+    field = "email"
+
+
+class LLMBusy(APIException):
+    status_code = status.HTTP_429_TOO_MANY_REQUESTS
+    default_detail = "Recipe generation is busy. Please try again shortly."
+    default_code = "llm_busy"
+
+    def __init__(self, detail=None, wait=None):
+        super().__init__(detail)
+        # DRF turns ``wait`` into a Retry-After header
+        self.wait = settings.LLM_RETRY_AFTER_SECONDS if wait is None else wait
+
+
+# Cache backends whose data lives inside a single process
+PROCESS_LOCAL_CACHE_BACKENDS = (
+    "django.core.cache.backends.dummy.DummyCache",
+    "django.core.cache.backends.locmem.LocMemCache",
+)
+
+# How often a background job waiting for an LLM slot checks for a free one
+SLOT_POLL_SECONDS = 0.05
+
+
+def check_shared_throttle_cache():
+    """
+    Raise ImproperlyConfigured when several workers would each keep their own
+    token buckets and LLM slots, multiplying every limit by WEB_CONCURRENCY.
+    """
+    backend = settings.CACHES[settings.THROTTLE_CACHE_ALIAS]["BACKEND"]
+    if settings.WEB_CONCURRENCY > 1 and backend in PROCESS_LOCAL_CACHE_BACKENDS:
+        raise ImproperlyConfigured(
+            f"THROTTLE_CACHE_ALIAS {settings.THROTTLE_CACHE_ALIAS!r} uses {backend}, "
+            f"which each of the {settings.WEB_CONCURRENCY} workers keeps "
+            f"separately. Point it at a shared cache such as Redis."
+        )
+
+
+def _take_llm_slot(cache, holder):
+    """Lease a free slot to ``holder`` and return its key, or None."""
+    keys = [f"llm-slot:{number}" for number in range(settings.LLM_MAX_CONCURRENCY)]
+    taken = cache.get_many(keys)
+    free = [key for key in keys if key not in taken]
+    # Spread concurrent callers over the free slots instead of racing for one
+    random.shuffle(free)
+    for key in free:
+        if cache.add(key, holder, timeout=settings.LLM_SLOT_LEASE_SECONDS):
+            return key
+    return None
+
+
+@contextmanager
+def llm_slot(queue_timeout=0):
+    """
+    Hold one of the LLM_MAX_CONCURRENCY completion slots. Raises LLMBusy
+    when none is free, after waiting up to ``queue_timeout`` seconds for one.
+    Requests don't wait: sleeping here would hold a worker thread.
+    """
+    cache = caches[settings.THROTTLE_CACHE_ALIAS]
+    holder = uuid.uuid4().hex
+    deadline = time.monotonic() + max(queue_timeout, 0)
+    while True:
+        key = _take_llm_slot(cache, holder)
+        if key is not None:
+            break
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise LLMBusy()
+        time.sleep(min(SLOT_POLL_SECONDS, remaining))
+    try:
+        yield
+    finally:
+        # A slot whose lease ran out may already belong to another call
+        if cache.get(key) == holder:
+            cache.delete(key)
@@ -14,7 +14,9 @@ from .views import (
     StepDetail,
     GroceryListView,
     AddRecipeToGroceryListView,
+    AddRecipesToGroceryListView,
     UpdateGroceryListItemView,
+    BulkUpdateGroceryListItemsView,
     ClearCheckedItemsView,
     AddGroceryListItemView,
     UpdateUsernameView,
@@ -24,6 +26,12 @@ from .views import (
     PasswordResetRequestView,
     PasswordResetConfirmView,
     generate_recipe,
+    CacheStatsView,
+    AIUsageView,
+    GenerationJobList,
+    GenerationJobDetail,
+    grocery_list_events,
+    GroceryEventTicketView,
 )
 
 urlpatterns = [
@@ -54,6 +62,12 @@ urlpatterns = [
     ),
     # Grocery List
     path("grocery-list/", GroceryListView.as_view(), name="grocery-list"),
+    path("grocery-list/events/", grocery_list_events, name="grocery-list-events"),
+    path(
+        "grocery-list/events/ticket/",
+        GroceryEventTicketView.as_view(),
+        name="grocery-list-events-ticket",
+    ),
     path(
         "grocery-list/add-item/",
         AddGroceryListItemView.as_view(),
@@ -64,11 +78,21 @@ urlpatterns = [
         AddRecipeToGroceryListView.as_view(),
         name="add-recipe-to-grocery",
     ),
+    path(
+        "grocery-list/add-recipes/",
+        AddRecipesToGroceryListView.as_view(),
+        name="add-recipes-to-grocery",
+    ),
     path(
         "grocery-list/item/<int:item_id>/",
         UpdateGroceryListItemView.as_view(),
         name="update-grocery-item",
     ),
+    path(
+        "grocery-list/items/",
+        BulkUpdateGroceryListItemsView.as_view(),
+        name="bulk-update-grocery-items",
+    ),
     path(
         "grocery-list/clear-checked/",
         ClearCheckedItemsView.as_view(),
@@ -84,4 +108,12 @@ urlpatterns = [
     path("users/password-reset-confirm/", PasswordResetConfirmView.as_view(), name="password-reset-confirm"),
     # Ai
     path("recipes/generate/", generate_recipe, name="generate-recipe"),
+    path("recipes/generate/jobs/", GenerationJobList.as_view(), name="generation-job-list"),
+    path(
+        "recipes/generate/jobs/<uuid:job_id>/",
+        GenerationJobDetail.as_view(),
+        name="generation-job-detail",
+    ),
+    path("cache-stats/", CacheStatsView.as_view(), name="cache-stats"),
+    path("ai-usage/", AIUsageView.as_view(), name="ai-usage"),
 ]
@@ -1,83 +1,118 @@
 from decimal import Decimal, InvalidOperation
+import asyncio
+import datetime
 import json
+import math
 import os
 
+from asgiref.sync import sync_to_async
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
 from django.contrib.auth.tokens import default_token_generator
+from django.db import IntegrityError, transaction
+from django.db.models import F
 from django.core.mail import send_mail
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str
 from rest_framework import generics, status, permissions
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import APIException, PermissionDenied, ValidationError
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 from rest_framework_simplejwt.tokens import RefreshToken
-from openai import OpenAI
 from django.conf import settings
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 
 
-from .models import Recipe, Ingredient, Step, GroceryListItem
+from .ai_cache import (
+    ai_cache_stats,
+    get_cached_recipe,
+    record_bypass,
+    store_recipe,
+)
+from .ai_usage import (
+    CallStats,
+    costliest_calls,
+    record_cached_call,
+    usage_by_day,
+    usage_by_user,
+    usage_summary,
+)
+from .conditional import recipes_condition, grocery_list_condition
+from .conversions import (
+    can_convert,
+    convert_many,
+    convert_quantity,
+    get_measurement_type,
+    unit_errors,
+)
+from .events import (
+    get_broker,
+    issue_stream_ticket,
+    publish_grocery_event,
+    read_stream_ticket,
+)
+from .generation_jobs import JobLimitExceeded, cancel_job, submit_job
+from .models import (
+    Recipe,
+    Ingredient,
+    Step,
+    GroceryListItem,
+    GroceryListTombstone,
+    CollectionVersion,
+    GenerationJob,
+    AICall,
+    normalize_name,
+)
+from .pagination import RecipeCursorPagination, GroceryListCursorPagination
+from .recipe_generation import (
+    RecipeParseError,
+    build_recipe_messages,
+    complete_recipe,
+    complete_recipe_batch,
+    recipe_cache_key,
+    replay_recipe,
+    stream_recipe,
+)
+from .recipe_search import find_matching_recipes
+from .response_cache import CachedResponseMixin, response_cache_stats
+from .throttling import (
+    GenerateIPThrottle,
+    GenerateUserThrottle,
+    LLMBusy,
+    PasswordResetEmailThrottle,
+    PasswordResetIPThrottle,
+    SignInAccountThrottle,
+    SignInIPThrottle,
+    SignInUsernameThrottle,
+    SignUpIPThrottle,
+)
 from .serializers import (
     UserSerializer,
     RecipeSerializer,
+    RECIPE_SUMMARY_FIELDS,
     IngredientSerializer,
     StepSerializer,
     GroceryListItemSerializer,
+    GroceryListBulkPatchSerializer,
+    GenerationJobSerializer,
 )
 
-AI_ALLOWED_VOLUME_UNITS = {"tsp", "tbsp", "fl_oz", "cup", "pt", "qt", "gal", "ml", "l"}
-AI_ALLOWED_WEIGHT_UNITS = {"g", "kg", "oz", "lb"}
-
-TAG_LABEL_MAP = {
-    "contains_dairy": "No Dairy",
-    "contains_eggs": "No Eggs",
-    "contains_gluten": "Gluten Free",
-    "contains_nuts": "No Nuts",
-    "contains_shellfish": "No Shellfish",
-    "spicy": "Spicy",
-    "vegan": "Vegan",
-    "vegetarian": "Vegetarian",
-}
-
 
-def _normalize_ai_unit(raw_value):
+def recipe_queryset_for(user):
     """
-    Normalize AI-provided units to allowed sets.
-    Returns tuple of (unit_type, normalized_value, note_if_invalid)
+    Recipes owned by ``user`` with the owner, ingredients and steps loaded up front.
+    Serializing any number of recipes costs a fixed three queries.
     """
-    if raw_value is None:
-        return None, None, None
-
-    original = str(raw_value).strip()
-    if not original:
-        return None, None, None
-
-    cleaned = original.lower().strip()
-    cleaned = cleaned.replace(".", "")
-    cleaned = cleaned.replace("-", " ")
-    cleaned = " ".join(cleaned.split())
-
-    if cleaned in AI_ALLOWED_VOLUME_UNITS:
-        return "volume", cleaned, None
-    if cleaned in AI_ALLOWED_WEIGHT_UNITS:
-        return "weight", cleaned, None
-
-    return None, None, original
-
-
-TAG_INSTRUCTION_MAP = {
-    "contains_dairy": "Recipe must be dairy free; avoid milk, cheese, butter, yogurt, and any dairy-derived ingredients.",
-    "contains_eggs": "Recipe must be egg free; do not include eggs or products made with eggs.",
-    "contains_gluten": "Recipe must be gluten free; avoid wheat, barley, rye, and any gluten-containing ingredient.",
-    "contains_nuts": "Recipe must be nut free; exclude tree nuts, peanuts, and nut oils or flours.",
-    "contains_shellfish": "Recipe must exclude shellfish including shrimp, crab, lobster, and mollusks.",
-    "spicy": "Recipe should include notable heat or spice in at least one component.",
-    "vegan": "Recipe must be fully plant based and contain no animal products.",
-    "vegetarian": "Recipe must be vegetarian; no meat, poultry, or seafood.",
-}
+    return (
+        Recipe.objects.filter(user=user)
+        .select_related("user")
+        .prefetch_related("ingredients", "steps")
+    )
 
 
 # GENERAL / AUTH VIEWS
@@ -89,6 +124,7 @@ class Home(APIView):
 # SIGN IN
 class SignInView(APIView):
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [SignInIPThrottle, SignInUsernameThrottle, SignInAccountThrottle]
 
     def post(self, request):
         username = request.data.get("username")
@@ -116,6 +152,7 @@ class SignUpView(generics.CreateAPIView):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [SignUpIPThrottle]
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -154,26 +191,78 @@ class VerifyUserView(APIView):
 
 
 # RECIPE VIEWS
-class RecipeList(generics.ListCreateAPIView):
+@recipes_condition
+class RecipeList(CachedResponseMixin, generics.ListCreateAPIView):
     serializer_class = RecipeSerializer
+    cache_collection = CollectionVersion.RECIPES
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = RecipeCursorPagination
     parser_classes = (MultiPartParser, FormParser, JSONParser)
 
+    def get_requested_fields(self):
+        """
+        Sparse fieldset from ``?view=summary`` or ``?fields=a,b``, or None
+        for the full representation.
+        """
+        if self.request.method != "GET":
+            return None
+
+        params = self.request.query_params
+        if params.get("view") == "summary":
+            return RECIPE_SUMMARY_FIELDS
+
+        raw_fields = params.get("fields")
+        if not raw_fields:
+            return None
+
+        fields = [name.strip() for name in raw_fields.split(",") if name.strip()]
+        unknown = [
+            name for name in fields if name not in RecipeSerializer.Meta.fields
+        ]
+        if unknown:
+            raise ValidationError(
+                {"fields": [f"Unknown field(s): {', '.join(unknown)}."]}
+            )
+        return tuple(dict.fromkeys(["id", *fields]))
+
     def get_queryset(self):
-        return Recipe.objects.filter(user=self.request.user)
+        fields = self.get_requested_fields()
+        if fields is None:
+            return recipe_queryset_for(self.request.user)
+
+        # Only select the columns and relations the fieldset needs
+        queryset = Recipe.objects.filter(user=self.request.user)
+        columns = [
+            name
+            for name in fields
+            if name in {"id", "title", "notes", "favorite", "image", "tags"}
+        ]
+        if "user" in fields:
+            queryset = queryset.select_related("user")
+            columns.append("user__username")
+        related = [name for name in ("ingredients", "steps") if name in fields]
+        if related:
+            queryset = queryset.prefetch_related(*related)
+        return queryset.only(*columns)
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault("fields", self.get_requested_fields())
+        return super().get_serializer(*args, **kwargs)
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
 
-class RecipeDetail(generics.RetrieveUpdateDestroyAPIView):
+@recipes_condition
+class RecipeDetail(CachedResponseMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = RecipeSerializer
+    cache_collection = CollectionVersion.RECIPES
     permission_classes = [permissions.IsAuthenticated]
     lookup_field = "id"
     parser_classes = (MultiPartParser, FormParser, JSONParser)
 
     def get_queryset(self):
-        return Recipe.objects.filter(user=self.request.user)
+        return recipe_queryset_for(self.request.user)
 
     def update(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -237,15 +326,167 @@ class IngredientDetail(generics.RetrieveUpdateDestroyAPIView):
 
 
 # GROCERY LIST VIEWS
+def _encode_sync_cursor(moment):
+    return urlsafe_base64_encode(force_bytes(int(moment.timestamp() * 1_000_000)))
+
+
+class SyncCursorExpired(APIException):
+    status_code = status.HTTP_410_GONE
+    default_detail = (
+        "The sync cursor is older than the deletion history. "
+        "Resync with an empty ?since= to get the full list."
+    )
+    default_code = "resync_required"
+
+
+def _decode_sync_cursor(cursor):
+    try:
+        micros = int(force_str(urlsafe_base64_decode(cursor)))
+        return datetime.datetime.fromtimestamp(
+            micros / 1_000_000, tz=datetime.timezone.utc
+        )
+    except (TypeError, ValueError, OverflowError, OSError):
+        raise ValidationError({"since": ["Invalid sync cursor."]})
+
+
+@grocery_list_condition
 class GroceryListView(generics.ListAPIView):
     serializer_class = GroceryListItemSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = GroceryListCursorPagination
 
     def get_queryset(self):
         return GroceryListItem.objects.filter(user=self.request.user).order_by(
             "-created_at"
         )
 
+    def list(self, request, *args, **kwargs):
+        if "since" not in request.query_params:
+            return super().list(request, *args, **kwargs)
+        return self.delta(request, request.query_params["since"])
+
+    def delta(self, request, since):
+        """
+        Delta sync: ``?since=<cursor>`` returns items upserted and ids deleted
+        since the cursor, plus the cursor for the next sync. An empty cursor
+        returns a full snapshot flagged with ``"full": true``. A cursor older
+        than the tombstone retention window gets 410 (``resync_required``),
+        since deletions before the window have been pruned.
+
+        Rows are matched from a few seconds before the cursor so writes that
+        committed late are not skipped; clients apply upserts idempotently.
+        """
+        # Take the new cursor before reading so nothing falls between syncs
+        now = timezone.now()
+        items = self.get_queryset()
+        deleted_ids = []
+        full = True
+
+        if since:
+            since_moment = _decode_sync_cursor(since)
+            if since_moment < GroceryListTombstone.retention_cutoff():
+                raise SyncCursorExpired()
+            full = False
+            window_start = since_moment - datetime.timedelta(
+                seconds=settings.GROCERY_SYNC_OVERLAP_SECONDS
+            )
+            items = items.filter(updated_at__gt=window_start)
+            deleted_ids = list(
+                GroceryListTombstone.objects.filter(
+                    user=request.user, deleted_at__gt=window_start
+                ).values_list("item_id", flat=True)
+            )
+
+        return Response(
+            {
+                "items": GroceryListItemSerializer(items, many=True).data,
+                "deleted": deleted_ids,
+                "cursor": _encode_sync_cursor(now),
+                "full": full,
+            }
+        )
+
+
+def _authenticate_event_stream(request):
+    """
+    Resolve the user for an event stream from the ``Authorization`` header
+    or, since browsers' EventSource cannot set headers, a ``?ticket=`` from
+    /grocery-list/events/ticket/. Access tokens are never read from the URL,
+    which ends up in access logs.
+    """
+    authenticator = JWTAuthentication()
+    header = authenticator.get_header(request)
+    if header is not None:
+        raw_token = authenticator.get_raw_token(header)
+        if raw_token is None:
+            return None
+        try:
+            return authenticator.get_user(authenticator.get_validated_token(raw_token))
+        except (InvalidToken, TokenError):
+            return None
+    user_id = read_stream_ticket(request.GET.get("ticket", ""))
+    if user_id is None:
+        return None
+    return User.objects.filter(pk=user_id).first()
+
+
+class GroceryEventTicketView(APIView):
+    """
+    Issue a short-lived ticket for opening /grocery-list/events/?ticket=.
+    Request a new one for every (re)connection.
+    """
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        return Response(
+            {
+                "ticket": issue_stream_ticket(request.user.id),
+                "expires_in": settings.GROCERY_EVENTS_TICKET_SECONDS,
+            },
+            status=status.HTTP_201_CREATED,
+        )
+
+
+async def grocery_list_events(request):
+    """
+    Server-Sent Events stream of the user's grocery list changes
+    (``created``/``updated`` with the item, ``deleted`` with its id).
+    Serve through the ASGI application so idle streams don't hold workers.
+    Events are live only: after the first chunk (and after reconnecting)
+    clients catch up with a ``?since=`` delta sync.
+    """
+    user = await sync_to_async(_authenticate_event_stream)(request)
+    if user is None or not user.is_active:
+        return JsonResponse(
+            {"detail": "Authentication credentials were not provided."},
+            status=status.HTTP_401_UNAUTHORIZED,
+        )
+
+    heartbeat = settings.GROCERY_EVENTS_HEARTBEAT_SECONDS
+
+    async def stream():
+        # Subscribing inside the body ties the subscription's lifetime to the
+        # stream. Events are delivered from the first chunk on, so clients
+        # reconcile with ``?since=`` once it arrives.
+        subscription = await get_broker().subscribe(user.id)
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event['item'])}\n\n"
+        finally:
+            await subscription.close()
+
+    response = StreamingHttpResponse(stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
 
 class AddRecipeToGroceryListView(APIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -255,35 +496,24 @@ class AddRecipeToGroceryListView(APIView):
             recipe = Recipe.objects.get(id=recipe_id, user=request.user)
             ingredients = recipe.ingredients.all()
 
-            added_count = 0
-            updated_count = 0
-
-            # Add each ingredient to grocery list
-            for ingredient in ingredients:
-                # Check if item with same name and units already exists
-                existing_item = GroceryListItem.objects.filter(
-                    user=request.user,
-                    name__iexact=ingredient.name,  # Case-insensitive name match
-                    volume_unit=ingredient.volume_unit,
-                    weight_unit=ingredient.weight_unit,
-                ).first()
-
-                if existing_item:
-                    # If exists with matching units, add quantities together
-                    existing_item.quantity += ingredient.quantity
-                    existing_item.checked = False  # Uncheck when adding more
-                    existing_item.save()
-                    updated_count += 1
-                else:
-                    # Create new item if no match found
-                    GroceryListItem.objects.create(
-                        user=request.user,
-                        name=ingredient.name,
-                        quantity=ingredient.quantity,
-                        volume_unit=ingredient.volume_unit,
-                        weight_unit=ingredient.weight_unit,
-                    )
-                    added_count += 1
+            try:
+                added_count, updated_count = merge_into_grocery_list(
+                    request.user,
+                    (
+                        (
+                            ingredient.name,
+                            ingredient.quantity,
+                            ingredient.volume_unit,
+                            ingredient.weight_unit,
+                        )
+                        for ingredient in ingredients
+                    ),
+                )
+            except ValueError:
+                return Response(
+                    {"units": ["Unable to merge due to incompatible units."]},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
 
             message_parts = []
             if added_count > 0:
@@ -310,6 +540,102 @@ class AddRecipeToGroceryListView(APIView):
             )
 
 
+# Largest serving multiplier a meal plan import accepts
+MEAL_PLAN_MAX_MULTIPLIER = 100
+
+
+class AddRecipesToGroceryListView(APIView):
+    """
+    Import several recipes (e.g. a week's meal plan) into the grocery list in
+    one pass. Body: ``{"recipes": [{"id": 1, "multiplier": 2}, {"id": 4}]}``.
+    """
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        raw_recipes = request.data.get("recipes")
+        if not isinstance(raw_recipes, list) or not raw_recipes:
+            return Response(
+                {"recipes": ["Provide a non-empty list of recipes."]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        multipliers = {}
+        for entry in raw_recipes:
+            if not isinstance(entry, dict):
+                entry = {"id": entry}
+            try:
+                recipe_id = int(entry.get("id"))
+                multiplier = Decimal(str(entry.get("multiplier", 1)))
+            except (InvalidOperation, TypeError, ValueError):
+                return Response(
+                    {"recipes": ["Each recipe needs an integer id and a numeric multiplier."]},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            if not multiplier.is_finite() or not 0 < multiplier <= MEAL_PLAN_MAX_MULTIPLIER:
+                return Response(
+                    {
+                        "recipes": [
+                            "Multipliers must be greater than zero and at most "
+                            f"{MEAL_PLAN_MAX_MULTIPLIER}."
+                        ]
+                    },
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            # Listing a recipe twice adds it twice
+            multipliers[recipe_id] = multipliers.get(recipe_id, 0) + multiplier
+
+        found_ids = set(
+            Recipe.objects.filter(id__in=multipliers, user=request.user).values_list(
+                "id", flat=True
+            )
+        )
+        missing_ids = sorted(set(multipliers) - found_ids)
+        if missing_ids:
+            return Response(
+                {"error": "Recipe not found", "missing": missing_ids},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+
+        ingredients = Ingredient.objects.filter(recipe_id__in=found_ids).values_list(
+            "recipe_id", "name", "quantity", "volume_unit", "weight_unit"
+        )
+        entries = [
+            (
+                name,
+                float(Decimal(str(quantity)) * multipliers[recipe_id]),
+                volume_unit,
+                weight_unit,
+            )
+            for recipe_id, name, quantity, volume_unit, weight_unit in ingredients
+        ]
+        # A scaled quantity that overflows would make the list unrenderable
+        if not all(math.isfinite(quantity) for _, quantity, _, _ in entries):
+            return Response(
+                {"recipes": ["Scaled ingredient quantities are too large."]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            added_count, updated_count = merge_into_grocery_list(request.user, entries)
+        except ValueError:
+            return Response(
+                {"units": ["Unable to merge due to incompatible units."]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        return Response(
+            {
+                "message": (
+                    f"Added {added_count} new and updated {updated_count} existing "
+                    f"ingredient(s) from {len(found_ids)} recipe(s)"
+                ),
+                "added": added_count,
+                "updated": updated_count,
+            },
+            status=status.HTTP_201_CREATED,
+        )
+
+
 class UpdateGroceryListItemView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
@@ -328,7 +654,14 @@ class UpdateGroceryListItemView(APIView):
             if "weight_unit" in request.data:
                 item.weight_unit = request.data.get("weight_unit")
 
-            item.save()
+            try:
+                with transaction.atomic():
+                    item.save()
+            except IntegrityError:
+                return Response(
+                    {"units": ["An item with this name and measurement type already exists."]},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
             return Response(GroceryListItemSerializer(item).data)
         except GroceryListItem.DoesNotExist:
             return Response(
@@ -336,6 +669,87 @@ class UpdateGroceryListItemView(APIView):
             )
 
 
+class BulkUpdateGroceryListItemsView(APIView):
+    """
+    Apply many item patches in one request, e.g. "check all" or "uncheck
+    all". Body: a list (or ``{"items": [...]}``) of
+    ``{id, checked, quantity, volume_unit, weight_unit}`` patches.
+    """
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    def patch(self, request):
+        data = request.data
+        if isinstance(data, dict):
+            data = data.get("items")
+        serializer = GroceryListBulkPatchSerializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        patches = serializer.validated_data
+        if not patches:
+            return Response([])
+
+        with transaction.atomic():
+            items = (
+                GroceryListItem.objects.select_for_update()
+                .filter(user=request.user)
+                .in_bulk([patch["id"] for patch in patches])
+            )
+            missing_ids = [patch["id"] for patch in patches if patch["id"] not in items]
+            if missing_ids:
+                return Response(
+                    {"error": "Item not found", "missing": missing_ids},
+                    status=status.HTTP_404_NOT_FOUND,
+                )
+
+            update_fields = set()
+            for patch in patches:
+                item = items[patch["id"]]
+                for field, value in patch.items():
+                    if field != "id":
+                        setattr(item, field, value)
+                        update_fields.add(field)
+                if item.volume_unit and item.weight_unit:
+                    return Response(
+                        {"units": [f"Item {item.id} cannot have both a volume and a weight unit."]},
+                        status=status.HTTP_400_BAD_REQUEST,
+                    )
+                # bulk_update skips save(), which keeps this in sync
+                item.measurement_type = get_measurement_type(
+                    item.volume_unit, item.weight_unit
+                )
+
+            if update_fields & {"volume_unit", "weight_unit"}:
+                update_fields.add("measurement_type")
+            if update_fields:
+                # bulk_update skips auto_now
+                updated_at = timezone.now()
+                for item in items.values():
+                    item.updated_at = updated_at
+                update_fields.add("updated_at")
+
+            updated = [items[patch["id"]] for patch in patches]
+            if update_fields:
+                try:
+                    with transaction.atomic():
+                        GroceryListItem.objects.bulk_update(
+                            updated, sorted(update_fields)
+                        )
+                except IntegrityError:
+                    return Response(
+                        {"units": ["An item with this name and measurement type already exists."]},
+                        status=status.HTTP_400_BAD_REQUEST,
+                    )
+                # Bulk writes skip model signals
+                CollectionVersion.bump(request.user.id, CollectionVersion.GROCERY_LIST)
+
+            payload = GroceryListItemSerializer(updated, many=True).data
+            if update_fields:
+                for item_data in payload:
+                    publish_grocery_event(request.user.id, "updated", item_data)
+
+        return Response(payload)
+
+
 class AddGroceryListItemView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
@@ -358,104 +772,43 @@ class AddGroceryListItemView(APIView):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        if volume_unit and weight_unit:
-            return Response(
-                {"units": ["Provide either a volume unit or a weight unit, not both."]},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
+        errors = unit_errors(volume_unit, weight_unit)
+        if errors:
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            quantity_value = Decimal(str(quantity))
-        except (InvalidOperation, TypeError):
+            quantity_value = float(quantity)
+        except (TypeError, ValueError):
+            quantity_value = math.nan
+        if not math.isfinite(quantity_value):
             return Response(
                 {"quantity": ["Quantity must be a valid number."]},
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        measurement_type = get_measurement_type(volume_unit, weight_unit)
-        if measurement_type == "volume" and volume_unit not in VOLUME_TO_ML:
-            return Response(
-                {"volume_unit": ["Invalid volume unit."]},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-        if measurement_type == "weight" and weight_unit not in WEIGHT_TO_GRAMS:
-            return Response(
-                {"weight_unit": ["Invalid weight unit."]},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-
-        existing_items = GroceryListItem.objects.filter(
-            user=request.user, name__iexact=name
-        )
-
-        matching_item = None
-        if measurement_type == "volume":
-            matching_item = next(
-                (item for item in existing_items if item.volume_unit),
-                None,
-            )
-        elif measurement_type == "weight":
-            matching_item = next(
-                (item for item in existing_items if item.weight_unit),
-                None,
-            )
-        else:
-            matching_item = next(
-                (
-                    item
-                    for item in existing_items
-                    if not item.volume_unit and not item.weight_unit
-                ),
-                None,
-            )
-
-        if matching_item:
-            try:
-                if measurement_type == "volume":
-                    converted = convert_quantity(
-                        quantity_value,
-                        volume_unit,
-                        matching_item.volume_unit,
-                        VOLUME_TO_ML,
-                    )
-                    matching_item.quantity += float(converted)
-                elif measurement_type == "weight":
-                    converted = convert_quantity(
-                        quantity_value,
-                        weight_unit,
-                        matching_item.weight_unit,
-                        WEIGHT_TO_GRAMS,
-                    )
-                    matching_item.quantity += float(converted)
-                else:
-                    matching_item.quantity += float(quantity_value)
-
-                matching_item.checked = False
-                matching_item.save()
-                return Response(
-                    {
-                        "message": f"Updated grocery list item for {matching_item.name}.",
-                        "item": GroceryListItemSerializer(matching_item).data,
-                    },
-                    status=status.HTTP_200_OK,
-                )
-            except ValueError:
-                return Response(
-                    {"units": ["Unable to merge due to incompatible units."]},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-
-        # No matching item found, create a new one
+        # Validate the new item's fields before touching the database
         serializer = GroceryListItemSerializer(
             data={
                 "name": name,
-                "quantity": float(quantity_value),
+                "quantity": quantity_value,
                 "volume_unit": volume_unit,
                 "weight_unit": weight_unit,
             }
         )
-        if serializer.is_valid():
-            item = serializer.save(user=request.user)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            item, created = upsert_grocery_item(
+                request.user, name, quantity_value, volume_unit, weight_unit
+            )
+        except ValueError:
+            return Response(
+                {"units": ["Unable to merge due to incompatible units."]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        if created:
             return Response(
                 {
                     "message": f"Added {item.name} to grocery list.",
@@ -463,16 +816,29 @@ class AddGroceryListItemView(APIView):
                 },
                 status=status.HTTP_201_CREATED,
             )
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        return Response(
+            {
+                "message": f"Updated grocery list item for {item.name}.",
+                "item": GroceryListItemSerializer(item).data,
+            },
+            status=status.HTTP_200_OK,
+        )
 
 
 class ClearCheckedItemsView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def delete(self, request):
-        deleted_count = GroceryListItem.objects.filter(
-            user=request.user, checked=True
-        ).delete()[0]
+        with transaction.atomic():
+            item_ids = list(
+                GroceryListItem.objects.filter(
+                    user=request.user, checked=True
+                ).values_list("id", flat=True)
+            )
+            deleted_count = GroceryListItem.objects.filter(id__in=item_ids).delete()[0]
+            GroceryListTombstone.record(request.user.id, item_ids)
+
+        GroceryListTombstone.prune(request.user.id)
 
         return Response(
             {"message": f"Removed {deleted_count} items from grocery list"},
@@ -547,6 +913,8 @@ class UpdateUsernameView(APIView):
 
         user.username = new_username
         user.save()
+        # Recipe payloads embed the owner's username
+        CollectionVersion.bump(user.id, CollectionVersion.RECIPES)
 
         return Response(
             {
@@ -663,6 +1031,7 @@ class DeleteAccountView(APIView):
 # PASSWORD RESET VIEWS
 class PasswordResetRequestView(APIView):
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [PasswordResetIPThrottle, PasswordResetEmailThrottle]
 
     def post(self, request):
         email = request.data.get("email", "").strip()
@@ -729,6 +1098,7 @@ Bytes Recipe Collector Team
 
 class PasswordResetConfirmView(APIView):
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [PasswordResetIPThrottle]
 
     def post(self, request):
         uid = request.data.get("uid")
@@ -776,225 +1146,647 @@ class PasswordResetConfirmView(APIView):
 
 
 # AI CODE
-@api_view(["POST"])
-@permission_classes([permissions.IsAuthenticated])
-def generate_recipe(request):
+def _generation_inputs(request, require_prompt=True):
     """
-    Generate a recipe based on the user prompt unis OpenAI.
-    Return a JSON structure ready for preview on the frontend.
+    Validate a generation request. Returns ``((prompt, tags, grocery_items),
+    None)``, or ``(None, error_response)``.
     """
     user_prompt = request.data.get("prompt", "").strip()
     tags = request.data.get("tags", [])
     use_grocery_list = request.data.get("use_grocery_list", False)
 
-    if not user_prompt:
-        return Response({"error": "Prompt is required"}, status=400)
-    grocery_list_text = None
+    if require_prompt and not user_prompt:
+        return None, Response({"error": "Prompt is required"}, status=400)
 
+    grocery_items = []
     if use_grocery_list:
-        grocery_items_qs = GroceryListItem.objects.filter(
-            user=request.user, checked=True
-        ).values_list("name", flat=True)
+        grocery_items = list(
+            GroceryListItem.objects.filter(user=request.user, checked=True).values_list(
+                "name", flat=True
+            )
+        )
 
-        if not grocery_items_qs:
-            return Response(
+        if not grocery_items:
+            return None, Response(
                 {
                     "error: No checked grocery items found. Please check items to base the recipe on"
                 },
                 status=400,
             )
-        grocery_list_text = ", ".join(grocery_items_qs)
-    else:
-        grocery_list_text = None
-
-    tag_labels = [TAG_LABEL_MAP.get(tag, tag.replace("_", " ")) for tag in tags]
-    tag_instructions = [
-        TAG_INSTRUCTION_MAP.get(tag) for tag in tags if TAG_INSTRUCTION_MAP.get(tag)
-    ]
-
-    tags_text = ", ".join(tag_labels) if tag_labels else "no dietary tags"
-    instruction_text = " ".join(tag_instructions) if tag_instructions else ""
-    client = OpenAI(api_key=settings.OPENAI_API_KEY)
-
-    system_instructions = """
-    You are a professional chef and nutrition-focused recipe generator AI.
-    Your goal is to generate **delicious, realistic, step-by-step recipes** for a cooking app.
-    All responses must be **valid JSON only** — no text outside the JSON block.
-
-    Each recipe must include:
-    - title (string)
-    - notes (short description, 1–3 sentences about flavor and nutrition, total cook/prep time, macros for the recipe). Append this sentence to the end of the notes field: "DISCLAIMER: AI may mislabel dietary tags or ingredients. Always double-check ingredients and allergens before cooking."
-    - tags (list of lowercase strings, e.g. ["contains_dairy", "spicy"])
-    - ingredients (list of objects: {name, quantity, volume_unit, weight_unit})
-    - steps (list of objects: {step (int), description (string)})
-
-    Ingredient Rules:
-    - When it comes to volume/weight measurements, only use these allowed values:
-        AI_ALLOWED_VOLUME_UNITS = {"tsp", "tbsp", "fl_oz", "cup", "pt", "qt", "gal", "ml", "l"}
-        AI_ALLOWED_WEIGHT_UNITS = {"g", "kg", "oz", "lb"}
-    - It's okay to also use not volume/weight measurements, but if you don't then add it to the ingredient name with the syntax of "INGREDIENT-NAME (INGREDIENT-MEASUREMENT)"
-    - Each ingredient must include **either/none** volume_unit or weight_unit (never both).
-    - If a real-world ingredient doesn't use a measurable unit like "clove" or "slice", convert it into a measurable one (e.g., 1 garlic clove → 1 tsp minced garlic), or if that’s not possible, set both units to null and specify the non-measurable form directly in the ingredient name (e.g., "Garlic Clove", quantity: 1).
-
-    Tag Rules (VERY IMPORTANT):
-    - You must analyze the final ingredient list (and any allergens implied) against every tag in this allowed list and include ALL that apply, even if the user did not select them:
-        "no_dairy": recipe contains no dairy ingredients (milk, cheese, butter, yogurt, cream, ghee)
-        "no_eggs": recipe contains no egg-based ingredients
-        "no_gluten": recipe contains no wheat, barley, rye, or gluten-containing grains
-        "no_nuts": recipe contains no tree nuts or peanuts (including nut butters)
-        "no_shellfish": recipe contains no shellfish (shrimp, crab, lobster, mussels, clams, scallops, oysters, etc.)
-        "spicy": recipe has noticeable heat/spice from peppers, chili, hot sauce, etc.
-        "vegan": recipe contains zero animal products (no meat, poultry, seafood, dairy, eggs, honey, gelatin)
-        "vegetarian": recipe contains no meat, poultry, or seafood (dairy and eggs are acceptable)
-    - After building the recipe, double-check the ingredients and make sure the tags array reflects every applicable tag (add any missing ones, remove any that shouldn’t apply). Only use the exact tag values above (all lowercase, underscores). Do not invent new tag names.
-
-    **Cooking & Flavor Style:**
-    - Always include realistic cooking details:
-        - Mention time ranges, heat levels, and visual/tactile cues (“until golden”, “until thickened”).
-        - For meats: specify doneness cues, internal temperature, and flipping instructions.
-        - For grains or oats: specify exact cooking times and methods (e.g., “microwave on high for 90 seconds, stir, and rest 30 seconds”).
-        - For sauces/dressings: include whisking, blending, or reduction steps as appropriate.
-    - Recipes must taste balanced and delicious — combine herbs, spices, and sauces creatively but realistically.
-
-    **Output format:**  
-    Return only valid JSON following this structure.
-    
-    Example JSON (detailed):
-
-    {
-    "title": "Creamy Spicy Chicken Rice Bowl",
-    "notes": "A flavorful, high-protein rice bowl with tender chicken, sautéed spinach, and a creamy yogurt-sriracha sauce. Cook time: 20 minutes, prep time: 15 minutes. DISCLAIMER: AI may mislabel tags or ingredients; always double-check ingredients before cooking.",
-    "tags": ["contains_dairy", "spicy"],
-    "ingredients": [
-        {"name": "Chicken Breast", "quantity": 200, "weight_unit": "g", "volume_unit": null},
-        {"name": "Olive Oil", "quantity": 1, "weight_unit": null, "volume_unit": "tbsp"},
-        {"name": "Garlic Powder", "quantity": 0.5, "weight_unit": null, "volume_unit": "tsp"},
-        {"name": "Paprika", "quantity": 0.5, "weight_unit": null, "volume_unit": "tsp"},
-        {"name": "Cooked Rice", "quantity": 150, "weight_unit": "g", "volume_unit": null},
-        {"name": "Fresh Spinach", "quantity": 80, "weight_unit": "g", "volume_unit": null},
-        {"name": "Greek Yogurt", "quantity": 60, "weight_unit": "g", "volume_unit": null},
-        {"name": "Sriracha", "quantity": 1, "weight_unit": null, "volume_unit": "tbsp"},
-        {"name": "Salt", "quantity": 1, "weight_unit": null, "volume_unit": "tsp"},
-        {"name": "Black Pepper", "quantity": 0.5, "weight_unit": null, "volume_unit": "tsp"}
-    ],
-    "steps": [
-        {"step": 1, "description": "Pat the chicken dry and season both sides with salt, pepper, garlic powder, and paprika."},
-        {"step": 2, "description": "Heat olive oil in a skillet over medium-high heat. Add the chicken and sear for 5–6 minutes per side until golden and cooked through (internal temp 74°C / 165°F)."},
-        {"step": 3, "description": "Remove chicken and rest for 2–3 minutes before slicing thinly."},
-        {"step": 4, "description": "In the same pan, add spinach and sauté for 1–2 minutes until wilted."},
-        {"step": 5, "description": "In a bowl, mix Greek yogurt and sriracha until creamy and orange in color."},
-        {"step": 6, "description": "Assemble the bowl: layer rice, spinach, and sliced chicken. Drizzle the yogurt-sriracha sauce on top and serve warm."}
-    ]
+
+    return (user_prompt, tags, grocery_items), None
+
+
+def _cached_generation(request, cache_key):
+    """The cached recipe for ``cache_key``, unless ``?fresh=1`` asks to bypass."""
+    if request.query_params.get("fresh") or request.data.get("fresh"):
+        record_bypass()
+        return None
+    return get_cached_recipe(cache_key)
+
+
+def _recipe_matches(request, prompt, tags):
+    """
+    ``(mode, matches)``: the match mode for this request (``match`` in the
+    body or query, else RECIPE_MATCH_MODE) and the saved recipes matching
+    the prompt, serialized with their ``score`` and whether they are
+    ``shared``. ``?fresh=1`` skips the lookup like it skips the AI cache.
     """
+    mode = (
+        request.data.get("match")
+        or request.query_params.get("match")
+        or settings.RECIPE_MATCH_MODE
+    )
+    if mode not in ("instead", "alongside") or (
+        request.query_params.get("fresh") or request.data.get("fresh")
+    ):
+        return mode, []
+
+    matches = []
+    for recipe, score in find_matching_recipes(request.user, prompt, tags):
+        data = RecipeSerializer(recipe, context={"request": request}).data
+        data["score"] = score
+        data["shared"] = recipe.user_id != request.user.pk
+        matches.append(data)
+    return mode, matches
+
+
+@api_view(["POST"])
+@permission_classes([permissions.IsAuthenticated])
+@throttle_classes([GenerateUserThrottle, GenerateIPThrottle])
+def generate_recipe(request):
+    """
+    Generate a recipe based on the user prompt unis OpenAI.
+    Return a JSON structure ready for preview on the frontend.
+    Saved recipes that match the prompt are returned instead of (or along
+    with) the generated one; see ``_recipe_matches``.
+    """
+    if "variants" in request.data or "prompts" in request.data:
+        return _generate_batch(request)
+
+    inputs, error = _generation_inputs(request)
+    if error is not None:
+        return error
+    match_mode, matches = _recipe_matches(request, inputs[0], inputs[1])
+    stream = request.data.get("stream") or request.query_params.get("stream")
+
+    mode = AICall.Mode.STREAM if stream else AICall.Mode.COMPLETE
+
+    if matches and match_mode == "instead":
+        record_cached_call(request.user.pk, mode, AICall.CacheStatus.MATCH, inputs[0])
+        if stream:
+            response = StreamingHttpResponse(
+                _stream_in_thread(_sse_matches(matches)),
+                content_type="text/event-stream",
+            )
+            response["Cache-Control"] = "no-cache"
+            response["X-Accel-Buffering"] = "no"
+        else:
+            response = Response({"matches": matches}, status=200)
+        response["X-Recipe-Match"] = "HIT"
+        return response
+
+    messages = build_recipe_messages(*inputs)
+    cache_key = recipe_cache_key(*inputs)
+    cached_recipe = _cached_generation(request, cache_key)
+    if cached_recipe is not None:
+        record_cached_call(request.user.pk, mode, AICall.CacheStatus.HIT, inputs[0])
+    stats = CallStats(
+        request.user.pk,
+        mode,
+        AICall.CacheStatus.BYPASS
+        if request.query_params.get("fresh") or request.data.get("fresh")
+        else AICall.CacheStatus.MISS,
+        inputs[0],
+    )
+
+    if stream:
+        if cached_recipe is not None:
+            events = _sse_recipe(replay_recipe(cached_recipe))
+        else:
+            events = _sse_recipe(stream_recipe(messages, stats=stats), cache_key)
+        if matches:
+            events = _sse_matches(matches, then=events)
+        response = StreamingHttpResponse(
+            _stream_in_thread(events), content_type="text/event-stream"
+        )
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        response["X-Cache"] = "HIT" if cached_recipe is not None else "MISS"
+        response["X-Recipe-Match"] = "HIT" if matches else "MISS"
+        return response
+
+    if cached_recipe is not None:
+        response = Response(
+            {**cached_recipe, "matches": matches} if matches else cached_recipe,
+            status=200,
+        )
+        response["X-Cache"] = "HIT"
+        response["X-Recipe-Match"] = "HIT" if matches else "MISS"
+        return response
+
+    try:
+        recipe_json = complete_recipe(messages, stats=stats)
+    except RecipeParseError as e:
+        return Response({"error": str(e), "raw": e.raw}, status=500)
+    except LLMBusy:
+        raise
+    except Exception as e:
+        return Response({"error": str(e)}, status=500)
+
+    store_recipe(cache_key, recipe_json)
+    response = Response(
+        {**recipe_json, "matches": matches} if matches else recipe_json, status=200
+    )
+    response["X-Cache"] = "MISS"
+    response["X-Recipe-Match"] = "HIT" if matches else "MISS"
+    return response
+
+
+def _generate_batch(request):
+    """
+    ``variants=N`` returns ``{"variants": [...]}`` with N recipes for the
+    prompt from a single completion. ``prompts=[...]`` (a meal plan) returns
+    ``{"results": [{"prompt", "variants"} or {"prompt", "error"}, ...]}``.
+    Batches always call the model; every recipe is added to the AI cache.
+    """
+    if request.data.get("stream") or request.query_params.get("stream"):
+        return Response(
+            {"error": "Streaming supports a single recipe; omit variants and prompts."},
+            status=400,
+        )
 
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_instructions},
+        variants = int(request.data.get("variants", 1))
+    except (TypeError, ValueError):
+        variants = 0
+    if not 1 <= variants <= settings.GENERATION_MAX_VARIANTS:
+        return Response(
+            {"error": f"variants must be between 1 and {settings.GENERATION_MAX_VARIANTS}"},
+            status=400,
+        )
+
+    prompts = request.data.get("prompts")
+    inputs, error = _generation_inputs(request, require_prompt=prompts is None)
+    if error is not None:
+        return error
+    _, tags, grocery_items = inputs
+    if prompts is None:
+        prompts = [inputs[0]]
+    elif (
+        not isinstance(prompts, list)
+        or not prompts
+        or len(prompts) > settings.GENERATION_MAX_PROMPTS
+        or not all(isinstance(prompt, str) and prompt.strip() for prompt in prompts)
+    ):
+        return Response(
+            {
+                "error": (
+                    f"prompts must be a list of 1 to {settings.GENERATION_MAX_PROMPTS} "
+                    "non-empty strings"
+                )
+            },
+            status=400,
+        )
+    prompts = [prompt.strip() for prompt in prompts]
+
+    results = complete_recipe_batch(
+        [build_recipe_messages(prompt, tags, grocery_items) for prompt in prompts],
+        variants=variants,
+        stats=[
+            CallStats(
+                request.user.pk,
+                AICall.Mode.BATCH,
+                AICall.CacheStatus.BYPASS,
+                prompt,
+                variants,
+            )
+            for prompt in prompts
+        ],
+    )
+    if all(isinstance(result, LLMBusy) for result in results):
+        raise results[0]
+    payload = []
+    for prompt, result in zip(prompts, results):
+        if isinstance(result, RecipeParseError):
+            payload.append({"prompt": prompt, "error": str(result), "raw": result.raw})
+        elif isinstance(result, Exception):
+            payload.append({"prompt": prompt, "error": str(result)})
+        else:
+            cache_key = recipe_cache_key(prompt, tags, grocery_items)
+            for recipe_json in result:
+                store_recipe(cache_key, recipe_json)
+            payload.append({"prompt": prompt, "variants": result})
+
+    failed = all("error" in entry for entry in payload)
+    if "prompts" not in request.data:
+        body = payload[0] if failed else {"variants": payload[0]["variants"]}
+        if failed:
+            body.pop("prompt")
+        return Response(body, status=500 if failed else 200)
+    return Response({"results": payload}, status=500 if failed else 200)
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _stream_in_thread(chunks):
+    """
+    Pull each chunk of a blocking iterator from the request's sync thread.
+    Under ASGI, Django reads a sync iterator to the end before sending any of
+    it, which would hold back every event until the recipe is done.
+    """
+    chunks = iter(chunks)
+    pull = sync_to_async(next)
+    end = object()
+    try:
+        while True:
+            chunk = await pull(chunks, end)
+            if chunk is end:
+                return
+            yield chunk
+    finally:
+        # A client that disconnects early still releases the LLM slot
+        close = getattr(chunks, "close", None)
+        if close is not None:
+            await sync_to_async(close)()
+
+
+def _sse_matches(matches, then=None):
+    """
+    A ``matches`` event listing the saved recipes that match the prompt,
+    followed by the generated recipe's events when ``then`` is given.
+    """
+    if then is None:
+        yield "retry: 3000\n\n"
+    yield _sse("matches", {"matches": matches})
+    if then is not None:
+        yield from then
+
+
+def _sse_recipe(events, cache_key=None):
+    """
+    Server-Sent Events for a generated recipe: ``title``, ``notes`` and
+    ``tags`` as they complete, one ``ingredient`` (units normalised) or
+    ``step`` event per list element, then ``done`` with the same payload the
+    non-streaming response returns, or ``error``.
+    """
+    # Flush headers straight away so clients see the stream open
+    yield "retry: 3000\n\n"
+    try:
+        for event, data in events:
+            if event == "done" and cache_key is not None:
+                store_recipe(cache_key, data)
+            yield _sse(event, data)
+    except RecipeParseError as e:
+        yield _sse("error", {"error": str(e), "raw": e.raw})
+    except LLMBusy as e:
+        yield _sse("error", {"error": str(e.detail), "retry_after": e.wait})
+    except Exception as e:
+        yield _sse("error", {"error": str(e)})
+
+
+class GenerationJobList(APIView):
+    """
+    Queue a recipe generation (same body as /recipes/generate/) and return
+    the job at once with 202; poll /recipes/generate/jobs/<id>/ for the result.
+    """
+
+    permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = [GenerateUserThrottle, GenerateIPThrottle]
+
+    def post(self, request):
+        inputs, error = _generation_inputs(request)
+        if error is not None:
+            return error
+        messages = build_recipe_messages(*inputs)
+        cache_key = recipe_cache_key(*inputs)
+        cached_recipe = _cached_generation(request, cache_key)
+
+        try:
+            job = submit_job(
+                request.user, inputs[0], messages, cache_key, result=cached_recipe
+            )
+        except JobLimitExceeded:
+            return Response(
                 {
-                    "role": "user",
-                    "content": (
-                        f"Generate a recipe based on this request: '{user_prompt}'. "
-                        f"The recipe should align with these tags: '{tags_text}'. "
-                        f"Dietary requirements: {instruction_text}"
-                        + (
-                            f"\n\nHere's what the user currently has available in their grocery list: {grocery_list_text}."
-                            if grocery_list_text
-                            else ""
-                        )
-                        + "\n\nOnly use ingredients from the grocery list if provided, "
-                        "and stay consistent with the format and tag rules above"
-                    ),
+                    "error": (
+                        f"You can have at most {settings.GENERATION_JOBS_PER_USER} "
+                        "recipe generations in progress."
+                    )
                 },
-            ],
-            response_format={"type": "json_object"},
-            temperature=0.7,
+                status=status.HTTP_429_TOO_MANY_REQUESTS,
+            )
+        if cached_recipe is not None:
+            record_cached_call(
+                request.user.pk, AICall.Mode.JOB, AICall.CacheStatus.HIT, inputs[0]
+            )
+        return Response(
+            GenerationJobSerializer(job).data, status=status.HTTP_202_ACCEPTED
         )
 
-        ai_output = response.choices[0].message.content.strip()
+
+class GenerationJobDetail(APIView):
+    """GET a job's status and result; DELETE cancels it if still in progress."""
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_object(self, job_id):
         try:
-            ai_output = ai_output.replace("```json", "").replace("```", "")
-            recipe_json = json.loads(ai_output)
-        except json.JSONDecodeError:
+            return GenerationJob.objects.get(id=job_id, user=self.request.user)
+        except GenerationJob.DoesNotExist:
+            return None
+
+    def get(self, request, job_id):
+        job = self.get_object(job_id)
+        if job is None:
             return Response(
-                {"error": "Failed to parse AI response as JSON", "raw": ai_output},
-                status=500,
+                {"error": "Job not found"}, status=status.HTTP_404_NOT_FOUND
             )
+        return Response(GenerationJobSerializer(job).data)
 
-        # Normalise ingredient units to our allowed set
-        for ingredient in recipe_json.get("ingredients", []):
-            name = str(ingredient.get("name") or "Ingredient").strip() or "Ingredient"
-            notes = []
-            normalized_volume = None
-            normalized_weight = None
+    def delete(self, request, job_id):
+        job = self.get_object(job_id)
+        if job is None:
+            return Response(
+                {"error": "Job not found"}, status=status.HTTP_404_NOT_FOUND
+            )
+        if not cancel_job(job):
+            return Response(
+                {"error": "Job has already finished"},
+                status=status.HTTP_409_CONFLICT,
+            )
+        job.refresh_from_db()
+        return Response(GenerationJobSerializer(job).data)
 
-            for unit_field in ("volume_unit", "weight_unit"):
-                unit_type, normalized_value, invalid_note = _normalize_ai_unit(
-                    ingredient.get(unit_field)
-                )
 
-                if unit_type == "volume" and normalized_value:
-                    if not normalized_volume:
-                        normalized_volume = normalized_value
-                elif unit_type == "weight" and normalized_value:
-                    if not normalized_weight:
-                        normalized_weight = normalized_value
-                elif invalid_note:
-                    notes.append(invalid_note)
-
-            ingredient["volume_unit"] = normalized_volume
-            ingredient["weight_unit"] = normalized_weight
-
-            if notes:
-                descriptor = ", ".join(str(note).strip() for note in notes if note)
-                if descriptor:
-                    ingredient["name"] = f"{name} ({descriptor})"
-                else:
-                    ingredient["name"] = name
-            else:
-                ingredient["name"] = name
-
-        return Response(recipe_json, status=200)
+class CacheStatsView(APIView):
+    """Hit rates of the recipe response cache and the AI recipe cache (staff only)."""
 
-    except Exception as e:
-        return Response({"error": str(e)}, status=500)
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(
+            {
+                "responses": response_cache_stats(),
+                "ai_recipes": ai_cache_stats(),
+            }
+        )
+
+
+class AIUsageView(APIView):
+    """
+    Token and latency totals for AI calls over the last ``?days=`` (default
+    7): overall, per user, per day and the costliest calls. ``?user=<id>``
+    narrows everything to one user (staff only).
+    """
+
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        try:
+            days = int(request.query_params.get("days", 7))
+            user_id = request.query_params.get("user")
+            user_id = int(user_id) if user_id else None
+        except ValueError:
+            return Response(
+                {"error": "days and user must be integers"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        since = timezone.now() - datetime.timedelta(days=max(days, 1))
+        calls = AICall.objects.filter(created_at__gte=since)
+        if user_id is not None:
+            calls = calls.filter(user_id=user_id)
+        return Response(
+            {
+                "since": since,
+                "global": usage_summary(calls),
+                "by_user": usage_by_user(calls),
+                "by_day": usage_by_day(calls),
+                "costliest_calls": costliest_calls(calls),
+            }
+        )
+
+
+def _item_units(volume_unit, weight_unit, item):
+    """``(from_unit, to_unit)`` to merge into ``item``, or None for counts."""
+    measurement_type = get_measurement_type(volume_unit, weight_unit)
+    if measurement_type == "volume":
+        return volume_unit, item.volume_unit
+    if measurement_type == "weight":
+        return weight_unit, item.weight_unit
+    return None
+
+
+def _convert_to_item_unit(quantity, volume_unit, weight_unit, item):
+    """Express ``quantity`` in ``item``'s unit; ValueError if incompatible."""
+    units = _item_units(volume_unit, weight_unit, item)
+    if units is None:
+        return quantity
+    return convert_quantity(quantity, *units)
+
+
+def _can_merge(volume_unit, weight_unit, item):
+    units = _item_units(volume_unit, weight_unit, item)
+    return units is None or can_convert(*units)
+
+
+def _separate_item_name(name, volume_unit, weight_unit):
+    """
+    Name for an item kept apart from its namesake because their units can't
+    be merged, e.g. "Saffron (pinch)".
+    """
+    return f"{name} ({volume_unit or weight_unit})"[:100]
+
+
+# Attempts before giving up when concurrent writers keep winning the race
+GROCERY_UPSERT_ATTEMPTS = 5
+
+
+class GroceryListConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "The grocery list changed while saving. Please try again."
+    default_code = "grocery_list_conflict"
 
 
-# Unit conversion helpers for grocery list merging
-VOLUME_TO_ML = {
-    "tsp": Decimal("4.92892"),
-    "tbsp": Decimal("14.7868"),
-    "fl_oz": Decimal("29.5735"),
-    "cup": Decimal("236.588"),
-    "pt": Decimal("473.176"),
-    "qt": Decimal("946.353"),
-    "gal": Decimal("3785.41"),
-    "ml": Decimal("1"),
-    "l": Decimal("1000"),
-}
-
-WEIGHT_TO_GRAMS = {
-    "g": Decimal("1"),
-    "kg": Decimal("1000"),
-    "oz": Decimal("28.3495"),
-    "lb": Decimal("453.592"),
-}
-
-
-def convert_quantity(value, from_unit, to_unit, conversion_map):
-    """Convert between units of the same measurement type."""
-    if from_unit not in conversion_map or to_unit not in conversion_map:
-        raise ValueError("Unsupported unit conversion.")
-
-    value_decimal = Decimal(value)
-    base_value = value_decimal * conversion_map[from_unit]
-    return base_value / conversion_map[to_unit]
-
-
-def get_measurement_type(volume_unit, weight_unit):
-    if volume_unit:
-        return "volume"
-    if weight_unit:
-        return "weight"
-    return "count"
+def upsert_grocery_item(user, name, quantity, volume_unit, weight_unit):
+    """
+    Add ``quantity`` to the user's item with the same name and measurement
+    type, or create it. Safe under concurrency without long locks: the unique
+    (user, normalized_name, measurement_type) constraint arbitrates racing
+    inserts, and merges are single ``quantity = quantity + x`` UPDATEs that
+    only apply if the item's unit is still the one we converted into.
+    Returns ``(item, created)``; raises ValueError for incompatible units
+    and GroceryListConflict if concurrent writers keep winning.
+    """
+    normalized_name = normalize_name(name)
+    measurement_type = get_measurement_type(volume_unit, weight_unit)
+
+    for _ in range(GROCERY_UPSERT_ATTEMPTS):
+        item = GroceryListItem.objects.filter(
+            user=user,
+            normalized_name=normalized_name,
+            measurement_type=measurement_type,
+        ).first()
+
+        if item is None:
+            try:
+                with transaction.atomic():
+                    item = GroceryListItem.objects.create(
+                        user=user,
+                        name=name,
+                        quantity=quantity,
+                        volume_unit=volume_unit,
+                        weight_unit=weight_unit,
+                    )
+                return item, True
+            except IntegrityError:
+                # Another request created it first; merge into theirs
+                continue
+
+        converted = _convert_to_item_unit(quantity, volume_unit, weight_unit, item)
+        # The increment and the version bump land (or roll back) together
+        with transaction.atomic():
+            merged = GroceryListItem.objects.filter(
+                pk=item.pk,
+                volume_unit=item.volume_unit,
+                weight_unit=item.weight_unit,
+            ).update(
+                quantity=F("quantity") + converted,
+                checked=False,
+                updated_at=timezone.now(),
+            )
+            if merged:
+                # QuerySet.update() skips model signals
+                CollectionVersion.bump(user.id, CollectionVersion.GROCERY_LIST)
+                item.refresh_from_db(fields=["quantity", "checked", "updated_at"])
+        if merged:
+            publish_grocery_event(
+                user.id, "updated", GroceryListItemSerializer(item).data
+            )
+            return item, False
+
+    raise GroceryListConflict()
+
+
+def merge_into_grocery_list(user, entries):
+    """
+    Merge ``(name, quantity, volume_unit, weight_unit)`` entries into the
+    user's grocery list as one set-based operation.
+
+    Entries merge into the item with the same normalized name and measurement
+    type, converting into the item's unit; anything else becomes a new item.
+    Entries whose unit can't be converted into the item's merge into (or
+    create) a separate item named after their unit instead.
+    Candidates are loaded (and row-locked) with one query and written back
+    with one bulk_update and one bulk_create. Returns
+    ``(added_count, updated_count)``; raises ValueError if even the separate
+    item's unit can't be converted into, and GroceryListConflict if concurrent
+    writers keep winning.
+    """
+    entries = [entry for entry in entries if normalize_name(entry[0])]
+    if not entries:
+        return 0, 0
+
+    for _ in range(GROCERY_UPSERT_ATTEMPTS):
+        try:
+            return _merge_into_grocery_list_once(user, entries)
+        except IntegrityError:
+            # A concurrent request created one of our new items; the retry
+            # sees it as an existing row and merges into it
+            continue
+    raise GroceryListConflict()
+
+
+def _merge_into_grocery_list_once(user, entries):
+    with transaction.atomic():
+        # Row locks keep concurrent merges from losing each other's increments
+        names = set()
+        for name, _, volume_unit, weight_unit in entries:
+            names.add(normalize_name(name))
+            if volume_unit or weight_unit:
+                names.add(
+                    normalize_name(_separate_item_name(name, volume_unit, weight_unit))
+                )
+        candidates = (
+            GroceryListItem.objects.select_for_update()
+            .filter(user=user, normalized_name__in=names)
+            .order_by("id")
+        )
+        items_by_key = {
+            (item.normalized_name, item.measurement_type): item for item in candidates
+        }
+
+        to_update = {}
+        to_create = []
+        added_count = 0
+        updated_count = 0
+        # (item, quantity) merges, plus the unit pairs to convert between
+        merges = []
+        conversions = []
+
+        for name, quantity, volume_unit, weight_unit in entries:
+            measurement_type = get_measurement_type(volume_unit, weight_unit)
+            key = (normalize_name(name), measurement_type)
+            item = items_by_key.get(key)
+            if item is not None and not _can_merge(volume_unit, weight_unit, item):
+                name = _separate_item_name(name, volume_unit, weight_unit)
+                key = (normalize_name(name), measurement_type)
+                item = items_by_key.get(key)
+                if item is not None and not _can_merge(volume_unit, weight_unit, item):
+                    raise ValueError("Unsupported unit conversion.")
+
+            if item is None:
+                item = GroceryListItem(
+                    user=user,
+                    name=name,
+                    normalized_name=normalize_name(name),
+                    measurement_type=measurement_type,
+                    quantity=quantity,
+                    volume_unit=volume_unit,
+                    weight_unit=weight_unit,
+                )
+                items_by_key[key] = item
+                to_create.append(item)
+                added_count += 1
+                continue
+
+            units = _item_units(volume_unit, weight_unit, item)
+            if units is not None:
+                conversions.append((len(merges), quantity, *units))
+            merges.append((item, quantity))
+            if item.pk is not None:
+                to_update[item.pk] = item
+            updated_count += 1
+
+        if conversions:
+            positions, quantities, from_units, to_units = zip(*conversions)
+            converted = convert_many(quantities, from_units, to_units)
+            for position, quantity in zip(positions, converted):
+                merges[position] = (merges[position][0], quantity)
+
+        now = timezone.now()
+        for item, quantity in merges:
+            item.quantity += quantity
+            item.checked = False  # Uncheck when adding more
+            item.updated_at = now
+
+        if to_update:
+            GroceryListItem.objects.bulk_update(
+                to_update.values(), ["quantity", "checked", "updated_at"]
+            )
+        if to_create:
+            GroceryListItem.objects.bulk_create(to_create)
+        # Bulk writes skip model signals
+        CollectionVersion.bump(user.id, CollectionVersion.GROCERY_LIST)
+        for event_type, items in (
+            ("updated", to_update.values()),
+            ("created", to_create),
+        ):
+            for item in items:
+                publish_grocery_event(
+                    user.id, event_type, GroceryListItemSerializer(item).data
+                )
+
+    return added_count, updated_count
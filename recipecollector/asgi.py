@@ -2,6 +2,8 @@
 ASGI config for recipecollector project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+start.sh serves it with uvicorn, so long-lived streams such as
+/grocery-list/events/ wait on the event loop instead of holding a worker.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
@@ -14,3 +16,11 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'recipecollector.settings')
 
 application = get_asgi_application()
+
+# Refuse a grocery events broker or throttle cache that can't reach every
+# worker at startup rather than on the first request
+from main_app.events import get_broker  # noqa: E402
+from main_app.throttling import check_shared_throttle_cache  # noqa: E402
+
+get_broker()
+check_shared_throttle_cache()
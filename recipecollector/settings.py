@@ -21,6 +21,66 @@ from dotenv import load_dotenv
 load_dotenv(override=True)
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
+# Shared OpenAI client (main_app/openai_client.py): connection pool, timeouts
+# in seconds, and retry policy (exponential backoff with jitter)
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", 20))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", 10))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", 60))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", 5))
+OPENAI_READ_TIMEOUT = float(os.getenv("OPENAI_READ_TIMEOUT", 60))
+OPENAI_WRITE_TIMEOUT = float(os.getenv("OPENAI_WRITE_TIMEOUT", 10))
+OPENAI_POOL_TIMEOUT = float(os.getenv("OPENAI_POOL_TIMEOUT", 5))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", 2))
+OPENAI_RETRY_INITIAL_DELAY = float(os.getenv("OPENAI_RETRY_INITIAL_DELAY", 0.5))
+OPENAI_RETRY_MAX_DELAY = float(os.getenv("OPENAI_RETRY_MAX_DELAY", 8))
+
+# Backend for recipe completions (main_app/llm_backends.py). Set to
+# "main_app.llm_backends.FakeLLMBackend" to replay LLM_FAKE_RECORDINGS (a JSON
+# array of completions; a sample recipe if unset) offline with simulated
+# latency, e.g. for `python manage.py bench_generate`
+LLM_BACKEND = os.getenv("LLM_BACKEND", "main_app.llm_backends.OpenAIBackend")
+LLM_FAKE_RECORDINGS = os.getenv("LLM_FAKE_RECORDINGS", "")
+LLM_FAKE_FIRST_TOKEN_SECONDS = float(os.getenv("LLM_FAKE_FIRST_TOKEN_SECONDS", 0.5))
+LLM_FAKE_CHARS_PER_SECOND = float(os.getenv("LLM_FAKE_CHARS_PER_SECOND", 400))
+LLM_FAKE_CHUNK_CHARS = int(os.getenv("LLM_FAKE_CHUNK_CHARS", 16))
+LLM_FAKE_JITTER = float(os.getenv("LLM_FAKE_JITTER", 0.2))
+
+# Record tokens and latency of every AI call (AICall rows, /ai-usage/)
+AI_USAGE_ENABLED = os.getenv("AI_USAGE_ENABLED", "True") == "True"
+
+# Background recipe generation jobs (/recipes/generate/jobs/). "thread" runs
+# them on a bounded pool inside each web process; "worker" leaves them queued
+# for `python manage.py run_generation_jobs` processes.
+GENERATION_JOBS_EXECUTOR = os.getenv("GENERATION_JOBS_EXECUTOR", "thread")
+GENERATION_JOBS_THREADS = int(os.getenv("GENERATION_JOBS_THREADS", 4))
+GENERATION_JOBS_PER_USER = int(os.getenv("GENERATION_JOBS_PER_USER", 2))
+GENERATION_JOBS_TIMEOUT_SECONDS = int(os.getenv("GENERATION_JOBS_TIMEOUT_SECONDS", 300))
+GENERATION_JOBS_CANCEL_CHECK_SECONDS = float(
+    os.getenv("GENERATION_JOBS_CANCEL_CHECK_SECONDS", 1)
+)
+
+# Batch generation: variants per prompt (sent as the API's n), prompts per
+# meal-plan request, and how many of those prompts run at once
+GENERATION_MAX_VARIANTS = int(os.getenv("GENERATION_MAX_VARIANTS", 5))
+GENERATION_MAX_PROMPTS = int(os.getenv("GENERATION_MAX_PROMPTS", 7))
+GENERATION_BATCH_CONCURRENCY = int(os.getenv("GENERATION_BATCH_CONCURRENCY", 4))
+
+# Local retrieval before generation (main_app/recipe_search.py). Saved recipes
+# scoring at least RECIPE_MATCH_THRESHOLD (0-1) against the prompt are returned
+# "alongside" the model's recipe, "instead" of calling the model, or not at all
+# ("off"). "instead" changes the response shape, so clients opt in per request.
+# Recipes of RECIPE_MATCH_SHARED_USERNAMES (comma separated) are searched for
+# every user. At most RECIPE_MATCH_MAX_CANDIDATES recipes are scored per prompt.
+RECIPE_MATCH_MODE = os.getenv("RECIPE_MATCH_MODE", "alongside")
+RECIPE_MATCH_THRESHOLD = float(os.getenv("RECIPE_MATCH_THRESHOLD", 0.8))
+RECIPE_MATCH_LIMIT = int(os.getenv("RECIPE_MATCH_LIMIT", 3))
+RECIPE_MATCH_MAX_CANDIDATES = int(os.getenv("RECIPE_MATCH_MAX_CANDIDATES", 200))
+RECIPE_MATCH_SHARED_USERNAMES = [
+    name.strip()
+    for name in os.getenv("RECIPE_MATCH_SHARED_USERNAMES", "").split(",")
+    if name.strip()
+]
+
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -69,8 +129,68 @@ REST_FRAMEWORK = {
         "rest_framework_simplejwt.authentication.JWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": ("rest_framework.permissions.AllowAny",),
+    # Proxies in front of the app (1 on Railway), so throttles see client IPs.
+    # 0 trusts only REMOTE_ADDR and ignores a client-supplied X-Forwarded-For.
+    "NUM_PROXIES": int(os.getenv("NUM_PROXIES", 0)),
+}
+
+
+def _bucket(name, burst, per_minute):
+    return (
+        int(os.getenv(f"THROTTLE_{name}_BURST", burst)),
+        float(os.getenv(f"THROTTLE_{name}_PER_MINUTE", per_minute)),
+    )
+
+
+# Token-bucket throttles (main_app/throttling.py): scope -> (burst, tokens
+# refilled per minute), overridable with THROTTLE_<SCOPE>_BURST/_PER_MINUTE.
+# The buckets and the LLM slots below live in THROTTLE_CACHE_ALIAS, which
+# must be shared by every worker (see the "throttle" cache).
+THROTTLE_CACHE_ALIAS = os.getenv("THROTTLE_CACHE_ALIAS", "throttle")
+THROTTLE_BUCKETS = {
+    "generate_user": _bucket("GENERATE_USER", 5, 10),
+    "generate_ip": _bucket("GENERATE_IP", 10, 30),
+    "sign_in_ip": _bucket("SIGN_IN_IP", 10, 10),
+    "sign_in_username": _bucket("SIGN_IN_USERNAME", 5, 3),
+    "sign_in_account": _bucket("SIGN_IN_ACCOUNT", 30, 20),
+    "sign_up_ip": _bucket("SIGN_UP_IP", 5, 2),
+    "password_reset_ip": _bucket("PASSWORD_RESET_IP", 5, 2),
+    "password_reset_email": _bucket("PASSWORD_RESET_EMAIL", 3, 1),
 }
 
+# In-flight LLM completions across all workers; requests finding every slot
+# taken get 429 at once, background jobs wait for one. A slot held longer
+# than LLM_SLOT_LEASE_SECONDS (e.g. by a worker that died) is freed.
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 8))
+LLM_SLOT_LEASE_SECONDS = int(os.getenv("LLM_SLOT_LEASE_SECONDS", 300))
+LLM_RETRY_AFTER_SECONDS = int(os.getenv("LLM_RETRY_AFTER_SECONDS", 10))
+
+# Opt-in cursor pagination for list endpoints (?cursor= / ?page_size=)
+API_PAGE_SIZE = int(os.getenv("API_PAGE_SIZE", 50))
+API_MAX_PAGE_SIZE = int(os.getenv("API_MAX_PAGE_SIZE", 200))
+
+# Grocery list delta sync (?since=<cursor>)
+GROCERY_SYNC_OVERLAP_SECONDS = int(os.getenv("GROCERY_SYNC_OVERLAP_SECONDS", 5))
+GROCERY_TOMBSTONE_RETENTION_DAYS = int(os.getenv("GROCERY_TOMBSTONE_RETENTION_DAYS", 30))
+
+# Worker processes serving the app; start.sh passes it to uvicorn
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", 1))
+
+# Grocery list server push (/grocery-list/events/). The in-process broker only
+# reaches streams served by the same process, so several workers default to
+# RedisEventBroker and refuse the in-process one.
+GROCERY_EVENTS_BROKER = os.getenv(
+    "GROCERY_EVENTS_BROKER",
+    "main_app.events.RedisEventBroker"
+    if WEB_CONCURRENCY > 1
+    else "main_app.events.InProcessEventBroker",
+)
+GROCERY_EVENTS_REDIS_URL = os.getenv("GROCERY_EVENTS_REDIS_URL", "redis://localhost:6379/0")
+GROCERY_EVENTS_QUEUE_SIZE = int(os.getenv("GROCERY_EVENTS_QUEUE_SIZE", 100))
+GROCERY_EVENTS_HEARTBEAT_SECONDS = int(os.getenv("GROCERY_EVENTS_HEARTBEAT_SECONDS", 15))
+# How long a ticket from /grocery-list/events/ticket/ can open a stream
+GROCERY_EVENTS_TICKET_SECONDS = int(os.getenv("GROCERY_EVENTS_TICKET_SECONDS", 60))
+
 
 MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",
@@ -127,6 +247,60 @@ else:
     }
 
 
+# Caches
+# The local-memory cache is per process; point RESPONSE_CACHE_BACKEND and
+# RESPONSE_CACHE_LOCATION at a shared cache (e.g. Redis) in production so all
+# workers share rendered recipe payloads. The throttle cache must be shared
+# when several workers run, so it defaults to Redis then.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "throttle": {
+        "BACKEND": os.getenv(
+            "THROTTLE_CACHE_BACKEND",
+            "django.core.cache.backends.redis.RedisCache"
+            if WEB_CONCURRENCY > 1
+            else "django.core.cache.backends.locmem.LocMemCache",
+        ),
+        "LOCATION": os.getenv(
+            "THROTTLE_CACHE_LOCATION",
+            "redis://localhost:6379/1" if WEB_CONCURRENCY > 1 else "throttle",
+        ),
+    },
+    "responses": {
+        "BACKEND": os.getenv(
+            "RESPONSE_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.getenv("RESPONSE_CACHE_LOCATION", "recipe-responses"),
+        "OPTIONS": {
+            "MAX_ENTRIES": int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 1000)),
+        },
+    },
+    "ai": {
+        "BACKEND": os.getenv(
+            "AI_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.getenv("AI_CACHE_LOCATION", "ai-recipes"),
+        "TIMEOUT": int(os.getenv("AI_CACHE_TIMEOUT", 60 * 60 * 24)),
+        "OPTIONS": {
+            "MAX_ENTRIES": int(os.getenv("AI_CACHE_MAX_ENTRIES", 1000)),
+        },
+    },
+}
+
+RESPONSE_CACHE_ALIAS = "responses"
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "True") == "True"
+RESPONSE_CACHE_TIMEOUT = int(os.getenv("RESPONSE_CACHE_TIMEOUT", 300))
+
+# Generated recipe cache (main_app/ai_cache.py). Repeats of a canonical request
+# are served its first recipe. Raise AI_CACHE_VARIANTS to opt into rotation:
+# that many distinct recipes are generated first, then served at random.
+AI_CACHE_ALIAS = "ai"
+AI_CACHE_ENABLED = os.getenv("AI_CACHE_ENABLED", "True") == "True"
+AI_CACHE_VARIANTS = int(os.getenv("AI_CACHE_VARIANTS", 1))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -199,6 +373,14 @@ AWS_S3_SIGNATURE_VERSION = "s3v4"
 AWS_S3_FILE_OVERWRITE = False
 AWS_DEFAULT_ACL = None
 AWS_QUERYSTRING_AUTH = True
+AWS_QUERYSTRING_EXPIRE = int(os.getenv("AWS_QUERYSTRING_EXPIRE", 3600))
+
+# Presigned URL cache: URLs are reused until SAFETY_MARGIN seconds before they
+# expire. Point SIGNED_URL_CACHE_ALIAS at a shared cache (e.g. Redis) to reuse
+# signatures across server workers.
+SIGNED_URL_CACHE_MAX_ENTRIES = int(os.getenv("SIGNED_URL_CACHE_MAX_ENTRIES", 10000))
+SIGNED_URL_CACHE_SAFETY_MARGIN = int(os.getenv("SIGNED_URL_CACHE_SAFETY_MARGIN", 300))
+SIGNED_URL_CACHE_ALIAS = os.getenv("SIGNED_URL_CACHE_ALIAS") or None
 
 # Static and Media Files
 AWS_LOCATION = "media"
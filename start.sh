@@ -2,5 +2,5 @@
 set -e
 python manage.py migrate --noinput
 python manage.py collectstatic --noinput
-gunicorn recipecollector.wsgi:application --bind 0.0.0.0:$PORT
+uvicorn recipecollector.asgi:application --host 0.0.0.0 --port $PORT --workers ${WEB_CONCURRENCY:-1}
 